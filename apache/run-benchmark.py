@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+'''
+Benchmark profiles for Apache, natively, under Graphene and under
+Graphene-SGX.
+
+The driver generates an Apache configuration for every server configuration
+in install/conf/bench, which includes conf/httpd-graphene.conf and sets the
+MPM, the number of server processes and ``EnableSendfile``, and runs the
+profiles of webbench.py against it:
+
+- ``files``: static files from 1K to 10M with sendfile on and off;
+- ``tls``: full TLS handshakes against resumed sessions, on the HTTPS virtual
+  host of conf/extra/httpd-ssl-graphene.conf (port 8443) with the certificate
+  created from ssl/ca_config.conf;
+- ``workers``: a sweep over the MPMs (``--mpm``) and the number of server
+  processes (``--workers``); the threaded MPMs run ``--threads-per-child``
+  threads in every process.
+
+The session cache of mod_ssl is disabled in httpd-ssl-graphene.conf (it needs
+shared memory), so sessions are resumed with session tickets.
+'''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+import webbench  # pylint: disable=wrong-import-position
+
+MANIFEST = 'httpd.manifest'
+INSTALL_DIR = 'install'
+# relative to INSTALL_DIR, the ServerRoot of Apache
+CONF_DIR = 'conf/bench'
+PID_FILE = 'logs/httpd-bench.pid'
+MPMS = ('prefork', 'worker', 'event')
+
+CONFIG = '''\
+# Generated by run-benchmark.py
+LoadModule mpm_{mpm}_module modules/mod_mpm_{mpm}.so
+Include conf/httpd-graphene.conf
+Listen {host}:{port}
+ServerName {host}
+PidFile {pid_file}
+EnableSendfile {sendfile}
+{mpm_config}'''
+
+PREFORK_CONFIG = '''\
+StartServers {workers}
+MinSpareServers 1
+MaxSpareServers {workers}
+ServerLimit {workers}
+MaxRequestWorkers {workers}
+MaxConnectionsPerChild 0
+'''
+
+THREADED_CONFIG = '''\
+StartServers {workers}
+ServerLimit {workers}
+ThreadLimit {threads}
+ThreadsPerChild {threads}
+MinSpareThreads {threads}
+MaxSpareThreads {total}
+MaxRequestWorkers {total}
+MaxConnectionsPerChild 0
+'''
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+webbench.add_arguments(argparser, port=8001)
+argparser.add_argument('--mpm', metavar='NAME,...', default='prefork,worker',
+    help='comma-separated MPMs: prefork, worker, event; the first one is used '
+        'by the files and tls profiles (default: %(default)s)')
+argparser.add_argument('--workers', '-w', metavar='N,...', default='1,2,4',
+    help='comma-separated numbers of server processes; the first one is used '
+        'by the files and tls profiles (default: %(default)s)')
+argparser.add_argument('--threads-per-child', metavar='N', type=int,
+    default=25,
+    help='threads per process of the worker and event MPMs (at most '
+        'sgx.thread_num - 2 under Graphene-SGX, default: %(default)s)')
+argparser.add_argument('--httpd', metavar='PATH',
+    default=os.path.join(INSTALL_DIR, 'bin', 'httpd'),
+    help='httpd executable for native runs (default: %(default)s)')
+
+
+class ApacheServer:
+    '''Apache for webbench.run().'''
+    name = 'apache'
+    docroot = os.path.join(INSTALL_DIR, 'htdocs')
+    # see conf/extra/httpd-ssl-graphene.conf
+    tls_port = 8443
+
+    def __init__(self, args):
+        self.args = args
+        self.variants = []
+        for mpm in args.mpm.split(','):
+            if mpm not in MPMS:
+                argparser.error('unknown MPM: {}'.format(mpm))
+            threads = 1 if mpm == 'prefork' else args.threads_per_child
+            for workers in benchlib.parse_list(args.workers):
+                self.variants.append({'variant': '{}:{}'.format(mpm, workers),
+                    'mpm': mpm, 'workers': workers, 'threads': threads})
+
+    def command(self, mode, variant, sendfile):
+        template = (PREFORK_CONFIG if variant['mpm'] == 'prefork'
+            else THREADED_CONFIG)
+        conf = os.path.join(CONF_DIR, 'httpd-{}-{}-sendfile-{}.conf'.format(
+            variant['mpm'], variant['workers'], sendfile))
+        os.makedirs(os.path.join(INSTALL_DIR, CONF_DIR), exist_ok=True)
+        with open(os.path.join(INSTALL_DIR, conf), 'w') as file:
+            file.write(CONFIG.format(mpm=variant['mpm'], host=self.args.host,
+                port=self.args.port, pid_file=PID_FILE,
+                sendfile=sendfile.capitalize(),
+                mpm_config=template.format(workers=variant['workers'],
+                    threads=variant['threads'],
+                    total=variant['workers'] * variant['threads'])))
+        # a stale PID file from a killed server makes httpd complain
+        try:
+            os.unlink(os.path.join(INSTALL_DIR, PID_FILE))
+        except FileNotFoundError:
+            pass
+        argv, env = benchlib.command_for(mode, [self.args.httpd,
+            '-D', 'FOREGROUND', '-f', conf], MANIFEST, loader=self.args.loader)
+        return argv, env, None
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    return webbench.run(args, ApacheServer(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+'''
+Process-creation and file-system stress benchmark based on
+scripts/bash_test.sh, natively, under Graphene and under Graphene-SGX.
+
+Every iteration of scripts/bash_bench.sh spawns five processes (cp, cat, ls,
+rm, date) and copies a file of a given size. The driver runs the script in one
+or more concurrent shells and reports the per-iteration latency distribution,
+the total number of spawned processes per second and how this scales with the
+number of concurrent instances.
+
+Every shell runs in its own session, pinned to the server CPUs
+(``BENCH_SERVER_CPUS``, see noisecontrol.py); shells which are still running
+after ``--timeout`` are killed together with their children and counted as
+failed.
+'''
+
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+MANIFEST = 'bash.manifest'
+SCRIPTS_DIR = 'scripts'
+WORK_DIR = 'testdir'
+SPAWNS_PER_ITERATION = 5
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--iterations', '-n', metavar='N', type=int,
+    default=300,
+    help='iterations per shell (default: %(default)s)')
+argparser.add_argument('--file-size', '-s', metavar='SIZE,...',
+    default='somefile',
+    help='comma-separated sizes of the copied file (K/M suffixes allowed), '
+        'or "somefile" for scripts/somefile (default: %(default)s)')
+argparser.add_argument('--instances', '-j', metavar='N,...', default='1,2,4',
+    help='comma-separated numbers of concurrent shells (default: '
+        '%(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600,
+    help='timeout for all shells of a run (default: %(default)s)')
+
+
+def prepare_source(size):
+    '''Return the path of the source file (relative to scripts/).'''
+    if size == 'somefile':
+        return 'somefile'
+    nbytes = benchlib.parse_size(size)
+    path = os.path.join(WORK_DIR, 'src-{}'.format(nbytes))
+    host_path = os.path.join(SCRIPTS_DIR, path)
+    if not (os.path.exists(host_path)
+            and os.path.getsize(host_path) == nbytes):
+        with open(host_path, 'wb') as file:
+            file.write(os.urandom(nbytes))
+    return path
+
+
+def parse_timestamps(output):
+    '''Return the timestamps printed by bash_bench.sh.'''
+    timestamps = []
+    for line in output.splitlines():
+        tokens = line.split()
+        if tokens and tokens[0] in ('start', 'iteration'):
+            timestamps.append(float(tokens[-1]))
+    return timestamps
+
+
+def kill_instance(proc):
+    '''Kill a shell and all processes of its session.'''
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_instances(args, mode, source, instances):
+    procs = []
+    latencies = []
+    failed = 0
+    timed_out = 0
+    start = time.perf_counter()
+    try:
+        for i in range(instances):
+            work_dir = os.path.join(WORK_DIR, 'bench-{}'.format(i))
+            os.makedirs(os.path.join(SCRIPTS_DIR, work_dir), exist_ok=True)
+            command = 'cd {} && bash bash_bench.sh {} {} {}'.format(
+                SCRIPTS_DIR, args.iterations, source, work_dir)
+            argv, env = benchlib.command_for(mode, ['bash', '-c', command],
+                MANIFEST, loader=args.loader)
+            # pylint: disable=subprocess-popen-preexec-fn
+            procs.append(subprocess.Popen(argv, env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                preexec_fn=benchlib.child_setup(benchlib.get_cpus('server'),
+                    new_session=True)))
+
+        deadline = start + args.timeout
+        for proc in procs:
+            try:
+                stdout, _ = proc.communicate(
+                    timeout=max(0, deadline - time.perf_counter()))
+            except subprocess.TimeoutExpired:
+                kill_instance(proc)
+                stdout, _ = proc.communicate()
+                timed_out += 1
+            timestamps = parse_timestamps(stdout.decode(errors='replace'))
+            if proc.returncode != 0 or len(timestamps) != args.iterations + 1:
+                failed += 1
+            latencies.extend(b - a for a, b in zip(timestamps, timestamps[1:]))
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                kill_instance(proc)
+                proc.wait()
+    wall_time = time.perf_counter() - start
+    if timed_out:
+        print('{} of {} shells timed out after {} s'.format(timed_out,
+            instances, args.timeout), file=sys.stderr)
+
+    iterations = len(latencies)
+    return {
+        'mode': mode,
+        'instances': instances,
+        'iterations': iterations,
+        'failed_instances': failed,
+        'timed_out_instances': timed_out,
+        'wall_time': wall_time,
+        'spawns_per_sec': iterations * SPAWNS_PER_ITERATION / wall_time,
+        'iterations_per_sec': iterations / wall_time,
+        'latency_ms': benchlib.summarize([i * 1e3 for i in latencies]),
+    }
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    os.makedirs(os.path.join(SCRIPTS_DIR, WORK_DIR), exist_ok=True)
+
+    results = []
+    for size in args.file_size.split(','):
+        source = prepare_source(size)
+        for mode in benchlib.get_modes(args):
+            for instances in benchlib.parse_list(args.instances):
+                print('{} file={} instances={}'.format(mode, size, instances),
+                    file=sys.stderr)
+                result = run_instances(args, mode, source, instances)
+                result['file_size'] = size
+                results.append(result)
+
+    single = {(result['mode'], result['file_size']): result
+        for result in results if result['instances'] == 1}
+    native = {(result['file_size'], result['instances']): result
+        for result in results if result['mode'] == 'native'}
+    rows = []
+    for result in results:
+        row = dict(result, p50=result['latency_ms'].get('p50'),
+            p99=result['latency_ms'].get('p99'))
+        ref = single.get((result['mode'], result['file_size']))
+        if ref:
+            # 1.0 means perfect scaling with the number of instances
+            row['scaling'] = result['spawns_per_sec'] / (
+                ref['spawns_per_sec'] * result['instances'])
+        ref = native.get((result['file_size'], result['instances']))
+        if ref:
+            row['slowdown'] = ref['spawns_per_sec'] / result['spawns_per_sec']
+        rows.append(row)
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('file_size', 'file'),
+        ('instances', 'shells'),
+        ('spawns_per_sec', 'spawns/s', '.1f'),
+        ('p50', 'p50 [ms]', '.2f'),
+        ('p99', 'p99 [ms]', '.2f'),
+        ('scaling', 'scaling', '.2f'),
+        ('slowdown', 'x native', '.2f'),
+        ('failed_instances', 'failed'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'bash',
+        'host': benchlib.host_info(),
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+
+    shutil.rmtree(os.path.join(SCRIPTS_DIR, WORK_DIR), ignore_errors=True)
+    return min(sum(result['failed_instances'] for result in results), 255)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,23 @@
+#!/usr/bin/env bash
+
+# Parametrized variant of bash_test.sh, used by ../run-benchmark.py:
+#
+#   bash bash_bench.sh <times> <source file> <work directory>
+#
+# Every iteration spawns five processes (cp, cat, ls, rm, date) and ends with
+# a timestamp, so that the driver can compute per-iteration latencies.
+
+times=$1
+[ $times -gt 0 2> /dev/null ] || times=300
+src=${2:-somefile}
+dir=${3:-testdir}
+
+date +"start %s.%N"
+for (( c=1; c<=$times; c++ ))
+do
+	cp "$src" "$dir"/somefile
+	cat "$src" > "$dir"/createdfile
+	ls "$dir"/ > /dev/null
+	rm -rf "$dir"/somefile "$dir"/createdfile
+	date +"iteration $c %s.%N"
+done
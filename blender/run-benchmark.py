@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+'''
+Render benchmark for Blender, natively, under Graphene and under Graphene-SGX.
+
+Every scene in data/scenes is rendered for every Blender thread count (``-t``)
+and frame range. Render time per frame is parsed from Blender's output. When the
+thread count is low, several scenes are rendered concurrently so that all CPU
+cores are used (see ``--jobs``).
+
+Rendered frames are compared with reference images in data/reference (create
+them with ``--update-references``, normally in native mode) after all renders
+of a mode are done, so that the comparison does not take CPU time from the
+renders being timed. A frame passes if the fraction of pixels differing by more
+than ``--pixel-threshold`` in any channel is at most ``--tolerance``; frames
+without a reference image are reported as unchecked.
+
+Run ``make`` (and ``make SGX=1``) first; this script uses the same directories
+as the Makefile (blender_dir, data, run_dir).
+'''
+
+import argparse
+import concurrent.futures
+import os
+import re
+import shutil
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BLENDER_DIR = os.path.join(HERE, 'blender_dir')
+DATA_DIR = os.path.join(HERE, 'data')
+RUN_DIR = os.path.join(HERE, 'run_dir')
+REFERENCE_DIR = os.path.join(DATA_DIR, 'reference')
+
+# DATA_DIR is mounted as /data in blender.manifest.template
+GRAPHENE_DATA_DIR = '/data'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--threads', '-t', metavar='N,...', default='1,2,4',
+    help='comma-separated Blender thread counts (default: %(default)s)')
+argparser.add_argument('--frames', '-f', metavar='START-END,...',
+    default='1-1',
+    help='comma-separated frame ranges (default: %(default)s)')
+argparser.add_argument('--scene', '-s', metavar='NAME', action='append',
+    help='render only this scene from data/scenes; may be given multiple '
+        'times (default: all)')
+argparser.add_argument('--jobs', '-j', metavar='N', type=int,
+    help='scenes rendered concurrently (default: number of CPUs divided by '
+        'the thread count)')
+argparser.add_argument('--tolerance', metavar='FRACTION', type=float,
+    default=0.001,
+    help='maximum fraction of differing pixels (default: %(default)s)')
+argparser.add_argument('--pixel-threshold', metavar='N', type=int, default=8,
+    help='maximum per-channel difference of a matching pixel '
+        '(default: %(default)s)')
+argparser.add_argument('--update-references', action='store_true',
+    help='store the rendered frames as reference images instead of '
+        'comparing them')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single render (default: 3600)')
+
+# Blender 2.8x prints this after every saved frame:
+#   Saved: '/data/images/simple_scene.blend-t4-0001.png'
+#    Time: 00:00.52 (Saving: 00:00.01)
+SAVED_RE = re.compile(r"^Saved: '(.*)'")
+TIME_RE = re.compile(r'^\s*Time: ([\d:.]+)')
+
+
+def parse_duration(value):
+    '''Parse Blender's ``[HH:]MM:SS.ss`` into seconds.'''
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_frame_times(output):
+    '''Return ``[(path, seconds)]`` for every saved frame.'''
+    frames = []
+    path = None
+    for line in output.splitlines():
+        match = SAVED_RE.match(line)
+        if match:
+            path = match.group(1)
+            continue
+        match = TIME_RE.match(line)
+        if match and path is not None:
+            frames.append((path, parse_duration(match.group(1))))
+            path = None
+    return frames
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def read_png(path):
+    '''Decode an 8-bit, non-interlaced greyscale/RGB/RGBA PNG.
+
+    This avoids a dependency on an imaging library; Blender writes 8-bit RGBA
+    PNGs by default.
+
+    Returns:
+        tuple: ``(width, height, channels, pixels)``, where *pixels* is a list
+        of rows (:py:class:`bytearray`)
+    '''
+    # pylint: disable=too-many-locals
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('{}: not a PNG file'.format(path))
+
+    pos = 8
+    idat = []
+    width = height = channels = None
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b'IHDR':
+            width, height, depth, color, _, _, interlace = struct.unpack(
+                '>IIBBBBB', chunk)
+            channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color)
+            if depth != 8 or channels is None or interlace:
+                raise ValueError('{}: unsupported PNG format'.format(path))
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+
+    raw = zlib.decompress(b''.join(idat))
+    stride = width * channels
+    rows = []
+    prev = bytearray(stride)
+    for y in range(height):
+        offset = y * (stride + 1)
+        kind = raw[offset]
+        row = bytearray(raw[offset + 1:offset + 1 + stride])
+        if kind == 1:
+            for i in range(channels, stride):
+                row[i] = (row[i] + row[i - channels]) & 0xff
+        elif kind == 2:
+            for i in range(stride):
+                row[i] = (row[i] + prev[i]) & 0xff
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xff
+        elif kind == 4:
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                upleft = prev[i - channels] if i >= channels else 0
+                row[i] = (row[i] + _paeth(left, prev[i], upleft)) & 0xff
+        rows.append(row)
+        prev = row
+    return width, height, channels, rows
+
+
+def compare_images(path, reference, pixel_threshold):
+    '''Return the fraction of pixels of *path* that differ from *reference*
+    by more than *pixel_threshold* in any channel.'''
+    width, height, channels, rows = read_png(path)
+    ref_width, ref_height, ref_channels, ref_rows = read_png(reference)
+    if (width, height, channels) != (ref_width, ref_height, ref_channels):
+        return 1.0
+    differing = 0
+    for row, ref_row in zip(rows, ref_rows):
+        for x in range(0, width * channels, channels):
+            if any(abs(row[x + c] - ref_row[x + c]) > pixel_threshold
+                    for c in range(channels)):
+                differing += 1
+    return differing / (width * height)
+
+
+def render(args, mode, scene, threads, start, end):
+    '''Render frames *start*..*end* of *scene* and return a result dict.'''
+    # pylint: disable=too-many-arguments,too-many-locals
+    prefix = '{}-{}-t{}-'.format(scene, mode, threads)
+    data_dir = DATA_DIR if mode == 'native' else GRAPHENE_DATA_DIR
+    blender_args = [
+        '-b', '{}/scenes/{}'.format(data_dir, scene),
+        '-t', str(threads),
+        '-F', 'PNG',
+        '-o', '{}/images/{}'.format(data_dir, prefix),
+        '-s', str(start), '-e', str(end), '-a']
+    argv, env = benchlib.command_for(mode,
+        [os.path.join(BLENDER_DIR, 'blender'), *blender_args],
+        'blender.manifest', loader=args.loader)
+
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        cwd=RUN_DIR, timeout=args.timeout)
+    result = {
+        'mode': mode,
+        'scene': scene,
+        'threads': threads,
+        'start': start,
+        'end': end,
+        'returncode': returncode,
+        'wall_time': elapsed,
+        'frames': [],
+    }
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        return result
+
+    for path, seconds in parse_frame_times(stdout):
+        name = os.path.basename(path)
+        result['frames'].append({
+            'image': os.path.join(DATA_DIR, 'images', name),
+            # the reference does not depend on mode and thread count
+            'reference': os.path.join(REFERENCE_DIR,
+                scene + name[len(prefix):]),
+            'render_time': seconds,
+        })
+
+    result['render_time'] = sum(frame['render_time']
+        for frame in result['frames'])
+    return result
+
+
+def check_frames(args, results):
+    '''Compare the frames of *results* with their reference images (or store
+    them as references). Frames without a reference get ``match = None``.'''
+    for result in results:
+        for frame in result['frames']:
+            if args.update_references:
+                os.makedirs(REFERENCE_DIR, exist_ok=True)
+                shutil.copyfile(frame['image'], frame['reference'])
+                frame['match'] = None
+            elif os.path.exists(frame['reference']):
+                frame['diff'] = compare_images(frame['image'],
+                    frame['reference'], args.pixel_threshold)
+                frame['match'] = frame['diff'] <= args.tolerance
+            else:
+                frame['match'] = None
+
+
+def parse_frames(value):
+    ranges = []
+    for item in value.split(','):
+        start, _, end = item.partition('-')
+        ranges.append((int(start), int(end or start)))
+    return ranges
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    scenes = args.scene or sorted(os.listdir(os.path.join(DATA_DIR, 'scenes')))
+    os.makedirs(os.path.join(DATA_DIR, 'images'), exist_ok=True)
+    cpus = len(os.sched_getaffinity(0))
+
+    results = []
+    for mode in benchlib.get_modes(args):
+        mode_results = []
+        for threads in benchlib.parse_list(args.threads):
+            jobs = args.jobs or max(1, cpus // threads)
+            print('{} threads={} jobs={}'.format(mode, threads, jobs),
+                file=sys.stderr)
+            with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+                futures = [pool.submit(render, args, mode, scene, threads,
+                    start, end) for start, end in parse_frames(args.frames)
+                    for scene in scenes]
+                for future in futures:
+                    result = future.result()
+                    result['jobs'] = jobs
+                    mode_results.append(result)
+        check_frames(args, mode_results)
+        results.extend(mode_results)
+
+    failed = 0
+    rows = []
+    for result in results:
+        diffs = [frame['diff'] for frame in result['frames']
+            if 'diff' in frame]
+        mismatches = sum(1 for frame in result['frames']
+            if frame['match'] is False)
+        unchecked = sum(1 for frame in result['frames']
+            if frame['match'] is None)
+        missing = result['end'] - result['start'] + 1 - len(result['frames'])
+        ok = result['returncode'] == 0 and not mismatches and not missing
+        failed += not ok
+        if not ok:
+            status = 'FAIL'
+        elif unchecked:
+            status = 'unchecked'
+        else:
+            status = 'ok'
+        rows.append(dict(result,
+            frames=len(result['frames']),
+            unchecked=unchecked,
+            max_diff=max(diffs) if diffs else None,
+            status=status))
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('scene', 'scene'),
+        ('threads', 'threads'),
+        ('jobs', 'jobs'),
+        ('frames', 'frames'),
+        ('unchecked', 'unchecked'),
+        ('render_time', 'render [s]', '.2f'),
+        ('wall_time', 'wall [s]', '.2f'),
+        ('max_diff', 'max diff', '.5f'),
+        ('status', 'status'),
+    ])
+
+    unchecked = sum(row['unchecked'] for row in rows)
+    if unchecked and not args.update_references:
+        print('{} frame(s) without a reference image were not checked; create '
+            'references with --update-references'.format(unchecked),
+            file=sys.stderr)
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'blender',
+        'host': benchlib.host_info(),
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return min(failed, 255)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+// Cap'n Proto serialization benchmark.
+//
+// Usage: capnpbench <transport> <messages> <items> <payload-size> [<file>]
+//
+// Builds <messages> messages, each a Batch (see capnpbench.capnp) with <items>
+// Items carrying <payload-size> bytes of payload, serializes them and reads
+// them back through one of the transports:
+//
+//   memory  messageToFlatArray() and FlatArrayMessageReader, no I/O
+//   pipe    a writer thread writes the messages to a pipe, the main thread
+//           reads them with StreamFdMessageReader
+//   file    write the messages to <file>, then read them back with
+//           StreamFdMessageReader
+//   mmap    write the messages to <file>, then mmap() it and read the
+//           messages in place with FlatArrayMessageReader (zero-copy)
+//
+// Decoding reads every field, including every payload byte, so that all
+// transports touch the same data. The result is printed as a single JSON line;
+// the checksum must be the same for all transports.
+
+#include <capnp/message.h>
+#include <capnp/serialize.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <thread>
+
+#include "capnpbench.capnp.h"
+
+namespace {
+
+using Clock = std::chrono::steady_clock;
+
+struct Result {
+    uint64_t bytes = 0;
+    uint64_t checksum = 0;
+    double write_time = 0;
+    double read_time = 0;
+};
+
+double seconds_since(Clock::time_point start) {
+    return std::chrono::duration<double>(Clock::now() - start).count();
+}
+
+capnp::ReaderOptions reader_options() {
+    capnp::ReaderOptions options;
+    // large messages exceed the default limit of 64 MiB
+    options.traversalLimitInWords = 1ull << 60;
+    return options;
+}
+
+void build(capnp::MessageBuilder& builder, uint64_t seq, unsigned items,
+           size_t payload_size) {
+    auto batch = builder.initRoot<Batch>();
+    batch.setSeq(seq);
+    auto list = batch.initItems(items);
+    for (unsigned i = 0; i < items; i++) {
+        auto item = list[i];
+        item.setId(seq * items + i);
+        item.setName(("item-" + std::to_string(i)).c_str());
+        item.setValue(i * 0.5);
+        auto payload = item.initPayload(payload_size);
+        memset(payload.begin(), static_cast<int>(i & 0xff), payload_size);
+    }
+}
+
+uint64_t consume(capnp::MessageReader& reader) {
+    auto batch = reader.getRoot<Batch>();
+    uint64_t sum = batch.getSeq();
+    for (auto item : batch.getItems()) {
+        sum += item.getId() + item.getName().size() + static_cast<uint64_t>(item.getValue());
+        for (auto byte : item.getPayload())
+            sum += byte;
+    }
+    return sum;
+}
+
+Result run_memory(uint64_t messages, unsigned items, size_t payload_size) {
+    Result result;
+    for (uint64_t seq = 0; seq < messages; seq++) {
+        auto start = Clock::now();
+        capnp::MallocMessageBuilder builder;
+        build(builder, seq, items, payload_size);
+        kj::Array<capnp::word> words = capnp::messageToFlatArray(builder);
+        result.write_time += seconds_since(start);
+        result.bytes += words.size() * sizeof(capnp::word);
+
+        start = Clock::now();
+        capnp::FlatArrayMessageReader reader(words, reader_options());
+        result.checksum += consume(reader);
+        result.read_time += seconds_since(start);
+    }
+    return result;
+}
+
+// Serializes all messages to fd; returns the number of bytes written.
+uint64_t write_messages(int fd, uint64_t messages, unsigned items, size_t payload_size) {
+    uint64_t bytes = 0;
+    for (uint64_t seq = 0; seq < messages; seq++) {
+        capnp::MallocMessageBuilder builder;
+        build(builder, seq, items, payload_size);
+        bytes += capnp::computeSerializedSizeInWords(builder) * sizeof(capnp::word);
+        capnp::writeMessageToFd(fd, builder);
+    }
+    return bytes;
+}
+
+uint64_t read_messages(int fd, uint64_t messages) {
+    uint64_t checksum = 0;
+    for (uint64_t seq = 0; seq < messages; seq++) {
+        capnp::StreamFdMessageReader reader(fd, reader_options());
+        checksum += consume(reader);
+    }
+    return checksum;
+}
+
+Result run_pipe(uint64_t messages, unsigned items, size_t payload_size) {
+    Result result;
+    int fds[2];
+    if (pipe(fds) < 0) {
+        perror("pipe");
+        exit(1);
+    }
+
+    std::thread writer([&]() {
+        auto start = Clock::now();
+        try {
+            result.bytes = write_messages(fds[1], messages, items, payload_size);
+        } catch (kj::Exception& e) {
+            fprintf(stderr, "writer: %s\n", e.getDescription().cStr());
+            _exit(1);
+        }
+        close(fds[1]);
+        result.write_time = seconds_since(start);
+    });
+
+    auto start = Clock::now();
+    result.checksum = read_messages(fds[0], messages);
+    result.read_time = seconds_since(start);
+    writer.join();
+    close(fds[0]);
+    return result;
+}
+
+Result run_file(uint64_t messages, unsigned items, size_t payload_size, const char* path,
+                bool use_mmap) {
+    Result result;
+    auto start = Clock::now();
+    int fd = open(path, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0) {
+        perror(path);
+        exit(1);
+    }
+    result.bytes = write_messages(fd, messages, items, payload_size);
+    close(fd);
+    result.write_time = seconds_since(start);
+
+    start = Clock::now();
+    fd = open(path, O_RDONLY);
+    if (fd < 0) {
+        perror(path);
+        exit(1);
+    }
+    if (!use_mmap) {
+        result.checksum = read_messages(fd, messages);
+    } else {
+        struct stat st;
+        if (fstat(fd, &st) < 0) {
+            perror("fstat");
+            exit(1);
+        }
+        void* addr = mmap(nullptr, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (addr == MAP_FAILED) {
+            perror("mmap");
+            exit(1);
+        }
+        auto words = kj::arrayPtr(reinterpret_cast<const capnp::word*>(addr),
+                                  st.st_size / sizeof(capnp::word));
+        for (uint64_t seq = 0; seq < messages; seq++) {
+            capnp::FlatArrayMessageReader reader(words, reader_options());
+            result.checksum += consume(reader);
+            words = kj::arrayPtr(reader.getEnd(), words.end());
+        }
+        munmap(addr, st.st_size);
+    }
+    close(fd);
+    result.read_time = seconds_since(start);
+    unlink(path);
+    return result;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+    if (argc < 5 || argc > 6) {
+        fprintf(stderr,
+                "Usage: %s memory|pipe|file|mmap <messages> <items> <payload-size> [<file>]\n",
+                argv[0]);
+        return 1;
+    }
+    std::string transport = argv[1];
+    uint64_t messages = strtoull(argv[2], nullptr, 10);
+    unsigned items = static_cast<unsigned>(strtoul(argv[3], nullptr, 10));
+    size_t payload_size = strtoull(argv[4], nullptr, 10);
+    const char* path = argc > 5 ? argv[5] : "capnpbench.dat";
+
+    Result result;
+    auto start = Clock::now();
+    try {
+        if (transport == "memory") {
+            result = run_memory(messages, items, payload_size);
+        } else if (transport == "pipe") {
+            result = run_pipe(messages, items, payload_size);
+        } else if (transport == "file" || transport == "mmap") {
+            result = run_file(messages, items, payload_size, path, transport == "mmap");
+        } else {
+            fprintf(stderr, "unknown transport: %s\n", transport.c_str());
+            return 1;
+        }
+    } catch (kj::Exception& e) {
+        fprintf(stderr, "%s\n", e.getDescription().cStr());
+        return 1;
+    }
+    double total_time = seconds_since(start);
+
+    printf("{\"transport\": \"%s\", \"messages\": %llu, \"items\": %u, \"payload_size\": %zu, "
+           "\"total_bytes\": %llu, \"message_bytes\": %.1f, \"write_time\": %.6f, "
+           "\"read_time\": %.6f, \"total_time\": %.6f, \"messages_per_sec\": %.3f, "
+           "\"bytes_per_sec\": %.1f, \"checksum\": %llu}\n",
+           transport.c_str(), static_cast<unsigned long long>(messages), items, payload_size,
+           static_cast<unsigned long long>(result.bytes),
+           messages ? static_cast<double>(result.bytes) / messages : 0.0, result.write_time,
+           result.read_time, total_time, messages / total_time, result.bytes / total_time,
+           static_cast<unsigned long long>(result.checksum));
+    return 0;
+}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+'''
+Serialization benchmark for Cap'n Proto, natively, under Graphene and under
+Graphene-SGX.
+
+capnpbench encodes messages with a list of items of a given payload size and
+decodes them again, transferring them through memory (no I/O, the baseline),
+a pipe between two threads, a file read with read() and a file mapped with
+mmap() and decoded in place (zero-copy). The driver runs it for every
+combination of transport, list length and payload size and reports messages/s
+and bytes/s, plus the encode (write) and decode (read) throughput separately.
+
+The checksum of the decoded messages must be the same for all transports and
+modes; runs with a different checksum are marked as failed.
+'''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+MANIFEST = 'capnpbench.manifest'
+TRANSPORTS = ('memory', 'pipe', 'file', 'mmap')
+# approximate per-item overhead of the encoding, used to size the runs
+ITEM_OVERHEAD = 64
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--transport', '-t', metavar='NAME,...',
+    default=','.join(TRANSPORTS),
+    help='comma-separated transports (default: %(default)s)')
+argparser.add_argument('--items', '-n', metavar='N,...', default='1,100',
+    help='comma-separated list lengths (default: %(default)s)')
+argparser.add_argument('--payload-size', '-s', metavar='SIZE,...',
+    default='16,4K,64K',
+    help='comma-separated payload sizes per item (K/M suffixes allowed, '
+        'default: %(default)s)')
+argparser.add_argument('--messages', metavar='N', type=int, default=10000,
+    help='messages per run (default: %(default)s)')
+argparser.add_argument('--max-bytes', metavar='SIZE', default='256M',
+    help='limit the messages per run to about this many bytes '
+        '(default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single run (default: 3600)')
+
+
+def run_once(args, mode, transport, messages, items, payload_size):
+    # pylint: disable=too-many-arguments
+    argv, env = benchlib.command_for(mode, ['./capnpbench', transport,
+        str(messages), str(items), str(payload_size)], MANIFEST,
+        loader=args.loader)
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        timeout=args.timeout)
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        return {'returncode': returncode, 'wall_time': elapsed}
+    result = benchlib.find_json_line(stdout)
+    result.update(returncode=0, wall_time=elapsed)
+    for phase in ('write', 'read'):
+        if result[phase + '_time']:
+            result[phase + '_bytes_per_sec'] = (result['total_bytes']
+                / result[phase + '_time'])
+    return result
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    transports = args.transport.split(',')
+    for transport in transports:
+        if transport not in TRANSPORTS:
+            argparser.error('unknown transport: {}'.format(transport))
+    max_bytes = benchlib.parse_size(args.max_bytes)
+
+    results = []
+    for items in benchlib.parse_list(args.items):
+        for payload_size in benchlib.parse_list(args.payload_size,
+                benchlib.parse_size):
+            message_size = items * (payload_size + ITEM_OVERHEAD)
+            messages = max(1, min(args.messages, max_bytes // message_size))
+            for transport in transports:
+                for mode in benchlib.get_modes(args):
+                    print('{} {} items={} payload={} messages={}'.format(mode,
+                        transport, items, payload_size, messages),
+                        file=sys.stderr)
+                    result = run_once(args, mode, transport, messages, items,
+                        payload_size)
+                    result.update(mode=mode, transport=transport,
+                        items=items, payload_size=payload_size)
+                    results.append(result)
+
+    checksums = {}
+    for result in results:
+        if result['returncode'] == 0:
+            checksums.setdefault((result['items'], result['payload_size']),
+                result['checksum'])
+    failed = 0
+    for result in results:
+        ok = (result['returncode'] == 0 and result['checksum']
+            == checksums[(result['items'], result['payload_size'])])
+        result['status'] = 'ok' if ok else 'FAIL'
+        failed += not ok
+
+    def key(result):
+        return (result['transport'], result['items'], result['payload_size'])
+    native = {key(result): result for result in results
+        if result['mode'] == 'native' and result['status'] == 'ok'}
+    rows = []
+    for result in results:
+        ref = native.get(key(result))
+        row = dict(result)
+        if ref and result.get('messages_per_sec'):
+            row['slowdown'] = (ref['messages_per_sec']
+                / result['messages_per_sec'])
+        for name in ('bytes_per_sec', 'write_bytes_per_sec',
+                'read_bytes_per_sec'):
+            if result.get(name) is not None:
+                row[name] = result[name] / 1e6
+        rows.append(row)
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('transport', 'transport'),
+        ('items', 'items'),
+        ('payload_size', 'payload'),
+        ('messages_per_sec', 'msgs/s', '.0f'),
+        ('bytes_per_sec', 'MB/s', '.1f'),
+        ('write_bytes_per_sec', 'write MB/s', '.1f'),
+        ('read_bytes_per_sec', 'read MB/s', '.1f'),
+        ('slowdown', 'x native', '.2f'),
+        ('status', 'status'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'capnproto',
+        'host': benchlib.host_info(),
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return min(failed, 255)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
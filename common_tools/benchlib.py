@@ -0,0 +1,566 @@
+'''
+Helpers shared by the benchmark drivers of the application samples.
+
+The drivers run on the host and start the workload natively, under Graphene
+(``./pal_loader <manifest>``) or under Graphene-SGX (``SGX=1 ./pal_loader
+<manifest>``). This module only depends on the Python standard library, so
+that it can be used with the system Python 3.5 on Ubuntu 16.04.
+
+A driver imports it with::
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        '..', 'common_tools'))
+    import benchlib
+'''
+
+import csv
+import hashlib
+import json
+import math
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ('native', 'graphene', 'sgx')
+DEFAULT_LOADER = './pal_loader'
+
+# CPU sets (e.g. ``0-3,8``) for the workload and for the load generators, set
+# by ``noisecontrol.py`` for the drivers it runs
+SERVER_CPUS_ENV = 'BENCH_SERVER_CPUS'
+CLIENT_CPUS_ENV = 'BENCH_CLIENT_CPUS'
+
+
+def add_mode_arguments(argparser, default=('native', 'graphene')):
+    '''Add the ``--mode`` and ``--loader`` options to an argument parser.
+
+    Args:
+        argparser (argparse.ArgumentParser): the parser to extend
+        default (tuple): modes used when ``--mode`` is not given
+    '''
+    argparser.add_argument('--mode', '-m', metavar='MODE',
+        action='append', choices=MODES,
+        help='run in this mode, one of {}; may be given multiple times '
+            '(default: {})'.format(', '.join(MODES), ' '.join(default)))
+    argparser.add_argument('--loader', metavar='PATH',
+        default=DEFAULT_LOADER,
+        help='path to pal_loader (default: {})'.format(DEFAULT_LOADER))
+    argparser.set_defaults(mode=None, default_modes=list(default))
+
+
+def get_modes(args):
+    '''Return the modes selected with :py:func:`add_mode_arguments`.'''
+    return args.mode if args.mode is not None else args.default_modes
+
+
+def command_for(mode, native_argv, manifest, graphene_argv=None, *,
+        loader=DEFAULT_LOADER, env=None):
+    '''Build the command line and the environment for a given mode.
+
+    Args:
+        mode (str): one of :py:data:`MODES`
+        native_argv (list): full *argv* when running natively
+        manifest (str): manifest passed to ``pal_loader``
+        graphene_argv (list): arguments after the manifest (default: the
+            arguments of *native_argv*, without the executable)
+        loader (str): path to ``pal_loader``
+        env (dict): base environment (default: :py:data:`os.environ`)
+
+    Returns:
+        tuple: ``(argv, env)``
+    '''
+    env = dict(os.environ if env is None else env)
+    env.pop('SGX', None)
+    if mode == 'native':
+        return list(native_argv), env
+    if mode not in MODES:
+        raise ValueError('unknown mode: {!r}'.format(mode))
+    if graphene_argv is None:
+        graphene_argv = native_argv[1:]
+    if mode == 'sgx':
+        env['SGX'] = '1'
+    return [loader, manifest, *graphene_argv], env
+
+
+def wait_for_port(host, port, *, timeout=60, proc=None):
+    '''Wait until a TCP port accepts connections.
+
+    Graphene-SGX takes a long time to initialise the enclave, so servers are
+    polled instead of waiting for a fixed time.
+
+    Args:
+        host (str): host name
+        port (int): port number
+        timeout (float): how long to wait, in seconds
+        proc (subprocess.Popen): if given, fail early when it exits
+
+    Returns:
+        float: seconds it took for the port to become ready
+
+    Raises:
+        RuntimeError: on timeout or when *proc* exits
+    '''
+    start = time.perf_counter()
+    while True:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError('server exited with returncode {} before '
+                'listening on {}:{}'.format(proc.returncode, host, port))
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return time.perf_counter() - start
+        except OSError:
+            pass
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError('timed out waiting for {}:{}'.format(host, port))
+        time.sleep(0.1)
+
+
+def parse_cpus(value):
+    '''Parse a CPU list like ``0-3,8`` into a set of CPU numbers.'''
+    cpus = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpus(cpus):
+    '''Format a set of CPU numbers as a CPU list like ``0-3,8``.'''
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last
+        else '{}-{}'.format(first, last) for first, last in ranges)
+
+
+def get_cpus(role):
+    '''Return the CPU set of *role* (``server`` for the workload, ``client``
+    for load generators) from the environment, or :py:obj:`None`.'''
+    value = os.environ.get(
+        SERVER_CPUS_ENV if role == 'server' else CLIENT_CPUS_ENV)
+    return parse_cpus(value) if value else None
+
+
+def child_setup(cpus, *, new_session=False):
+    '''Return a ``preexec_fn`` which pins the child to *cpus* (e.g.
+    ``get_cpus('server')``) and, with *new_session*, starts a new session,
+    so that the child and its descendants can be killed with
+    :py:func:`os.killpg`.'''
+    def setup():
+        if new_session:
+            os.setsid()
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+    return setup
+
+
+class Server:
+    '''A server process running natively or under Graphene.
+
+    Use as a context manager; the server is started on entering and killed
+    (together with all its children, e.g. Graphene helper processes) on
+    exiting::
+
+        argv, env = benchlib.command_for(mode, native_argv, manifest)
+        with benchlib.Server(argv, env=env, port=6379) as server:
+            print('ready after', server.ready_time)
+
+    Args:
+        argv (list): the command
+        env (dict): environment
+        host (str): host to poll for readiness
+        port (int): port to poll for readiness, or :py:obj:`None` to not wait
+        timeout (float): how long to wait for the port
+        log (str): file name for stdout and stderr of the server
+            (default: discard)
+        cwd (str): working directory
+        cpus (set): CPUs to pin the server to (default: from
+            ``BENCH_SERVER_CPUS``, if set)
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, argv, *, env=None, host='127.0.0.1', port=None,
+            timeout=120, log=None, cwd=None, cpus=None):
+        self.argv = list(argv)
+        self.env = env
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.log = log
+        self.cwd = cwd
+        self.cpus = cpus if cpus is not None else get_cpus('server')
+        self.proc = None
+        self.ready_time = None
+        self._logfile = None
+
+    def start(self):
+        '''Start the server and wait until it listens on the port.'''
+        if self.log is not None:
+            self._logfile = open(self.log, 'ab')
+        output = self._logfile or subprocess.DEVNULL
+        # pylint: disable=subprocess-popen-preexec-fn
+        self.proc = subprocess.Popen(self.argv, env=self.env, cwd=self.cwd,
+            stdin=subprocess.DEVNULL, stdout=output, stderr=output,
+            preexec_fn=child_setup(self.cpus, new_session=True))
+        if self.port is not None:
+            self.ready_time = wait_for_port(self.host, self.port,
+                timeout=self.timeout, proc=self.proc)
+        return self
+
+    def stop(self, *, grace=5):
+        '''Stop the server: SIGTERM, then SIGKILL after *grace* seconds.'''
+        if self.proc is None:
+            return
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self.proc.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                self.proc.wait(timeout=grace)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        # the process group may outlive the leader
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.proc.wait()
+        if self._logfile is not None:
+            self._logfile.close()
+            self._logfile = None
+
+    def __enter__(self):
+        try:
+            return self.start()
+        except BaseException:
+            self.stop()
+            raise
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def process_table():
+    '''Return ``{pid: (ppid, pgrp, session)}`` of all processes.'''
+    table = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry)) as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # the command in parentheses may contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        table[int(entry)] = (int(fields[1]), int(fields[2]), int(fields[3]))
+    return table
+
+
+def process_groups():
+    '''Return a mapping of process group to its process ids.'''
+    groups = {}
+    for pid, (_, pgrp, _) in process_table().items():
+        groups.setdefault(pgrp, []).append(pid)
+    return groups
+
+
+def process_memory(pid):
+    '''Return ``(rss, pss)`` of a process in bytes; *pss* is
+    :py:obj:`None` without ``smaps_rollup`` (Linux < 4.14).'''
+    values = {}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    values[key] = int(value.split()[0]) * 1024
+        return values.get('Rss', 0), values.get('Pss', 0)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return 0, 0
+    try:
+        with open('/proc/{}/status'.format(pid)) as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024, None
+    except OSError:
+        pass
+    return 0, None
+
+
+def percentile(values, pct):
+    '''Return the *pct*-th percentile of *values*, interpolating linearly.'''
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(values, percentiles=(50, 90, 99)):
+    '''Return basic statistics of a sample as a dictionary.'''
+    values = list(values)
+    if not values:
+        return {'count': 0}
+    result = {
+        'count': len(values),
+        'min': min(values),
+        'max': max(values),
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+    for pct in percentiles:
+        result['p{:g}'.format(pct)] = percentile(values, pct)
+    return result
+
+
+def parse_size(value):
+    '''Parse a size like ``4K``, ``16M`` or ``1G`` into bytes.'''
+    value = value.strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def parse_list(value, type=int):
+    '''Parse a comma-separated list, e.g. ``1,2,4``.'''
+    # pylint: disable=redefined-builtin
+    return [type(item) for item in value.split(',') if item.strip()]
+
+
+def find_json_line(output):
+    '''Return the last line of *output* that parses as a JSON object.
+
+    Graphene may print its own messages to stdout (e.g. in debug builds), so
+    the workload scripts print their result as a single JSON line.
+    '''
+    for line in reversed(output.splitlines()):
+        line = line.strip()
+        if not line.startswith('{'):
+            continue
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    raise ValueError('no JSON result found in the output')
+
+
+def default_result_path(suffix='.json'):
+    '''Return a file name like ``result-200325-123456.json``.'''
+    return 'result-' + time.strftime('%y%m%d-%H%M%S') + suffix
+
+
+def host_info():
+    '''Return a dictionary describing the host, stored with every result.'''
+    uname = os.uname()
+    return {
+        'hostname': uname.nodename,
+        'kernel': uname.release,
+        'cpus': len(os.sched_getaffinity(0)),
+        'python': sys.version.split()[0],
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def write_json(path, data):
+    '''Write *data* as JSON to *path*, or to stdout if *path* is ``-``.'''
+    if path == '-':
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+        return
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def write_csv(path, rows, columns):
+    '''Write *rows* (a list of dicts) to a CSV file with the given *columns*
+    (a list of keys).'''
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns,
+            extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_table(rows, columns, *, file=None):
+    '''Print *rows* (a list of dicts) as a plain-text table.
+
+    Args:
+        rows (list): the rows
+        columns (list): ``(key, header)`` or ``(key, header, format)`` tuples
+        file: where to print (default: stdout)
+    '''
+    file = sys.stdout if file is None else file
+    cells = []
+    for row in rows:
+        line = []
+        for column in columns:
+            value = row.get(column[0])
+            if value is None:
+                line.append('-')
+            elif len(column) > 2:
+                line.append(format(value, column[2]))
+            else:
+                line.append(str(value))
+        cells.append(line)
+    widths = [max([len(column[1])] + [len(line[i]) for line in cells])
+        for i, column in enumerate(columns)]
+    print('  '.join(column[1].rjust(width)
+        for column, width in zip(columns, widths)), file=file)
+    print('  '.join('-' * width for width in widths), file=file)
+    for line in cells:
+        print('  '.join(cell.rjust(width)
+            for cell, width in zip(line, widths)), file=file)
+
+
+INFERENCE_RUN_KEYS = ('mode', 'framework', 'model', 'model_load_time',
+    'first_inference_latency', 'model_cache', 'model_conversion_time',
+    'wall_time', 'top_class')
+INFERENCE_RESULT_KEYS = ('batch_size', 'threads', 'inter_op_threads',
+    'images', 'images_per_sec', 'latency_p50', 'latency_p90', 'latency_p99',
+    'latency_max', 'run_latency_p50', 'run_latency_p90', 'run_latency_p99',
+    'run_latency_max')
+
+
+def complete_inference_run(run):
+    '''Set the keys of :py:data:`INFERENCE_RUN_KEYS` and
+    :py:data:`INFERENCE_RESULT_KEYS` which are missing from *run* (and its
+    results) to None, and return *run*.'''
+    for key in INFERENCE_RUN_KEYS:
+        run.setdefault(key, None)
+    for item in run.setdefault('results', []):
+        for key in INFERENCE_RESULT_KEYS:
+            item.setdefault(key, None)
+    return run
+
+
+def print_inference_results(runs, *, file=None):
+    '''Print the results of the ML inference benchmarks.
+
+    All inference drivers (pytorch, tensorflow, openvino) produce runs with
+    the keys of :py:data:`INFERENCE_RUN_KEYS`, and a list of ``results`` with
+    the keys of :py:data:`INFERENCE_RESULT_KEYS`, so that the stacks can be
+    compared directly. Times are in seconds; keys that a framework cannot
+    measure are None (see :py:func:`complete_inference_run`).
+
+    ``images_per_sec`` is the steady-state throughput: images divided by the
+    time spent in inference, without process startup and model load. The
+    latencies come in two flavours, which must not be compared with each
+    other:
+
+    * ``latency_*`` are percentiles over single inferences (of a whole batch
+      for batch sizes above 1); only pytorch measures these,
+    * ``run_latency_*`` are percentiles over the per-run latency that a tool
+      reports (the average of label_image for tensorflow, the median of
+      benchmark_app for openvino). There are only ``--repeats`` samples per
+      configuration, so they show the variation between runs, not the tail
+      latency.
+    '''
+    print_table(runs, [
+        ('mode', 'mode'),
+        ('framework', 'framework'),
+        ('model_cache', 'cache'),
+        ('model_load_time', 'model load [s]', '.3f'),
+        ('first_inference_latency', 'first inference [s]', '.3f'),
+        ('wall_time', 'total [s]', '.2f'),
+        ('top_class', 'top class'),
+    ], file=file)
+    print(file=file)
+
+    def key(item):
+        return (item['batch_size'], item['threads'],
+            item.get('inter_op_threads'))
+    native = {key(item): item for run in runs if run['mode'] == 'native'
+        for item in run['results']}
+    rows = []
+    for run in runs:
+        for item in run['results']:
+            ref = native.get(key(item))
+            rows.append(dict(item, mode=run['mode'], slowdown=(
+                ref['images_per_sec'] / item['images_per_sec']
+                if ref and item['images_per_sec'] else None)))
+    print_table(rows, [
+        ('mode', 'mode'),
+        ('batch_size', 'batch'),
+        ('threads', 'threads'),
+        ('inter_op_threads', 'inter-op'),
+        ('images_per_sec', 'images/s', '.2f'),
+        ('latency_p50', 'p50 [s]', '.4f'),
+        ('latency_p90', 'p90 [s]', '.4f'),
+        ('latency_p99', 'p99 [s]', '.4f'),
+        ('run_latency_p50', 'run p50 [s]', '.4f'),
+        ('run_latency_max', 'run max [s]', '.4f'),
+        ('slowdown', 'x native', '.2f'),
+    ], file=file)
+
+
+def run_capture(argv, *, env=None, cwd=None, timeout=None, role='server'):
+    '''Run a command to completion and return ``(returncode, stdout, stderr,
+    elapsed)``.
+
+    The command is pinned to the CPUs of *role* (see :py:func:`get_cpus`);
+    load generators pass ``role='client'``.'''
+    start = time.perf_counter()
+    # pylint: disable=subprocess-popen-preexec-fn
+    proc = subprocess.run(argv, env=env, cwd=cwd, timeout=timeout,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        preexec_fn=child_setup(get_cpus(role)))
+    elapsed = time.perf_counter() - start
+    return (proc.returncode, proc.stdout.decode(errors='backslashreplace'),
+        proc.stderr.decode(errors='backslashreplace'), elapsed)
+
+
+def cached_build(cache_dir, inputs, options, build):
+    '''Return the cache entry for *inputs* built with *options*, building it
+    on a miss.
+
+    The entry is a directory in *cache_dir* named after a SHA-256 digest of
+    the contents of the *inputs* files and of *options* (a list of strings),
+    so it stays valid across runs and is rebuilt when either changes. On a
+    miss, ``build(directory)`` is called with a temporary directory, which is
+    then renamed into place, so an interrupted build never leaves a partial
+    entry behind.
+
+    Returns:
+        tuple: ``(directory, hit, build_time)``
+    '''
+    digest = hashlib.sha256()
+    for path in inputs:
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+    for option in options:
+        digest.update(option.encode() + b'\0')
+    directory = os.path.join(cache_dir, digest.hexdigest()[:16])
+    if os.path.isdir(directory):
+        return directory, True, 0.0
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = '{}.tmp-{}'.format(directory, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    start = time.perf_counter()
+    try:
+        build(tmp)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    os.rename(tmp, directory)
+    return directory, False, time.perf_counter() - start
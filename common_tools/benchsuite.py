@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+'''
+Benchmark suite for the application samples.
+
+Runs the applications through their plugins (see suiteplugins.py) natively,
+under Graphene and under Graphene-SGX, and stores every measured value in a
+SQLite database together with the host and the commit of this repository, so
+that runs can be queried and compared later::
+
+    ./benchsuite.py list
+    ./benchsuite.py run -m native -m graphene redis nginx
+    ./benchsuite.py run --args nginx="-P tls -d 5" nginx
+    ./benchsuite.py runs
+    ./benchsuite.py show 3 --app redis --metric 'requests_per_sec'
+    ./benchsuite.py diff 3 5 --threshold 10
+
+The output of builds and runs goes to ``logs/run-<id>.log`` next to the
+database.
+'''
+
+import argparse
+import json
+import os
+import re
+import shlex
+import sqlite3
+import subprocess
+import sys
+import time
+
+import benchlib
+import suiteplugins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(ROOT, 'results.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    finished TEXT,
+    label TEXT,
+    command TEXT,
+    hostname TEXT,
+    kernel TEXT,
+    cpus INTEGER,
+    host TEXT,
+    commit_id TEXT,
+    commit_dirty INTEGER,
+    graphene_commit TEXT
+);
+CREATE TABLE IF NOT EXISTS executions (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    app TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    build_time REAL,
+    wall_time REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    app TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    section TEXT NOT NULL,
+    params TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id, app, mode);
+'''
+
+
+def git_commit(directory):
+    '''Return ``(commit, dirty)`` of the git work tree at *directory*, or
+    ``(None, None)``.'''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=directory, stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(['git', 'status', '--porcelain',
+            '--untracked-files=no'], cwd=directory,
+            stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+class ResultStore:
+    '''The SQLite database of the suite.'''
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def begin_run(self, *, label, command, graphene_dir):
+        host = benchlib.host_info()
+        commit, dirty = git_commit(ROOT)
+        graphene_commit = (git_commit(graphene_dir)[0] if graphene_dir
+            else None)
+        with self.db:
+            cursor = self.db.execute('INSERT INTO runs (started, label, '
+                'command, hostname, kernel, cpus, host, commit_id, '
+                'commit_dirty, graphene_commit) VALUES (?, ?, ?, ?, ?, ?, ?, '
+                '?, ?, ?)', (host['time'], label, command, host['hostname'],
+                host['kernel'], host['cpus'], json.dumps(host, sort_keys=True),
+                commit, dirty, graphene_commit))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ? WHERE id = ?',
+                (time.strftime('%Y-%m-%dT%H:%M:%S%z'), run_id))
+
+    def add_execution(self, run_id, app, mode, **fields):
+        with self.db:
+            self.db.execute('INSERT INTO executions (run_id, app, mode, '
+                'status, error, build_time, wall_time) VALUES (?, ?, ?, ?, ?, '
+                '?, ?)', (run_id, app, mode, fields['status'],
+                fields.get('error'), fields.get('build_time'),
+                fields.get('wall_time')))
+
+    def add_results(self, run_id, app, mode, rows):
+        with self.db:
+            self.db.executemany('INSERT INTO results (run_id, app, mode, '
+                'section, params, metric, value) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, app, mode, row['section'],
+                    json.dumps(row['params'], sort_keys=True), metric, value)
+                    for row in rows
+                    for metric, value in sorted(row['metrics'].items())])
+
+    def runs(self, limit):
+        return self.db.execute('SELECT runs.*, '
+            'COUNT(executions.app) AS executions, '
+            "SUM(executions.status != 'ok') AS failed "
+            'FROM runs LEFT JOIN executions ON executions.run_id = runs.id '
+            'GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?',
+            (limit,)).fetchall()
+
+    def run(self, run_id):
+        '''Return the run with the given id, or None.'''
+        return self.db.execute('SELECT * FROM runs WHERE id = ?',
+            (run_id,)).fetchone()
+
+    def executions(self, run_id):
+        return self.db.execute('SELECT * FROM executions WHERE run_id = ? '
+            'ORDER BY rowid', (run_id,)).fetchall()
+
+    def results(self, run_id, *, app=None, mode=None, metric=None):
+        '''Return the results of a run, optionally filtered by application,
+        mode and a regular expression for the metric name.'''
+        query = 'SELECT * FROM results WHERE run_id = ?'
+        values = [run_id]
+        for column, value in (('app', app), ('mode', mode)):
+            if value is not None:
+                query += ' AND {} = ?'.format(column)
+                values.append(value)
+        rows = self.db.execute(query + ' ORDER BY rowid', values).fetchall()
+        if metric is not None:
+            pattern = re.compile(metric)
+            rows = [row for row in rows if pattern.search(row['metric'])]
+        return rows
+
+
+def get_run(store, run_id):
+    run = store.run(run_id)
+    if run is None:
+        argparser.error('no run {} in {}'.format(run_id, store.path))
+    return run
+
+
+def format_params(params):
+    return ' '.join('{}={}'.format(key, value)
+        for key, value in sorted(json.loads(params).items()))
+
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('--db', metavar='FILENAME', default=DEFAULT_DB,
+    help='results database (default: %(default)s)')
+subparsers = argparser.add_subparsers(dest='command', metavar='COMMAND')
+subparsers.required = True
+
+list_parser = subparsers.add_parser('list',
+    help='list the applications and their modes')
+
+run_parser = subparsers.add_parser('run',
+    help='run applications and store the results')
+benchlib.add_mode_arguments(run_parser)
+run_parser.add_argument('apps', metavar='APP', nargs='*',
+    help='application to run (default: all)')
+run_parser.add_argument('--label', '-l', metavar='TEXT',
+    help='label stored with the run')
+run_parser.add_argument('--args', metavar='APP=ARGS', action='append',
+    default=[],
+    help='additional arguments for the driver or command of an application, '
+        'split like a shell command line; may be given multiple times')
+run_parser.add_argument('--no-build', action='store_true',
+    help='do not run make before running an application')
+run_parser.add_argument('--repeat', '-r', metavar='N', type=int, default=5,
+    help='runs of the applications without a driver (default: %(default)s)')
+run_parser.add_argument('--graphene-dir', metavar='PATH',
+    default=os.environ.get('GRAPHENEDIR'),
+    help='Graphene work tree whose commit is stored with the run '
+        '(default: $GRAPHENEDIR)')
+run_parser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=7200,
+    help='timeout for every build and run (default: %(default)s)')
+
+runs_parser = subparsers.add_parser('runs', help='list the stored runs')
+runs_parser.add_argument('--limit', '-n', metavar='N', type=int, default=20,
+    help='show at most this many runs (default: %(default)s)')
+
+show_parser = subparsers.add_parser('show', help='show the results of a run')
+show_parser.add_argument('run_id', metavar='RUN', type=int)
+show_parser.add_argument('--app', '-a', metavar='APP')
+show_parser.add_argument('--mode', '-m', metavar='MODE',
+    choices=benchlib.MODES)
+show_parser.add_argument('--metric', metavar='REGEX',
+    help='only metrics whose name matches')
+show_parser.add_argument('--csv', metavar='FILENAME',
+    help='write the results as CSV instead of printing them')
+
+diff_parser = subparsers.add_parser('diff',
+    help='compare the results of two runs')
+diff_parser.add_argument('base', metavar='RUN', type=int)
+diff_parser.add_argument('other', metavar='RUN', type=int)
+diff_parser.add_argument('--app', '-a', metavar='APP')
+diff_parser.add_argument('--mode', '-m', metavar='MODE',
+    choices=benchlib.MODES)
+diff_parser.add_argument('--metric', metavar='REGEX',
+    help='only metrics whose name matches')
+diff_parser.add_argument('--threshold', '-t', metavar='PERCENT', type=float,
+    default=5,
+    help='only show changes of at least this many percent (default: '
+        '%(default)s)')
+diff_parser.add_argument('--all', action='store_true',
+    help='show all values, regardless of --threshold')
+
+
+def cmd_list(args, store):
+    # pylint: disable=unused-argument
+    benchlib.print_table([{'app': plugin.name,
+        'kind': type(plugin).__name__.replace('Plugin', '').lower(),
+        'modes': ' '.join(plugin.modes)} for plugin in suiteplugins.PLUGINS], [
+        ('app', 'app'),
+        ('kind', 'kind'),
+        ('modes', 'modes'),
+    ])
+    return 0
+
+
+def run_app(args, store, run_id, plugin, log, extra_args):
+    '''Run one application in all selected modes.'''
+    # pylint: disable=too-many-arguments
+    built = set()
+    for mode in benchlib.get_modes(args):
+        if mode not in plugin.modes:
+            continue
+        print('{} {}'.format(plugin.name, mode), file=sys.stderr)
+        log.write('\n### {} {}\n'.format(plugin.name, mode))
+        ctx = suiteplugins.Context(os.path.join(ROOT, plugin.directory),
+            log=log, extra_args=extra_args, repeat=args.repeat,
+            timeout=args.timeout)
+        fields = {'status': 'ok'}
+        start = time.perf_counter()
+        try:
+            # native and Graphene runs share the build
+            if not args.no_build and (mode == 'sgx') not in built:
+                fields['status'] = 'build-failed'
+                plugin.build(ctx, mode)
+                built.add(mode == 'sgx')
+                fields['build_time'] = time.perf_counter() - start
+                fields['status'] = 'ok'
+            handle = plugin.start(ctx, mode)
+            try:
+                plugin.ready(ctx, handle)
+                raw = plugin.load(ctx, mode, handle)
+                rows = plugin.measure(ctx, mode, raw)
+            finally:
+                plugin.teardown(ctx, handle)
+            store.add_results(run_id, plugin.name, mode, rows)
+        except Exception as e:  # pylint: disable=broad-except
+            if fields['status'] == 'ok':
+                fields['status'] = 'failed'
+            fields['error'] = str(e)
+            print('  {}: {}'.format(fields['status'], e), file=sys.stderr)
+            log.write('### {}: {}\n'.format(fields['status'], e))
+        fields['wall_time'] = time.perf_counter() - start
+        store.add_execution(run_id, plugin.name, mode, **fields)
+
+
+def cmd_run(args, store):
+    try:
+        plugins = [suiteplugins.get_plugin(name) for name in args.apps]
+    except KeyError as e:
+        argparser.error(e.args[0])
+    plugins = plugins or suiteplugins.PLUGINS
+    extra_args = {}
+    for item in args.args:
+        name, _, value = item.partition('=')
+        extra_args[name] = shlex.split(value)
+
+    run_id = store.begin_run(label=args.label,
+        command=' '.join(shlex.quote(arg) for arg in sys.argv),
+        graphene_dir=args.graphene_dir)
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(store.path)),
+        'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, 'run-{}.log'.format(run_id))
+    print('run {}, log file: {}'.format(run_id, log_path), file=sys.stderr)
+    with open(log_path, 'a') as log:
+        for plugin in plugins:
+            run_app(args, store, run_id, plugin, log,
+                extra_args.get(plugin.name, []))
+    store.finish_run(run_id)
+
+    executions = store.executions(run_id)
+    benchlib.print_table([dict(row) for row in executions], [
+        ('app', 'app'),
+        ('mode', 'mode'),
+        ('status', 'status'),
+        ('build_time', 'build [s]', '.1f'),
+        ('wall_time', 'total [s]', '.1f'),
+    ])
+    print('Run: {}'.format(run_id), file=sys.stderr)
+    return min(sum(1 for row in executions if row['status'] != 'ok'), 255)
+
+
+def cmd_runs(args, store):
+    rows = []
+    for row in store.runs(args.limit):
+        row = dict(row)
+        if row['commit_id']:
+            row['commit_id'] = row['commit_id'][:10] + (
+                '+' if row['commit_dirty'] else '')
+        rows.append(row)
+    benchlib.print_table(rows, [
+        ('id', 'run'),
+        ('started', 'started'),
+        ('label', 'label'),
+        ('hostname', 'host'),
+        ('commit_id', 'commit'),
+        ('executions', 'apps x modes'),
+        ('failed', 'failed'),
+    ])
+    return 0
+
+
+def cmd_show(args, store):
+    run = get_run(store, args.run_id)
+    rows = [dict(row, params=format_params(row['params']))
+        for row in store.results(args.run_id, app=args.app, mode=args.mode,
+            metric=args.metric)]
+    if args.csv:
+        benchlib.write_csv(args.csv, rows, ['app', 'mode', 'section',
+            'params', 'metric', 'value'])
+        return 0
+    print('run {} ({}), {}, commit {}'.format(run['id'], run['label'] or '-',
+        run['started'], run['commit_id']))
+    benchlib.print_table([dict(row) for row in
+        store.executions(args.run_id)], [
+        ('app', 'app'),
+        ('mode', 'mode'),
+        ('status', 'status'),
+        ('error', 'error'),
+    ])
+    print()
+    benchlib.print_table(rows, [
+        ('app', 'app'),
+        ('mode', 'mode'),
+        ('section', 'section'),
+        ('params', 'params'),
+        ('metric', 'metric'),
+        ('value', 'value', '.6g'),
+    ])
+    return 0
+
+
+def cmd_diff(args, store):
+    def load(run_id):
+        get_run(store, run_id)
+        return {(row['app'], row['mode'], row['section'], row['params'],
+            row['metric']): row['value'] for row in store.results(run_id,
+                app=args.app, mode=args.mode, metric=args.metric)}
+    base = load(args.base)
+    other = load(args.other)
+
+    rows = []
+    for key in sorted(set(base) & set(other)):
+        before, after = base[key], other[key]
+        change = None
+        if before:
+            change = (after - before) / abs(before) * 100
+        elif after == before:
+            change = 0.0
+        if not args.all and change is not None and abs(change) < (
+                args.threshold):
+            continue
+        app, mode, section, params, metric = key
+        rows.append({'app': app, 'mode': mode, 'section': section,
+            'params': format_params(params), 'metric': metric,
+            'base': before, 'other': after, 'change': change})
+    benchlib.print_table(rows, [
+        ('app', 'app'),
+        ('mode', 'mode'),
+        ('section', 'section'),
+        ('params', 'params'),
+        ('metric', 'metric'),
+        ('base', 'run {}'.format(args.base), '.6g'),
+        ('other', 'run {}'.format(args.other), '.6g'),
+        ('change', 'change [%]', '+.1f'),
+    ])
+    print('{} values compared, {} shown, {} only in run {}, {} only in run '
+        '{}'.format(len(set(base) & set(other)), len(rows),
+        len(set(base) - set(other)), args.base, len(set(other) - set(base)),
+        args.other), file=sys.stderr)
+    return 0
+
+
+COMMANDS = {
+    'list': cmd_list,
+    'run': cmd_run,
+    'runs': cmd_runs,
+    'show': cmd_show,
+    'diff': cmd_diff,
+}
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    store = ResultStore(args.db)
+    try:
+        return COMMANDS[args.command](args, store)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+'''
+Instance density benchmark: how memory footprint, startup latency and
+throughput change as more instances of an application run side by side.
+
+Instances of the application are started one after another (natively, under
+Graphene or under Graphene-SGX), each listening on its own port. After every
+start, the startup latency of the newest instance is recorded and all running
+instances are loaded for ``--duration`` seconds with one closed-loop client
+each, while the RSS and PSS of all processes of the instances
+(``/proc/<pid>/smaps_rollup``) and the available host memory are sampled.
+Every client is a process of its own (see loadclients.py), pinned to the
+client CPUs (``BENCH_CLIENT_CPUS``, see noisecontrol.py), so that the clients
+do not share one interpreter lock::
+
+    ./density-benchmark.py redis -m native -m sgx --max-instances 16
+    ./density-benchmark.py python-simple --steps 1,2,4,8,16
+
+The *knee* is the first instance count at which the aggregate throughput
+falls below ``--knee`` times the best aggregate throughput so far, or the
+startup latency grows beyond 1/``--knee`` times that of the first instance;
+past it, adding instances costs more than it brings (typically because of
+memory or EPC paging). Under SGX, enclave memory is not part of the RSS, so
+the footprint shows in the available host memory and the knee only.
+
+The CPU utilization of the clients is reported as well. If a client process
+or the client CPUs as a whole were busy at an instance count, the clients
+may have limited the throughput there (e.g. when clients and instances share
+the CPUs); such rows are marked, and so is a knee found at one of them.
+'''
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchlib  # pylint: disable=wrong-import-position
+import loadclients  # pylint: disable=wrong-import-position
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NGINX_CONFIG = '''\
+# Generated by density-benchmark.py
+worker_processes 1;
+daemon off;
+pid logs/density-{index}.pid;
+error_log logs/density-{index}.log;
+
+events {{
+    worker_connections 64;
+}}
+
+http {{
+    access_log off;
+    server {{
+        listen 127.0.0.1:{port};
+        location / {{
+            root html;
+        }}
+    }}
+}}
+'''
+
+
+def nginx_argv(port, index):
+    # the directory is allowed in the manifest (see nginx/run-benchmark.py)
+    path = os.path.join(ROOT, 'nginx', 'install', 'conf', 'bench',
+        'density-{}.conf'.format(index))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(NGINX_CONFIG.format(port=port, index=index))
+    return ['install/sbin/nginx', '-c', os.path.relpath(path,
+        os.path.join(ROOT, 'nginx', 'install'))]
+
+
+# application: directory, manifest, function (port, index) -> native argv,
+# and the protocol and adapter options of the load (see loadclients.py); for
+# HTTP, any response counts: e.g. busybox httpd answers 404 for the empty
+# document root, which still exercises the whole server
+APPS = {
+    'busybox': ('busybox', 'busybox.manifest',
+        lambda port, index: ['./busybox', 'httpd', '-f', '-p', str(port),
+            '-h', '.'], 'http', {}),
+    'python-simple': ('python-simple', 'python.manifest',
+        lambda port, index: ['python3', 'scripts/dummy-web-server.py',
+            str(port)], 'http', {}),
+    'redis': ('redis', 'redis-server.manifest',
+        lambda port, index: ['./redis-server', '--port', str(port),
+            '--protected-mode', 'no', '--save', '', '--appendonly', 'no'],
+        'redis', {'command': 'ping'}),
+    'nginx': ('nginx', 'nginx.manifest', nginx_argv, 'http', {}),
+}
+
+
+def read_meminfo():
+    '''Return ``/proc/meminfo`` in bytes.'''
+    meminfo = {}
+    with open('/proc/meminfo') as file:
+        for line in file:
+            key, value = line.split(':', 1)
+            value = value.split()
+            meminfo[key] = int(value[0]) * (1024 if len(value) > 1 else 1)
+    return meminfo
+
+
+class Sampler(threading.Thread):
+    '''Samples the memory of the running instances every *interval*
+    seconds.'''
+
+    def __init__(self, servers, interval):
+        super().__init__(daemon=True)
+        self.servers = servers
+        self.interval = interval
+        self.samples = []
+        self.start_time = time.monotonic()
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        groups = benchlib.process_groups()
+        rss = pss = 0
+        processes = 0
+        for server in list(self.servers):
+            for pid in groups.get(server.proc.pid, []):
+                process_rss, process_pss = benchlib.process_memory(pid)
+                rss += process_rss
+                pss = None if pss is None or process_pss is None \
+                    else pss + process_pss
+                processes += 1
+        meminfo = read_meminfo()
+        self.samples.append({
+            'time': time.monotonic() - self.start_time,
+            'instances': len(self.servers),
+            'processes': processes,
+            'rss': rss,
+            'pss': pss,
+            'mem_available': meminfo.get('MemAvailable'),
+            'mem_free': meminfo.get('MemFree'),
+        })
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def load(args, servers, protocol, options):
+    '''Load all instances at once, with one client process each; return the
+    result of :py:func:`loadclients.run_closed_loop`.'''
+    with loadclients.client_pool(len(servers)) as pool:
+        return loadclients.run_closed_loop(pool,
+            [(server.host, server.port, 1) for server in servers], protocol,
+            options, warmup=args.warmup, duration=args.duration)
+
+
+def find_knee(rows, threshold):
+    '''Return the first instance count past the knee (see the module
+    docstring), or :py:obj:`None`.'''
+    best = None
+    first_startup = rows[0]['startup_s'] if rows else None
+    for row in rows:
+        if best is not None and row['throughput'] < threshold * best:
+            return row['instances']
+        if first_startup and row['startup_s'] > first_startup / threshold:
+            return row['instances']
+        best = max(best or 0, row['throughput'])
+    return None
+
+
+def run_mode(args, mode):
+    # pylint: disable=too-many-locals
+    directory, manifest, make_argv, protocol, options = APPS[args.app]
+    cwd = os.path.join(ROOT, directory)
+    steps = set(benchlib.parse_list(args.steps)) if args.steps else None
+    reserve = benchlib.parse_size(args.reserve)
+    servers = []
+    rows = []
+    sampler = Sampler(servers, args.interval)
+    sampler.start()
+    try:
+        for index in range(1, args.max_instances + 1):
+            available = read_meminfo().get('MemAvailable')
+            if available is not None and available < reserve:
+                print('  stopping: only {} MiB of memory available'.format(
+                    available >> 20), file=sys.stderr)
+                break
+            port = args.base_port + index
+            argv, env = benchlib.command_for(mode, make_argv(port, index),
+                manifest, loader=args.loader)
+            server = benchlib.Server(argv, env=env, port=port, cwd=cwd,
+                timeout=args.timeout, log=args.server_log)
+            try:
+                server.start()
+            except (RuntimeError, OSError) as e:
+                server.stop()
+                print('  instance {} failed to start: {}'.format(index, e),
+                    file=sys.stderr)
+                break
+            servers.append(server)
+            if steps is not None and index not in steps:
+                continue
+
+            time.sleep(args.settle)
+            first_sample = len(sampler.samples)
+            result = load(args, servers, protocol, options)
+            throughput = result['requests'] / args.duration
+            sampler.sample()
+            samples = sampler.samples[first_sample:]
+            pss = [sample['pss'] for sample in samples]
+            row = {
+                'mode': mode,
+                'instances': index,
+                'startup_s': server.ready_time,
+                'throughput': throughput,
+                'throughput_per_instance': throughput / index,
+                'client_errors': result['errors'],
+                'client_cpu_max': max(result['client_cpu'], default=None),
+                'client_cpu_total': sum(cpu for cpu in result['client_cpu']
+                    if cpu is not None),
+                'client_saturated': loadclients.client_saturated(
+                    result['client_cpu']),
+                'rss': max(sample['rss'] for sample in samples),
+                'pss': None if None in pss else max(pss),
+                'mem_available': min(sample['mem_available']
+                    for sample in samples),
+            }
+            row['pss_per_instance'] = (None if row['pss'] is None
+                else row['pss'] / index)
+            rows.append(row)
+            print('  {} instances: started in {:.2f} s, {:.0f} req/s, '
+                'PSS {} MiB{}'.format(index, server.ready_time, throughput,
+                    '-' if row['pss'] is None else row['pss'] >> 20,
+                    ', client saturated' if row['client_saturated'] else ''),
+                file=sys.stderr)
+    finally:
+        sampler.stop()
+        for server in servers:
+            server.stop()
+
+    knee = find_knee(rows, args.knee)
+    knee_row = [row for row in rows if row['instances'] == knee]
+    return {
+        'mode': mode,
+        'knee': knee,
+        # the knee may be the saturation of the clients, not of the host
+        'knee_client_saturated': bool(knee_row
+            and knee_row[0]['client_saturated']),
+        'results': rows,
+        'samples': [dict(sample, mode=mode) for sample in sampler.samples],
+    }
+
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('app', choices=sorted(APPS),
+    help='application to run')
+benchlib.add_mode_arguments(argparser, default=('native', 'graphene', 'sgx'))
+argparser.add_argument('--max-instances', '-n', metavar='N', type=int,
+    default=32, help='maximal number of instances (default: %(default)s)')
+argparser.add_argument('--steps', metavar='N,...',
+    help='only measure at these instance counts (default: after every '
+        'start)')
+argparser.add_argument('--duration', '-d', metavar='SECONDS', type=float,
+    default=5, help='duration of the load at every step (default: '
+        '%(default)s)')
+argparser.add_argument('--warmup', metavar='SECONDS', type=float,
+    default=0.5, help='unmeasured load before every step (default: '
+        '%(default)s)')
+argparser.add_argument('--settle', metavar='SECONDS', type=float, default=1,
+    help='wait after starting an instance (default: %(default)s)')
+argparser.add_argument('--interval', metavar='SECONDS', type=float,
+    default=0.5, help='memory sampling interval (default: %(default)s)')
+argparser.add_argument('--base-port', metavar='PORT', type=int,
+    default=20000, help='instance N listens on PORT+N (default: '
+        '%(default)s)')
+argparser.add_argument('--knee', metavar='FACTOR', type=float, default=0.8,
+    help='threshold of the knee, see above (default: %(default)s)')
+argparser.add_argument('--reserve', metavar='SIZE', default='512M',
+    help='stop starting instances when less memory is available '
+        '(default: %(default)s)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=120, help='startup timeout of an instance (default: '
+        '%(default)s)')
+argparser.add_argument('--server-log', metavar='FILENAME',
+    help='append the output of the instances to this file')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    results = []
+    for mode in benchlib.get_modes(args):
+        print('{} ({}):'.format(args.app, mode), file=sys.stderr)
+        results.append(run_mode(args, mode))
+
+    native = {row['instances']: row for result in results
+        if result['mode'] == 'native' for row in result['results']}
+    for result in results:
+        rows = []
+        for row in result['results']:
+            row = dict(row)
+            ref = native.get(row['instances'])
+            if ref and row['throughput']:
+                row['slowdown'] = ref['throughput'] / row['throughput']
+            for key in ('rss', 'pss', 'pss_per_instance', 'mem_available'):
+                if row[key] is not None:
+                    row[key] /= 1 << 20
+            row['client'] = 'saturated' if row['client_saturated'] else ''
+            rows.append(row)
+        print('{} ({}), knee: {}{}'.format(args.app, result['mode'],
+            result['knee'] or '-', ' (client saturated, the clients may '
+            'limit the throughput)' if result['knee_client_saturated']
+            else ''))
+        benchlib.print_table(rows, [
+            ('instances', 'instances'),
+            ('startup_s', 'startup [s]', '.2f'),
+            ('throughput', 'req/s', '.0f'),
+            ('throughput_per_instance', 'req/s/inst', '.0f'),
+            ('slowdown', 'x native', '.2f'),
+            ('rss', 'RSS [MiB]', '.0f'),
+            ('pss', 'PSS [MiB]', '.0f'),
+            ('pss_per_instance', 'PSS/inst [MiB]', '.1f'),
+            ('mem_available', 'available [MiB]', '.0f'),
+            ('client_cpu_total', 'client CPUs', '.2f'),
+            ('client', 'client'),
+        ])
+        print()
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'density',
+        'app': args.app,
+        'host': benchlib.host_info(),
+        'runs': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
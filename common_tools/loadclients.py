@@ -0,0 +1,348 @@
+'''
+Asyncio clients of the TCP services of the application samples, shared by
+the load generators (loadgen.py, density-benchmark.py and the memcached and
+nodejs-express-server drivers).
+
+An *adapter* speaks one protocol on a connection opened with
+:py:func:`asyncio.open_connection`: :py:meth:`setup` prepares the server
+(e.g. stores the keys that are read later) and :py:meth:`request` sends one
+request and reads its reply. Adapters are created from a protocol name and
+keyword options, so that they can be passed to client processes::
+
+    adapter = loadclients.make_adapter('memcached', get_ratio=0.9,
+        keyspace=10000, value_size=32)
+
+:py:func:`run_closed_loop` runs a closed-loop load (every connection sends
+the next request as soon as it receives the reply) from several processes of
+a pool (see :py:func:`client_pool`, which pins them to the client CPUs), so
+that a single Python client does not become the bottleneck. It reports the
+CPU utilization of every client process as well: a process which is busy
+most of the time limits the load it generates.
+'''
+
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+
+import benchlib
+
+# CPU utilization of a client process (or of all client CPUs) above which
+# the client, not the server, may limit the throughput
+SATURATION = 0.9
+
+
+class ProtocolError(Exception):
+    '''Raised on an unexpected reply from the server.'''
+
+
+class HttpAdapter:
+    '''``GET`` requests over HTTP/1.1 with keep-alive.
+
+    Args:
+        path (str): the requested path
+        host (str): the ``Host`` header
+        expect_status (int): raise :py:exc:`ProtocolError` if the status of
+            a response differs; by default, any response counts
+    '''
+
+    def __init__(self, *, path='/', host='localhost', expect_status=None,
+            seed=None):
+        # pylint: disable=unused-argument
+        self.request_bytes = ('GET {} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(
+            path, host)).encode()
+        self.expect_status = (None if expect_status is None
+            else str(expect_status).encode())
+
+    async def setup(self, reader, writer):
+        pass
+
+    async def request(self, reader, writer):
+        '''Send a request and read the response; return whether the
+        connection can be reused.'''
+        writer.write(self.request_bytes)
+        status = await reader.readline()
+        if not status.startswith(b'HTTP/'):
+            raise ProtocolError('bad status line {!r}'.format(status))
+        keep_alive = not status.startswith(b'HTTP/1.0')
+        length = None
+        chunked = False
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            value = value.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'transfer-encoding' and value == b'chunked':
+                chunked = True
+            elif name == b'connection':
+                keep_alive = value == b'keep-alive'
+        if chunked:
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length is not None:
+            await reader.readexactly(length)
+        else:
+            await reader.read()
+            keep_alive = False
+        if self.expect_status is not None \
+                and status.split()[1:2] != [self.expect_status]:
+            raise ProtocolError(status.decode(errors='replace').strip())
+        return keep_alive
+
+
+class RedisAdapter:
+    '''RESP ``GET`` or ``SET`` of one key, or ``PING``.
+
+    Args:
+        command (str): ``get``, ``set`` or ``ping``
+        key (str): the key
+        value_size (int): size of the stored value
+    '''
+
+    def __init__(self, *, command='get', key='loadgen', value_size=100,
+            seed=None):
+        # pylint: disable=unused-argument
+        self.set_bytes = self.command(b'SET', key.encode(),
+            b'x' * value_size)
+        self.request_bytes = {
+            'get': self.command(b'GET', key.encode()),
+            'set': self.set_bytes,
+            'ping': self.command(b'PING'),
+        }[command]
+
+    @staticmethod
+    def command(*words):
+        return b'*%d\r\n' % len(words) + b''.join(
+            b'$%d\r\n%s\r\n' % (len(word), word) for word in words)
+
+    async def read_reply(self, reader):
+        line = await reader.readline()
+        kind, value = line[:1], line[1:].strip()
+        if kind == b'-':
+            raise ProtocolError(value.decode(errors='replace'))
+        if kind == b'$':
+            if int(value) >= 0:
+                await reader.readexactly(int(value) + 2)
+        elif kind == b'*':
+            for _ in range(max(0, int(value))):
+                await self.read_reply(reader)
+        elif kind not in (b'+', b':'):
+            raise ProtocolError('bad reply {!r}'.format(line))
+
+    async def setup(self, reader, writer):
+        writer.write(self.set_bytes)
+        await self.read_reply(reader)
+
+    async def request(self, reader, writer):
+        writer.write(self.request_bytes)
+        await self.read_reply(reader)
+        return True
+
+
+class MemcachedAdapter:
+    '''Text protocol ``get`` and ``set`` of random keys.
+
+    Args:
+        key (str): the key, or the prefix of the keys ``<key>:<n>``
+        keyspace (int): number of keys; with 1, *key* itself is used
+        get_ratio (float): fraction of ``get`` requests, the others are
+            ``set``
+        value_size (int): size of the stored values
+        seed: seed of the choice of keys and commands
+    '''
+
+    def __init__(self, *, key='loadgen', keyspace=1, get_ratio=1.0,
+            value_size=100, seed=None):
+        # pylint: disable=too-many-arguments
+        if keyspace == 1:
+            self.keys = [key.encode()]
+        else:
+            self.keys = [b'%s:%d' % (key.encode(), i)
+                for i in range(keyspace)]
+        self.get_ratio = get_ratio
+        self.value = b'x' * value_size
+        self.rng = random.Random(seed)
+
+    async def set(self, reader, writer, key):
+        writer.write(b'set %s 0 0 %d\r\n%s\r\n' % (key, len(self.value),
+            self.value))
+        line = await reader.readline()
+        if line != b'STORED\r\n':
+            raise ProtocolError('set {!r}: {!r}'.format(key, line))
+
+    async def get(self, reader, writer, key):
+        writer.write(b'get %s\r\n' % key)
+        while True:
+            line = await reader.readline()
+            if line == b'END\r\n':
+                return
+            if not line.startswith(b'VALUE '):
+                raise ProtocolError('get {!r}: {!r}'.format(key, line))
+            await reader.readexactly(int(line.split()[3]) + 2)
+
+    async def setup(self, reader, writer):
+        '''Store every key, so that gets are hits.'''
+        for key in self.keys:
+            await self.set(reader, writer, key)
+
+    async def request(self, reader, writer):
+        key = self.rng.choice(self.keys)
+        if self.get_ratio >= 1 or self.rng.random() < self.get_ratio:
+            await self.get(reader, writer, key)
+        else:
+            await self.set(reader, writer, key)
+        return True
+
+
+ADAPTERS = {
+    'http': HttpAdapter,
+    'redis': RedisAdapter,
+    'memcached': MemcachedAdapter,
+}
+
+# errors of a request which close the connection
+REQUEST_ERRORS = (OSError, EOFError, ValueError, ProtocolError,
+    asyncio.IncompleteReadError)
+
+
+def make_adapter(protocol, **options):
+    return ADAPTERS[protocol](**options)
+
+
+def split_shares(total, parts):
+    '''Split *total* connections as evenly as possible into *parts*.'''
+    return [total // parts + (1 if i < total % parts else 0)
+        for i in range(parts)]
+
+
+def run_loop(coroutine):
+    '''Run *coroutine* in a new event loop and return its result.'''
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def setup(host, port, adapter):
+    '''Run :py:meth:`setup` of *adapter* on a new connection.'''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await adapter.setup(reader, writer)
+    finally:
+        writer.close()
+
+
+async def closed_loop(host, port, adapter, connections, warmup, duration):
+    '''Closed-loop load on *connections* connections; a connection which
+    fails or is closed by the server is reopened.
+
+    Returns:
+        tuple: ``(requests, errors, latencies)`` of the measured part, the
+        latencies in seconds
+    '''
+    # pylint: disable=too-many-arguments
+    loop = asyncio.get_event_loop()
+    measure_from = loop.time() + warmup
+    deadline = measure_from + duration
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        writer = None
+        while loop.time() < deadline:
+            keep_alive = False
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                now = loop.time()
+                keep_alive = await adapter.request(reader, writer)
+                if now >= measure_from:
+                    latencies.append(loop.time() - now)
+            except REQUEST_ERRORS:
+                if loop.time() >= measure_from:
+                    errors += 1
+                await asyncio.sleep(0.01)
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return len(latencies), errors, latencies
+
+
+def _pin(cpus):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+
+def client_pool(processes):
+    '''Return a :py:class:`multiprocessing.Pool` of *processes* client
+    processes pinned to the client CPUs (see :py:func:`benchlib.get_cpus`).
+    '''
+    return multiprocessing.Pool(processes, initializer=_pin,
+        initargs=(benchlib.get_cpus('client'),))
+
+
+def client_process(params):
+    '''Run :py:func:`closed_loop` in a client process of a pool; return
+    its result and the CPU utilization of the process.'''
+    host, port, protocol, options, connections, warmup, duration, seed = \
+        params
+    adapter = make_adapter(protocol, seed=seed, **options)
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = run_loop(closed_loop(host, port, adapter, connections, warmup,
+        duration))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return result + (cpu / wall if wall else None,)
+
+
+def run_closed_loop(pool, targets, protocol, options, *, warmup, duration):
+    '''Run a closed-loop load from the processes of *pool*.
+
+    Args:
+        pool (multiprocessing.Pool): the client processes
+        targets (list): ``(host, port, connections)`` of every client
+            process
+        protocol (str): key of :py:data:`ADAPTERS`
+        options (dict): keyword arguments of the adapter
+        warmup (float): unmeasured seconds before the measurement
+        duration (float): measured seconds
+
+    Returns:
+        dict: ``requests``, ``errors`` and ``latencies`` (in seconds) of all
+        processes, and ``client_cpu``, the CPU utilization of every process
+        (1.0 is one busy CPU)
+    '''
+    # pylint: disable=too-many-arguments
+    params = [(host, port, protocol, options, connections, warmup, duration,
+        seed) for seed, (host, port, connections) in enumerate(targets)]
+    result = {'requests': 0, 'errors': 0, 'latencies': [], 'client_cpu': []}
+    for requests, errors, latencies, cpu in pool.map(client_process, params):
+        result['requests'] += requests
+        result['errors'] += errors
+        result['latencies'].extend(latencies)
+        result['client_cpu'].append(cpu)
+    return result
+
+
+def client_saturated(client_cpu):
+    '''Return whether the client processes with the utilizations
+    *client_cpu* (see :py:func:`run_closed_loop`) may have limited the load:
+    one of them, or the client CPUs as a whole, were busy.'''
+    cpus = benchlib.get_cpus('client') or os.sched_getaffinity(0)
+    client_cpu = [cpu for cpu in client_cpu if cpu is not None]
+    return bool(client_cpu) and (max(client_cpu) > SATURATION
+        or sum(client_cpu) > SATURATION * len(cpus))
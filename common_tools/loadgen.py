@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+
+'''
+Open-loop load generator for the TCP services of the application samples.
+
+Closed-loop tools (``ab``, ``redis-benchmark``) send the next request only
+after the previous one was answered, so while the server stalls they send
+nothing and the stall shows up in one sample only (*coordinated omission*).
+This generator sends requests at a fixed target rate (evenly spaced or with
+Poisson arrivals) regardless of the answers, over a pool of connections;
+requests wait in a queue when all connections are busy. The latency of a
+request is measured from the time it was *supposed* to be sent, which
+includes the time it waited, and recorded in an HdrHistogram-style
+log-linear histogram; the service time (from the actual send) is recorded
+separately.
+
+Protocols: HTTP/1.1 (``GET``), redis (RESP ``GET``/``SET``) and memcached
+(text ``get``/``set``), with the adapters of loadclients.py. The server is
+either started by the generator for every mode, or an already running
+server is loaded::
+
+    ./loadgen.py --app nginx -m native -m graphene --rates 1000,2000,4000
+    ./loadgen.py --app redis -m sgx --rates 5000,10000 --command set
+    ./loadgen.py --connect 127.0.0.1:8003 --protocol http --path /index.html
+
+For every rate, the report shows the achieved throughput and the latency
+percentiles, i.e. latency-vs-offered-load curves.
+
+The generator is a single asyncio process, so it can fall behind its own
+schedule; that *dispatch lag* is part of the measured latency, but not of
+the server. A rate whose p99 dispatch lag exceeds ``--max-lag`` times the
+p99 latency is marked invalid, since its latency is largely the
+generator's.
+'''
+
+import argparse
+import asyncio
+import collections
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchlib  # pylint: disable=wrong-import-position
+import loadclients  # pylint: disable=wrong-import-position
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PERCENTILES = (50, 90, 99, 99.9, 99.99)
+
+NGINX_CONFIG = '''\
+# Generated by loadgen.py
+worker_processes {workers};
+daemon off;
+pid logs/loadgen.pid;
+
+events {{
+    worker_connections 1024;
+}}
+
+http {{
+    include ../mime.types;
+    access_log off;
+    keepalive_requests 1000000;
+    server {{
+        listen 127.0.0.1:{port};
+        location / {{
+            root html;
+        }}
+    }}
+}}
+'''
+
+
+class Histogram:
+    '''Latency histogram with a bounded relative error, in the spirit of
+    HdrHistogram: values (integers, here microseconds) below
+    ``2 * 10**significant_figures`` are counted exactly, larger ones in
+    buckets whose width doubles with every power of two.
+
+    Args:
+        significant_figures (int): decimal digits of precision
+    '''
+
+    def __init__(self, significant_figures=3):
+        self.bits = (2 * 10 ** significant_figures - 1).bit_length()
+        self.counts = collections.Counter()
+        self.total = 0
+        self.max = 0
+
+    def _key(self, value):
+        shift = max(0, value.bit_length() - self.bits)
+        return (value >> shift) << shift, shift
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        self.counts[self._key(value)[0]] += count
+        self.total += count
+        self.max = max(self.max, value)
+
+    def percentile(self, percentile):
+        '''Return the value at *percentile* (0-100); the middle of its
+        bucket.'''
+        if not self.total:
+            return None
+        rank = max(1, int(round(percentile / 100 * self.total)))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                _, shift = self._key(key)
+                return min(key + ((1 << shift) >> 1), self.max)
+        return self.max
+
+    def summary(self, scale=1e-3):
+        '''Return the percentiles and the maximum, multiplied by *scale*
+        (by default microseconds to milliseconds).'''
+        if not self.total:
+            return {}
+        result = {'p{:g}'.format(percentile):
+            self.percentile(percentile) * scale for percentile in PERCENTILES}
+        result['max'] = self.max * scale
+        return result
+
+
+def nginx_argv(port):
+    conf = os.path.join('conf', 'bench', 'loadgen.conf')
+    path = os.path.join(ROOT, 'nginx', 'install', conf)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(NGINX_CONFIG.format(port=port, workers=1))
+    return ['install/sbin/nginx', '-c', conf]
+
+
+def apache_argv(port):
+    pidfile = 'logs/httpd-loadgen.pid'
+    path = os.path.join(ROOT, 'apache', 'install', pidfile)
+    if os.path.exists(path):
+        os.unlink(path)
+    return ['install/bin/httpd', '-D', 'FOREGROUND',
+        '-f', 'conf/httpd-graphene.conf',
+        '-C', 'LoadModule mpm_worker_module modules/mod_mpm_worker.so',
+        '-C', 'Listen 127.0.0.1:{}'.format(port),
+        '-C', 'ServerName 127.0.0.1', '-C', 'PidFile ' + pidfile]
+
+
+# application: directory, manifest, function port -> native argv, protocol,
+# default port (None: the port is fixed by the configuration of the app)
+SERVERS = {
+    'apache': ('apache', 'httpd.manifest', apache_argv, 'http', 8001),
+    'lighttpd': ('lighttpd', 'lighttpd.manifest', lambda port: [
+        'install/sbin/lighttpd', '-D', '-m', 'install/lib', '-f',
+        'lighttpd.conf'], 'http', None),
+    'memcached': ('memcached', 'memcached', lambda port: ['./memcached',
+        '-u', 'nobody', '-p', str(port), '-t', '4'], 'memcached', 11211),
+    'nginx': ('nginx', 'nginx.manifest', nginx_argv, 'http', 8002),
+    'python-simple': ('python-simple', 'python.manifest', lambda port: [
+        'python3', 'scripts/dummy-web-server.py', str(port)], 'http', 8005),
+    'redis': ('redis', 'redis-server.manifest', lambda port: [
+        './redis-server', '--port', str(port), '--protected-mode', 'no',
+        '--save', '', '--appendonly', 'no'], 'redis', 6379),
+}
+# the port lighttpd.conf is generated with
+LIGHTTPD_PORT = 8003
+
+
+class OpenLoop:
+    '''One run at a fixed rate; see the module docstring.'''
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, args, adapter, rate):
+        self.args = args
+        self.adapter = adapter
+        self.rate = rate
+        self.latency = Histogram()
+        self.service = Histogram()
+        self.lag = Histogram()
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.measure_start = None
+        self.measure_end = None
+
+    async def connect(self):
+        return await asyncio.open_connection(self.args.host, self.args.port)
+
+    async def worker(self, queue, loop):
+        reader, writer = await self.connect()
+        try:
+            while True:
+                intended = await queue.get()
+                if intended is None:
+                    return
+                sent = loop.time()
+                measured = self.measure_start <= intended < self.measure_end
+                try:
+                    keep_alive = await asyncio.wait_for(
+                        self.adapter.request(reader, writer),
+                        self.args.timeout)
+                except asyncio.TimeoutError:
+                    keep_alive = False
+                    if measured:
+                        self.timeouts += 1
+                except loadclients.REQUEST_ERRORS:
+                    keep_alive = False
+                    if measured:
+                        self.errors += 1
+                else:
+                    if measured:
+                        done = loop.time()
+                        self.completed += 1
+                        self.latency.record((done - intended) * 1e6)
+                        self.service.record((done - sent) * 1e6)
+                if not keep_alive:
+                    writer.close()
+                    reader, writer = await self.connect()
+        finally:
+            writer.close()
+
+    async def dispatch(self, queue, loop, start):
+        '''Put the intended send times into the queue at the target rate.'''
+        interval = 1 / self.rate
+        intended = start
+        while intended < self.measure_end:
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if intended >= self.measure_start:
+                self.lag.record(max(0, loop.time() - intended) * 1e6)
+            queue.put_nowait(intended)
+            if self.args.arrival == 'poisson':
+                intended += random.expovariate(self.rate)
+            else:
+                intended += interval
+        for _ in range(self.args.connections):
+            queue.put_nowait(None)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        reader, writer = await self.connect()
+        try:
+            await self.adapter.setup(reader, writer)
+        finally:
+            writer.close()
+
+        queue = asyncio.Queue()
+        start = loop.time() + 0.1
+        self.measure_start = start + self.args.warmup
+        self.measure_end = self.measure_start + self.args.duration
+        workers = [asyncio.ensure_future(self.worker(queue, loop))
+            for _ in range(self.args.connections)]
+        await self.dispatch(queue, loop, start)
+        done, pending = await asyncio.wait(workers,
+            timeout=self.args.timeout + self.args.duration)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+        # requests which were never sent because the server fell behind
+        dropped = sum(1 for _ in range(queue.qsize())
+            if queue.get_nowait() is not None)
+        return self.result(dropped)
+
+    def result(self, dropped):
+        latency = self.latency.summary()
+        lag = self.lag.summary()
+        # the latency is mostly the generator's own when it dispatches late
+        valid = not (latency and lag
+            and lag['p99'] > self.args.max_lag * latency['p99'])
+        return {
+            'rate': self.rate,
+            'throughput': self.completed / self.args.duration,
+            'completed': self.completed,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'dropped': dropped,
+            'latency_ms': latency,
+            'service_time_ms': self.service.summary(),
+            # how late the generator itself sent requests
+            'dispatch_lag_ms': lag,
+            'valid': valid,
+        }
+
+
+def make_adapter(args):
+    if args.protocol == 'http':
+        return loadclients.make_adapter('http', path=args.path,
+            host=args.host)
+    if args.protocol == 'redis':
+        return loadclients.make_adapter('redis', command=args.command,
+            key=args.key, value_size=args.value_size)
+    return loadclients.make_adapter('memcached', key=args.key,
+        get_ratio=1.0 if args.command == 'get' else 0.0,
+        value_size=args.value_size)
+
+
+def run_rates(args, mode):
+    adapter = make_adapter(args)
+    rows = []
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        for rate in benchlib.parse_list(args.rates):
+            row = loop.run_until_complete(OpenLoop(args, adapter, rate).run())
+            row['mode'] = mode
+            rows.append(row)
+            latency = row['latency_ms']
+            print('  {}/s: {:.0f}/s completed, p99 {} ms, {} errors, '
+                '{} timeouts, {} dropped'.format(rate, row['throughput'],
+                    format(latency['p99'], '.2f') if latency else '-',
+                    row['errors'], row['timeouts'], row['dropped']),
+                file=sys.stderr)
+            if not row['valid']:
+                print('  invalid: the p99 dispatch lag of the generator is '
+                    '{:.2f} ms, more than {:g} of the p99 latency'.format(
+                        row['dispatch_lag_ms']['p99'], args.max_lag),
+                    file=sys.stderr)
+            if args.stop_latency is not None and (not latency
+                    or latency['p99'] > args.stop_latency):
+                print('  stopping: p99 above {} ms'.format(args.stop_latency),
+                    file=sys.stderr)
+                break
+    finally:
+        loop.close()
+    return rows
+
+
+def run_mode(args, mode):
+    directory, manifest, make_argv, _, _ = SERVERS[args.app]
+    argv, env = benchlib.command_for(mode, make_argv(args.port), manifest,
+        loader=args.loader)
+    print('starting {} ({}): {}'.format(args.app, mode, ' '.join(argv)),
+        file=sys.stderr)
+    with benchlib.Server(argv, env=env, host=args.host, port=args.port,
+            cwd=os.path.join(ROOT, directory), log=args.server_log) as server:
+        print('  ready after {:.2f} s'.format(server.ready_time),
+            file=sys.stderr)
+        return run_rates(args, mode)
+
+
+argparser = argparse.ArgumentParser()
+target = argparser.add_mutually_exclusive_group(required=True)
+target.add_argument('--app', choices=sorted(SERVERS),
+    help='start this server in every mode')
+target.add_argument('--connect', metavar='HOST:PORT',
+    help='load a running server')
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--port', '-p', metavar='PORT', type=int,
+    help='port of the started server (default: depends on the application)')
+argparser.add_argument('--protocol', choices=sorted(loadclients.ADAPTERS),
+    help='protocol (default: depends on the application; required with '
+        '--connect)')
+argparser.add_argument('--rates', '-r', metavar='N,...',
+    default='1000,2000,5000,10000',
+    help='target request rates per second (default: %(default)s)')
+argparser.add_argument('--arrival', choices=('uniform', 'poisson'),
+    default='uniform',
+    help='evenly spaced or exponentially distributed inter-arrival times '
+        '(default: %(default)s)')
+argparser.add_argument('--connections', '-c', metavar='N', type=int,
+    default=16, help='connections, i.e. the maximum of outstanding requests '
+        '(default: %(default)s)')
+argparser.add_argument('--duration', '-d', metavar='SECONDS', type=float,
+    default=10, help='measured duration per rate (default: %(default)s)')
+argparser.add_argument('--warmup', metavar='SECONDS', type=float, default=2,
+    help='unmeasured load before every rate (default: %(default)s)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=10, help='timeout of a request (default: %(default)s)')
+argparser.add_argument('--stop-latency', metavar='MS', type=float,
+    help='do not try higher rates once the p99 latency exceeds this')
+argparser.add_argument('--max-lag', metavar='FRACTION', type=float,
+    default=0.1, help='mark a rate invalid if the p99 dispatch lag exceeds '
+        'this fraction of the p99 latency (default: %(default)s)')
+argparser.add_argument('--path', default='/',
+    help='HTTP path (default: %(default)s)')
+argparser.add_argument('--command', choices=('get', 'set'), default='get',
+    help='redis/memcached command (default: %(default)s)')
+argparser.add_argument('--key', default='loadgen',
+    help='redis/memcached key (default: %(default)s)')
+argparser.add_argument('--value-size', metavar='BYTES', type=int,
+    default=100, help='redis/memcached value size (default: %(default)s)')
+argparser.add_argument('--server-log', metavar='FILENAME',
+    help='append the output of the server to this file')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    if args.connect:
+        args.host, _, port = args.connect.rpartition(':')
+        args.port = int(port)
+        if args.protocol is None:
+            argparser.error('--protocol is required with --connect')
+        modes = ['-']
+    else:
+        args.host = '127.0.0.1'
+        _, _, _, protocol, port = SERVERS[args.app]
+        args.protocol = args.protocol or protocol
+        if port is None:
+            if args.port not in (None, LIGHTTPD_PORT):
+                argparser.error('the port of {} is fixed to {}'.format(
+                    args.app, LIGHTTPD_PORT))
+            port = LIGHTTPD_PORT
+        args.port = args.port or port
+        modes = benchlib.get_modes(args)
+
+    rows = []
+    for mode in modes:
+        if args.connect:
+            print('loading {}:'.format(args.connect), file=sys.stderr)
+            rows.extend(run_rates(args, mode))
+        else:
+            rows.extend(run_mode(args, mode))
+
+    native = {row['rate']: row for row in rows if row['mode'] == 'native'}
+    table = []
+    for row in rows:
+        line = dict(row, **{'latency_' + key: value
+            for key, value in row['latency_ms'].items()})
+        line['service_p99'] = row['service_time_ms'].get('p99')
+        line['lag_p99'] = row['dispatch_lag_ms'].get('p99')
+        line['status'] = '' if row['valid'] else 'invalid'
+        ref = native.get(row['rate'])
+        if ref and ref['latency_ms'] and row['latency_ms']:
+            line['slowdown'] = row['latency_ms']['p99'] / \
+                ref['latency_ms']['p99']
+        table.append(line)
+    benchlib.print_table(table, [
+        ('mode', 'mode'),
+        ('rate', 'rate [1/s]'),
+        ('throughput', 'done [1/s]', '.0f'),
+        ('latency_p50', 'p50 [ms]', '.2f'),
+        ('latency_p90', 'p90 [ms]', '.2f'),
+        ('latency_p99', 'p99 [ms]', '.2f'),
+        ('latency_p99.9', 'p99.9 [ms]', '.2f'),
+        ('latency_max', 'max [ms]', '.2f'),
+        ('service_p99', 'svc p99 [ms]', '.2f'),
+        ('lag_p99', 'lag p99 [ms]', '.2f'),
+        ('slowdown', 'p99 x native', '.2f'),
+        ('errors', 'errors'),
+        ('timeouts', 'timeouts'),
+        ('dropped', 'dropped'),
+        ('status', 'status'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'loadgen',
+        'host': benchlib.host_info(),
+        'target': args.app or args.connect,
+        'protocol': args.protocol,
+        'arrival': args.arrival,
+        'connections': args.connections,
+        'results': rows,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+
+'''
+Sweep manifest settings of an application against one of its workloads.
+
+For every combination of the given knobs, the settings are written into the
+manifest templates of the application, the manifests are regenerated (and
+signed) by its Makefile and the workload of its benchmark suite plugin (see
+suiteplugins.py) is run ``--repeat`` times. The report lists the median of
+the chosen metric and the memory footprint of every combination and marks
+the Pareto front, i.e. the combinations for which no other combination is
+both faster and smaller::
+
+    ./manifest-tune.py redis -m sgx --metric rps --section results \\
+        --knob sgx.enclave_size=256M,512M,1G --knob sgx.thread_num=4,8,16 \\
+        --knob sgx.preheat_enclave=0,1 --args="--clients 50 --pipeline 1"
+
+The footprint is the size of the enclave under SGX (all of it is committed to
+the EPC when the enclave is built) and otherwise the peak RSS of the server,
+i.e. the summed RSS of the process groups of the servers the workload starts
+(benchlib.Server runs them in sessions of their own), sampled every
+``--interval`` seconds; load generators, drivers and client pools are not
+counted. Workloads without a server (e.g. busybox) count all their
+processes. A combination whose workload fails, or whose first
+run reaches less than ``--prune`` times the best value so far, is not
+repeated. The templates are restored and the manifests rebuilt at the end.
+'''
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import re
+import statistics
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchlib  # pylint: disable=wrong-import-position
+import suiteplugins  # pylint: disable=wrong-import-position
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Graphene's default when a manifest does not set it
+DEFAULT_ENCLAVE_SIZE = '256M'
+
+
+def set_knobs(text, knobs):
+    '''Return the manifest (template) *text* with the *knobs* set, replacing
+    existing settings or appending new ones.'''
+    for key, value in knobs.items():
+        line = '{} = {}'.format(key, value)
+        pattern = re.compile(r'^{}\s*=.*$'.format(re.escape(key)), re.M)
+        if pattern.search(text):
+            text = pattern.sub(lambda match, line=line: line, text)
+        else:
+            text = text.rstrip('\n') + '\n' + line + '\n'
+    return text
+
+
+def get_setting(text, key):
+    match = re.search(r'^{}\s*=\s*(\S+)'.format(re.escape(key)), text, re.M)
+    return match.group(1) if match else None
+
+
+class ServerMemory(threading.Thread):
+    '''Samples the RSS of the servers started by the descendants of the
+    process *root* every *interval* seconds and keeps the peak.
+
+    A server is a descendant which leads a session of its own; its RSS is
+    that of all processes of its process group (e.g. with the Graphene
+    helper processes). If no server is seen during the whole run, all
+    descendants are counted.
+    '''
+
+    def __init__(self, root, interval):
+        super().__init__(daemon=True)
+        self.root = root
+        self.interval = interval
+        self.max_server_rss = None
+        self.max_descendants_rss = 0
+        self._stop_event = threading.Event()
+
+    @property
+    def max_rss(self):
+        if self.max_server_rss is not None:
+            return self.max_server_rss
+        return self.max_descendants_rss
+
+    def sample(self):
+        table = benchlib.process_table()
+        children = {}
+        for pid, (ppid, _, _) in table.items():
+            children.setdefault(ppid, []).append(pid)
+        descendants = []
+        pending = list(children.get(self.root, []))
+        while pending:
+            pid = pending.pop()
+            descendants.append(pid)
+            pending.extend(children.get(pid, []))
+        root_session = table.get(self.root, (0, 0, 0))[2]
+        servers = {pid for pid in descendants
+            if table[pid][2] == pid != root_session}
+        if servers:
+            rss = sum(benchlib.process_memory(pid)[0]
+                for pid, (_, pgrp, _) in table.items() if pgrp in servers)
+            self.max_server_rss = max(self.max_server_rss or 0, rss)
+        rss = sum(benchlib.process_memory(pid)[0] for pid in descendants)
+        self.max_descendants_rss = max(self.max_descendants_rss, rss)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_trial(name, mode, directory, extra_args, timeout, log_path,
+        interval):
+    '''Run the workload of plugin *name* once; return ``(rows, max_rss)``
+    with *max_rss* in bytes (see :py:class:`ServerMemory`).
+
+    This runs in a child process of its own, so that the processes of the
+    workload are the descendants of this process only.
+    '''
+    # pylint: disable=too-many-arguments
+    plugin = suiteplugins.get_plugin(name)
+    sampler = ServerMemory(os.getpid(), interval)
+    sampler.start()
+    try:
+        with open(log_path, 'a') as log:
+            ctx = suiteplugins.Context(directory, log=log,
+                extra_args=extra_args, repeat=1, timeout=timeout)
+            handle = plugin.start(ctx, mode)
+            try:
+                plugin.ready(ctx, handle)
+                raw = plugin.load(ctx, mode, handle)
+                rows = plugin.measure(ctx, mode, raw)
+            finally:
+                plugin.teardown(ctx, handle)
+    finally:
+        sampler.stop()
+    return rows, sampler.max_rss
+
+
+def select_metric(rows, metric, section=None):
+    '''Return the geometric mean of *metric* over the result rows (e.g. one
+    row per concurrency), or :py:obj:`None` if no row has it.'''
+    values = [row['metrics'][metric] for row in rows
+        if metric in row['metrics']
+        and (section is None or row['section'] == section)]
+    if not values or any(value <= 0 for value in values):
+        return None
+    return math.exp(sum(math.log(value) for value in values) / len(values))
+
+
+def pareto_front(points, *, higher_is_better=True):
+    '''Return the indices of the non-dominated ``(score, footprint)``
+    points.'''
+    front = []
+    for i, (score, footprint) in enumerate(points):
+        dominated = False
+        for j, (other, other_footprint) in enumerate(points):
+            if i == j:
+                continue
+            better = other >= score if higher_is_better else other <= score
+            if (better and other_footprint <= footprint
+                    and (other, other_footprint) != (score, footprint)):
+                dominated = True
+                break
+        if not dominated:
+            front.append(i)
+    return front
+
+
+class Tuner:
+    '''Sweeps the knobs of one application; see the module docstring.'''
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, args, plugin, templates, log_path):
+        self.args = args
+        self.plugin = plugin
+        self.directory = os.path.join(ROOT, plugin.directory)
+        self.templates = templates
+        self.log_path = log_path
+        self.originals = {}
+        for path in templates:
+            with open(path) as file:
+                self.originals[path] = file.read()
+        self.best = None
+
+    def build(self, knobs):
+        for path, text in self.originals.items():
+            with open(path, 'w') as file:
+                file.write(set_knobs(text, knobs))
+        with open(self.log_path, 'a') as log:
+            ctx = suiteplugins.Context(self.directory, log=log,
+                timeout=self.args.timeout)
+            self.plugin.build(ctx, self.args.mode)
+
+    def restore(self):
+        for path, text in self.originals.items():
+            with open(path, 'w') as file:
+                file.write(text)
+        with open(self.log_path, 'a') as log:
+            ctx = suiteplugins.Context(self.directory, log=log,
+                timeout=self.args.timeout)
+            try:
+                self.plugin.build(ctx, self.args.mode)
+            except RuntimeError as e:
+                print('rebuilding the manifests failed ({}), see {}'.format(
+                    e, self.log_path), file=sys.stderr)
+
+    def trial(self):
+        '''Run the workload once in a fresh process; return
+        ``(score, max_rss)``, with *score* :py:obj:`None` on failure.'''
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                mp_context=context) as executor:
+            rows, max_rss = executor.submit(run_trial, self.plugin.name,
+                self.args.mode, self.directory, self.args.args,
+                self.args.timeout, self.log_path,
+                self.args.interval).result()
+        returncodes = [row['metrics']['returncode'] for row in rows
+            if 'returncode' in row['metrics']]
+        failed = [row['metrics']['failed'] for row in rows
+            if 'failed' in row['metrics']]
+        if any(returncodes) or any(failed):
+            return None, max_rss
+        return select_metric(rows, self.args.metric, self.args.section), \
+            max_rss
+
+    def worse(self, score, factor):
+        if self.best is None:
+            return False
+        if self.args.lower_is_better:
+            return score > self.best / factor
+        return score < self.best * factor
+
+    def evaluate(self, knobs):
+        '''Build and measure one combination; return its result record.'''
+        record = {'knobs': knobs, 'status': 'ok', 'scores': [],
+            'max_rss': []}
+        try:
+            self.build(knobs)
+        except RuntimeError as e:
+            record.update(status='build failed', error=str(e),
+                max_rss=None, footprint=None)
+            return record
+
+        enclave_size = knobs.get('sgx.enclave_size')
+        if enclave_size is None:
+            enclave_size = max((get_setting(text, 'sgx.enclave_size')
+                or DEFAULT_ENCLAVE_SIZE for text in self.originals.values()),
+                key=benchlib.parse_size)
+        record['enclave_size'] = benchlib.parse_size(enclave_size)
+
+        for i in range(self.args.repeat):
+            try:
+                score, max_rss = self.trial()
+            except Exception as e:  # pylint: disable=broad-except
+                record.update(status='failed', error=str(e))
+                break
+            record['max_rss'].append(max_rss)
+            if score is None:
+                record['status'] = 'failed'
+                break
+            record['scores'].append(score)
+            if i == 0 and self.worse(score, self.args.prune):
+                record['status'] = 'pruned'
+                break
+
+        if record['scores']:
+            record['score'] = statistics.median(record['scores'])
+            if record['status'] == 'ok' and not self.worse(record['score'],
+                    1):
+                self.best = record['score']
+        if record['max_rss']:
+            record['max_rss'] = max(record['max_rss'])
+        else:
+            record['max_rss'] = None
+        record['footprint'] = (record['enclave_size']
+            if self.args.footprint == 'enclave' else record['max_rss'])
+        return record
+
+
+def parse_knob(value):
+    key, sep, values = value.partition('=')
+    if not sep or not values:
+        raise argparse.ArgumentTypeError(
+            'expected KEY=VALUE[,VALUE...], got {!r}'.format(value))
+    return key.strip(), benchlib.parse_list(values, str)
+
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('app', metavar='APP',
+    help='application (benchmark suite plugin, see "benchsuite.py list")')
+argparser.add_argument('--mode', '-m', choices=('graphene', 'sgx'),
+    default='sgx', help='mode to tune (default: %(default)s)')
+argparser.add_argument('--template', '-t', metavar='FILENAME',
+    action='append', default=[],
+    help='manifest template to change, relative to the application '
+        'directory (default: all of them); may be given multiple times')
+argparser.add_argument('--knob', '-k', metavar='KEY=VALUE[,VALUE...]',
+    type=parse_knob, action='append', default=[],
+    help='manifest setting and its values to try, e.g. '
+        'sys.brk.size=32M,64M; may be given multiple times')
+argparser.add_argument('--space', metavar='FILENAME',
+    help='JSON file with the search space, e.g. '
+        '{"sgx.thread_num": [4, 8, 16]}, in addition to --knob')
+argparser.add_argument('--metric', required=True,
+    help='metric of the workload, e.g. requests_per_sec or wall_time.mean '
+        '(see "benchsuite.py show"); the geometric mean over the result '
+        'rows is used')
+argparser.add_argument('--section', metavar='NAME',
+    help='only use the metric from this section of the results')
+argparser.add_argument('--lower-is-better', action='store_true',
+    help='the metric is e.g. a time, not a throughput')
+argparser.add_argument('--footprint', choices=('enclave', 'rss'),
+    help='memory footprint to trade off against (default: enclave under '
+        'SGX, rss otherwise)')
+argparser.add_argument('--interval', metavar='SECONDS', type=float,
+    default=0.1, help='RSS sampling interval (default: %(default)s)')
+argparser.add_argument('--args', metavar='ARGS', type=str.split, default=[],
+    help='additional arguments of the workload (driver), as one string')
+argparser.add_argument('--repeat', '-r', metavar='N', type=int, default=3,
+    help='runs per combination (default: %(default)s)')
+argparser.add_argument('--prune', metavar='FACTOR', type=float, default=0.5,
+    help='do not repeat a combination whose first run reaches less than '
+        'FACTOR times the best median so far (default: %(default)s)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout of a build or run (default: %(default)s)')
+argparser.add_argument('--log', metavar='FILENAME',
+    help='log of the builds and runs (default: tune-<app>.log in the '
+        'application directory)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+
+
+def main(args=None):
+    # pylint: disable=too-many-locals
+    args = argparser.parse_args(args)
+    try:
+        plugin = suiteplugins.get_plugin(args.app)
+    except KeyError as e:
+        argparser.error(e.args[0])
+    if args.mode not in plugin.modes:
+        argparser.error('{} does not run in mode {}'.format(args.app,
+            args.mode))
+    if args.footprint is None:
+        args.footprint = 'enclave' if args.mode == 'sgx' else 'rss'
+
+    space = {}
+    if args.space:
+        with open(args.space) as file:
+            space.update((key, [str(value) for value in values])
+                for key, values in json.load(file).items())
+    space.update(args.knob)
+    if not space:
+        argparser.error('no knobs given (--knob or --space)')
+
+    directory = os.path.join(ROOT, plugin.directory)
+    templates = [os.path.join(directory, name) for name in args.template] or [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.endswith('manifest.template')]
+    if not templates:
+        argparser.error('no manifest templates in {}'.format(directory))
+    log_path = args.log or os.path.join(directory,
+        'tune-{}.log'.format(args.app))
+
+    keys = sorted(space)
+    combinations = [dict(zip(keys, values))
+        for values in itertools.product(*(space[key] for key in keys))]
+    print('{} combinations of {}, log file: {}'.format(len(combinations),
+        ', '.join(keys), log_path), file=sys.stderr)
+
+    tuner = Tuner(args, plugin, templates, log_path)
+    records = []
+    try:
+        for i, knobs in enumerate(combinations, 1):
+            print('[{}/{}] {}'.format(i, len(combinations), ' '.join(
+                '{}={}'.format(key, value) for key, value in knobs.items())),
+                file=sys.stderr)
+            record = tuner.evaluate(knobs)
+            print('  -> {} {}'.format(record['status'],
+                format(record['score'], '.6g') if 'score' in record else ''),
+                file=sys.stderr)
+            records.append(record)
+    finally:
+        print('restoring the manifest templates', file=sys.stderr)
+        tuner.restore()
+
+    candidates = [i for i, record in enumerate(records)
+        if record['status'] == 'ok' and record['footprint'] is not None]
+    front = pareto_front([(records[i]['score'], records[i]['footprint'])
+        for i in candidates], higher_is_better=not args.lower_is_better)
+    for i in front:
+        records[candidates[i]]['pareto'] = True
+
+    rows = []
+    for record in records:
+        row = dict(record['knobs'])
+        row.update(status=record['status'], score=record.get('score'),
+            pareto='*' if record.get('pareto') else '')
+        if record['footprint'] is not None:
+            row['footprint'] = record['footprint'] / (1 << 20)
+        rows.append(row)
+    benchlib.print_table(rows, [(key, key) for key in keys] + [
+        ('status', 'status'),
+        ('score', args.metric, '.6g'),
+        ('footprint', '{} [MiB]'.format(args.footprint), '.0f'),
+        ('pareto', 'pareto'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'manifest-tune',
+        'host': benchlib.host_info(),
+        'app': args.app,
+        'mode': args.mode,
+        'metric': args.metric,
+        'lower_is_better': args.lower_is_better,
+        'footprint': args.footprint,
+        'space': space,
+        'results': records,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0 if front else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
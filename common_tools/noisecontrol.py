@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+
+'''
+Noise control for benchmark runs: CPU pinning, host state checks, interleaved
+runs and repeat-until-confidence statistics.
+
+Overheads of a few percent are easily drowned by the host: the frequency
+governor and turbo boost change the clock speed, the load generator competes
+with the server for the same cores and the machine drifts (warms up, runs
+cron jobs) while one mode after the other is measured. This module
+
+* splits the CPUs into disjoint sets for the workload and for the load
+  generators, keeping hyperthread siblings together; the drivers pin their
+  processes to them through :py:class:`benchlib.Server` and
+  :py:func:`benchlib.run_capture` (``BENCH_SERVER_CPUS`` and
+  ``BENCH_CLIENT_CPUS``),
+* reads and checks the frequency governors, turbo boost and SMT,
+* runs the variants (e.g. native and Graphene) interleaved, ABAB, so that
+  drift affects all of them alike, and
+* repeats the rounds until the confidence interval of every mean is within
+  the requested relative error.
+
+Any driver which writes a JSON result file can be run like this::
+
+    ./noisecontrol.py state
+    ./noisecontrol.py run -v native -v graphene \\
+        --metric results.0.rps --error 0.02 -- \\
+        ../redis/run-benchmark.py -m {variant} -O {output}
+
+``{variant}``, ``{output}`` (a temporary file) and ``{round}`` in the command
+are replaced for every run. The command itself runs on the client CPUs.
+``runltp_xml.py`` uses the same statistics for its timing mode.
+'''
+
+import argparse
+import json
+import math
+import os
+import re
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchlib  # pylint: disable=wrong-import-position
+
+SYSFS_CPU = '/sys/devices/system/cpu'
+
+# two-sided quantiles of Student's t distribution for 1 to 30 degrees of
+# freedom; larger ones use the expansion in t_quantile()
+T_TABLE = {
+    0.90: (6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833,
+        1.812, 1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729,
+        1.725, 1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699,
+        1.697),
+    0.95: (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+        2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+        2.042),
+    0.99: (63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250,
+        3.169, 3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861,
+        2.845, 2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756,
+        2.750),
+}
+Z_TABLE = {0.90: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+CONFIDENCES = tuple(sorted(T_TABLE))
+
+
+def read_sysfs(path):
+    '''Return the stripped contents of a file below
+    :py:data:`SYSFS_CPU`, or :py:obj:`None`.'''
+    try:
+        with open(os.path.join(SYSFS_CPU, path)) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_cores(cpus):
+    '''Group *cpus* by physical core; return a list of sets.'''
+    cores = []
+    seen = set()
+    for cpu in sorted(cpus):
+        if cpu in seen:
+            continue
+        siblings = read_sysfs(
+            'cpu{}/topology/thread_siblings_list'.format(cpu))
+        core = (benchlib.parse_cpus(siblings) if siblings else set()) & cpus
+        core.add(cpu)
+        seen |= core
+        cores.append(core)
+    return cores
+
+
+def split_cpus(cpus=None, *, server=None):
+    '''Split *cpus* into disjoint sets for the server and the clients.
+
+    Hyperthread siblings stay in the same set. The server gets the last
+    cores, away from CPU 0, which handles most interrupts.
+
+    Args:
+        cpus (set): the CPUs (default: those this process may run on)
+        server (int): the number of cores for the server (default: half)
+
+    Returns:
+        tuple: ``(server_cpus, client_cpus)``
+
+    Raises:
+        ValueError: if there are fewer than two cores
+    '''
+    cpus = set(os.sched_getaffinity(0) if cpus is None else cpus)
+    cores = cpu_cores(cpus)
+    if len(cores) < 2:
+        raise ValueError('cannot split {} core(s) into server and client '
+            'CPUs'.format(len(cores)))
+    if server is None:
+        server = len(cores) // 2
+    server = max(1, min(server, len(cores) - 1))
+    server_cpus = set().union(*cores[-server:])
+    return server_cpus, cpus - server_cpus
+
+
+def system_state():
+    '''Return the frequency governors, turbo boost, SMT and load of the
+    host.'''
+    governors = {}
+    for name in sorted(os.listdir(SYSFS_CPU)):
+        match = re.fullmatch(r'cpu(\d+)', name)
+        if match is None:
+            continue
+        governor = read_sysfs('{}/cpufreq/scaling_governor'.format(name))
+        governors.setdefault(governor or 'unknown', set()).add(
+            int(match.group(1)))
+
+    turbo = None
+    no_turbo = read_sysfs('intel_pstate/no_turbo')
+    boost = read_sysfs('cpufreq/boost')
+    if no_turbo is not None:
+        turbo = no_turbo == '0'
+    elif boost is not None:
+        turbo = boost == '1'
+
+    smt = read_sysfs('smt/active')
+    return {
+        'governors': {governor: benchlib.format_cpus(cpus)
+            for governor, cpus in governors.items()},
+        'scaling_driver': read_sysfs('cpu0/cpufreq/scaling_driver'),
+        'turbo': turbo,
+        'smt': None if smt is None else smt == '1',
+        'isolated': read_sysfs('isolated') or '',
+        'loadavg': os.getloadavg()[0],
+    }
+
+
+def check_state(state, cpus=None):
+    '''Return warnings about the host state which make measurements noisy.
+
+    Args:
+        state (dict): as returned by :py:func:`system_state`
+        cpus (set): the CPUs the benchmark runs on (default: all)
+    '''
+    warnings = []
+    for governor, cpulist in sorted(state['governors'].items()):
+        affected = benchlib.parse_cpus(cpulist)
+        if cpus is not None:
+            affected &= cpus
+        if affected and governor not in ('performance', 'unknown'):
+            warnings.append('CPUs {} use the {} governor, not '
+                'performance'.format(benchlib.format_cpus(affected),
+                    governor))
+    if state['turbo']:
+        warnings.append('turbo boost is enabled; the clock speed depends on '
+            'the temperature and on the load of the other cores')
+    if state['smt'] and cpus is not None:
+        siblings = set()
+        for cpu in cpus:
+            siblings |= benchlib.parse_cpus(read_sysfs(
+                'cpu{}/topology/thread_siblings_list'.format(cpu)) or '')
+        if siblings - cpus:
+            warnings.append('SMT is active and hyperthread siblings of the '
+                'benchmark CPUs are outside of them')
+    if state['loadavg'] > 0.5:
+        warnings.append('load average is {:.2f}; other processes are '
+            'running'.format(state['loadavg']))
+    return warnings
+
+
+def t_quantile(confidence, df):
+    '''Return the two-sided quantile of Student's t distribution.'''
+    if df <= len(T_TABLE[confidence]):
+        return T_TABLE[confidence][df - 1]
+    # Cornish-Fisher expansion around the normal quantile
+    z = Z_TABLE[confidence]
+    return (z + (z ** 3 + z) / (4 * df)
+        + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2))
+
+
+class Samples:
+    '''Repeated measurements of one quantity.
+
+    Args:
+        confidence (float): the confidence level of the intervals, one of
+            :py:data:`CONFIDENCES`
+    '''
+    def __init__(self, confidence=0.95):
+        self.confidence = confidence
+        self.values = []
+
+    def add(self, value):
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def mean(self):
+        return statistics.mean(self.values) if self.values else None
+
+    @property
+    def ci(self):
+        '''The half width of the confidence interval of the mean.'''
+        if len(self.values) < 2:
+            return math.inf
+        return (t_quantile(self.confidence, len(self.values) - 1)
+            * statistics.stdev(self.values) / math.sqrt(len(self.values)))
+
+    @property
+    def relative_error(self):
+        if not self.values or not self.mean:
+            return math.inf
+        return self.ci / abs(self.mean)
+
+    def summary(self):
+        return {
+            'runs': len(self.values),
+            'mean': self.mean,
+            'ci': self.ci if len(self.values) > 1 else None,
+            'relative_error': self.relative_error if len(self.values) > 1
+                else None,
+            'confidence': self.confidence,
+            'values': list(self.values),
+        }
+
+
+class Interleaver:
+    '''Run variants interleaved until their means are precise enough.
+
+    Iterating yields the variant to measure next, round after round in the
+    same order (ABAB...), and stops after a complete round once every
+    variant has at least *min_runs* measurements and a relative error of at
+    most *rel_error*, or after *max_runs* rounds. Every measurement is passed
+    to :py:meth:`add` before the iteration continues::
+
+        interleaver = noisecontrol.Interleaver(['native', 'graphene'])
+        for variant in interleaver:
+            interleaver.add(variant, measure(variant))
+        print(interleaver.result())
+
+    Comparing the variants within a round also gives the paired ratio of
+    every variant to the first one.
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, variants, *, rel_error=0.02, confidence=0.95,
+            min_runs=3, max_runs=30):
+        if confidence not in T_TABLE:
+            raise ValueError('confidence must be one of {}'.format(
+                ', '.join(map(str, CONFIDENCES))))
+        self.variants = list(variants)
+        self.rel_error = rel_error
+        self.min_runs = max(min_runs, 2)
+        self.max_runs = max(max_runs, self.min_runs)
+        self.samples = {variant: Samples(confidence)
+            for variant in self.variants}
+        self.ratios = {variant: Samples(confidence)
+            for variant in self.variants[1:]}
+        self.rounds = 0
+        self._round = {}
+
+    @property
+    def converged(self):
+        return all(len(samples) >= self.min_runs
+            and samples.relative_error <= self.rel_error
+            for samples in self.samples.values())
+
+    @property
+    def done(self):
+        return self.rounds >= self.max_runs or (
+            self.rounds >= self.min_runs and self.converged)
+
+    def __iter__(self):
+        while not self.done:
+            self._round = {}
+            for variant in self.variants:
+                yield variant
+            self.rounds += 1
+            base = self._round.get(self.variants[0])
+            for variant in self.variants[1:]:
+                if base and variant in self._round:
+                    self.ratios[variant].add(self._round[variant] / base)
+
+    def add(self, variant, value):
+        '''Add the measurement of *variant* in the current round.'''
+        self.samples[variant].add(value)
+        self._round[variant] = value
+
+    def result(self):
+        return {
+            'rounds': self.rounds,
+            'converged': self.converged,
+            'variants': {variant: samples.summary()
+                for variant, samples in self.samples.items()},
+            'ratios': {variant: samples.summary()
+                for variant, samples in self.ratios.items()},
+        }
+
+
+def interleave(variants, measure, **kwargs):
+    '''Measure *variants* with ``measure(variant)`` interleaved until
+    confident (see :py:class:`Interleaver`); return the result.'''
+    interleaver = Interleaver(variants, **kwargs)
+    for variant in interleaver:
+        interleaver.add(variant, measure(variant))
+    return interleaver.result()
+
+
+def get_metric(data, path):
+    '''Return the value at a dotted *path* (e.g. ``results.0.rps``) of
+    JSON *data*.'''
+    for key in path.split('.'):
+        if isinstance(data, list):
+            data = data[int(key)]
+        else:
+            data = data[key]
+    return float(data)
+
+
+def run_command(args, variant, rnd):
+    '''Run the command for *variant* once; return its metric.'''
+    with tempfile.TemporaryDirectory(prefix='noisecontrol-') as tmpdir:
+        output = os.path.join(tmpdir, 'result.json')
+        argv = [arg.format(variant=variant, output=output, round=rnd)
+            for arg in args.command]
+        returncode, stdout, stderr, elapsed = benchlib.run_capture(argv,
+            cwd=args.cwd, timeout=args.timeout, role=args.role)
+        if returncode != 0:
+            sys.stderr.write(stderr)
+            raise RuntimeError('{} exited with returncode {}'.format(
+                ' '.join(argv), returncode))
+        if args.pattern:
+            match = re.search(args.pattern, stdout + stderr, re.M)
+            if match is None:
+                raise RuntimeError('{!r} not found in the output'.format(
+                    args.pattern))
+            return float(match.group(1))
+        if args.metric:
+            if any('{output}' in arg for arg in args.command):
+                with open(output) as file:
+                    data = json.load(file)
+            else:
+                data = benchlib.find_json_line(stdout)
+            return get_metric(data, args.metric)
+        return elapsed
+
+
+def print_state(state, warnings, *, file=None):
+    file = sys.stdout if file is None else file
+    for governor, cpulist in sorted(state['governors'].items()):
+        print('governor {}: CPUs {}'.format(governor, cpulist), file=file)
+    for key in ('scaling_driver', 'turbo', 'smt', 'isolated', 'loadavg'):
+        print('{}: {}'.format(key, '-' if state[key] in (None, '')
+            else state[key]), file=file)
+    for warning in warnings:
+        print('WARNING: ' + warning, file=file)
+
+
+def print_result(result, *, file=None):
+    rows = []
+    for variant, summary in result['variants'].items():
+        row = {'variant': variant, 'runs': summary['runs'],
+            'mean': summary['mean'], 'ci': summary['ci'],
+            'relative_error': summary['relative_error']}
+        ratio = result['ratios'].get(variant)
+        if ratio is not None and ratio['runs']:
+            row['ratio'] = ratio['mean']
+            row['ratio_ci'] = ratio['ci']
+        rows.append(row)
+    benchlib.print_table(rows, [
+        ('variant', 'variant'),
+        ('runs', 'runs'),
+        ('mean', 'mean', '.4g'),
+        ('ci', '+-', '.3g'),
+        ('relative_error', 'rel. error', '.2%'),
+        ('ratio', 'ratio', '.4f'),
+        ('ratio_ci', '+-', '.4f'),
+    ], file=file)
+
+
+def cmd_state(args):
+    cpus = benchlib.parse_cpus(args.cpus) if args.cpus else None
+    state = system_state()
+    warnings = check_state(state, cpus)
+    print_state(state, warnings)
+    if args.output:
+        benchlib.write_json(args.output, {
+            'benchmark': 'noisecontrol-state',
+            'host': benchlib.host_info(),
+            'state': state,
+            'warnings': warnings,
+        })
+    return 1 if args.strict and warnings else 0
+
+
+def cmd_run(args):
+    if not args.command:
+        argparser.error('no command given')
+    if args.command[0] == '--':
+        del args.command[0]
+
+    server_cpus = client_cpus = None
+    if args.server_cpus or args.client_cpus:
+        if not (args.server_cpus and args.client_cpus):
+            argparser.error('--server-cpus and --client-cpus go together')
+        server_cpus = benchlib.parse_cpus(args.server_cpus)
+        client_cpus = benchlib.parse_cpus(args.client_cpus)
+        if server_cpus & client_cpus:
+            argparser.error('the server and client CPUs overlap')
+    elif not args.no_pin:
+        try:
+            server_cpus, client_cpus = split_cpus(server=args.server_cores)
+        except ValueError as e:
+            print('not pinning: {}'.format(e), file=sys.stderr)
+    if server_cpus is not None:
+        os.environ[benchlib.SERVER_CPUS_ENV] = benchlib.format_cpus(
+            server_cpus)
+        os.environ[benchlib.CLIENT_CPUS_ENV] = benchlib.format_cpus(
+            client_cpus)
+        print('server CPUs {}, client CPUs {}'.format(
+            os.environ[benchlib.SERVER_CPUS_ENV],
+            os.environ[benchlib.CLIENT_CPUS_ENV]), file=sys.stderr)
+
+    state = system_state()
+    warnings = check_state(state, None if server_cpus is None
+        else server_cpus | client_cpus)
+    for warning in warnings:
+        print('WARNING: ' + warning, file=sys.stderr)
+    if args.strict and warnings:
+        return 1
+
+    interleaver = Interleaver(args.variant or ['native', 'graphene'],
+        rel_error=args.error, confidence=args.confidence,
+        min_runs=args.min_runs, max_runs=args.max_runs)
+    for variant in interleaver:
+        value = run_command(args, variant, interleaver.rounds)
+        print('round {} {}: {:.6g}'.format(interleaver.rounds, variant, value),
+            file=sys.stderr)
+        interleaver.add(variant, value)
+    result = interleaver.result()
+
+    print_result(result)
+    if not result['converged']:
+        print('WARNING: not converged after {} rounds'.format(
+            result['rounds']), file=sys.stderr)
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'noisecontrol',
+        'host': benchlib.host_info(),
+        'state': state,
+        'warnings': warnings,
+        'cpus': {
+            'server': os.environ.get(benchlib.SERVER_CPUS_ENV),
+            'client': os.environ.get(benchlib.CLIENT_CPUS_ENV),
+        },
+        'command': args.command,
+        'metric': args.metric or args.pattern or 'wall time [s]',
+        'result': result,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+argparser = argparse.ArgumentParser()
+subparsers = argparser.add_subparsers(dest='subcommand')
+subparsers.required = True
+
+state_parser = subparsers.add_parser('state',
+    help='show and check the frequency governors, turbo boost and SMT')
+state_parser.set_defaults(func=cmd_state)
+state_parser.add_argument('--cpus', metavar='LIST',
+    help='only check these CPUs (e.g. 0-3,8)')
+
+run_parser = subparsers.add_parser('run',
+    help='run a command for every variant, interleaved, until confident')
+run_parser.set_defaults(func=cmd_run)
+run_parser.add_argument('--variant', '-v', metavar='NAME', action='append',
+    help='a variant, substituted for {variant} in the command; the ratios '
+    'are relative to the first one (default: native, graphene)')
+run_parser.add_argument('--metric', metavar='PATH',
+    help='dotted path of the metric in the JSON result, read from {output} '
+    'if the command has it, else from stdout (default: the wall time of '
+    'the command)')
+run_parser.add_argument('--pattern', metavar='REGEX',
+    help='regular expression whose first group in the output of the '
+    'command is the metric')
+run_parser.add_argument('--server-cpus', metavar='LIST',
+    help='CPUs for the workload (default: half of the cores)')
+run_parser.add_argument('--client-cpus', metavar='LIST',
+    help='CPUs for the load generators and the command itself (default: '
+    'the other cores)')
+run_parser.add_argument('--server-cores', metavar='N', type=int,
+    help='number of cores for the workload when splitting automatically')
+run_parser.add_argument('--no-pin', action='store_true',
+    help='do not pin the processes to CPUs')
+run_parser.add_argument('--role', choices=('client', 'server'),
+    default='client',
+    help='CPUs to run the command on; "server" when the command is the '
+    'workload itself rather than a driver (default: %(default)s)')
+run_parser.add_argument('--error', metavar='FRACTION', type=float,
+    default=0.02,
+    help='target relative half width of the confidence intervals '
+    '(default: %(default)s)')
+run_parser.add_argument('--confidence', type=float, choices=CONFIDENCES,
+    default=0.95, help='confidence level (default: %(default)s)')
+run_parser.add_argument('--min-runs', metavar='N', type=int, default=3,
+    help='minimum rounds (default: %(default)s)')
+run_parser.add_argument('--max-runs', metavar='N', type=int, default=20,
+    help='maximum rounds (default: %(default)s)')
+run_parser.add_argument('--timeout', metavar='SECONDS', type=float,
+    help='timeout of a run')
+run_parser.add_argument('--cwd', metavar='DIRECTORY',
+    help='working directory of the command')
+run_parser.add_argument('command', nargs=argparse.REMAINDER,
+    help='the command; {variant}, {output} and {round} are substituted')
+
+for parser in (state_parser, run_parser):
+    parser.add_argument('--strict', action='store_true',
+        help='fail if the host state is noisy')
+    parser.add_argument('--output', '-O', metavar='FILENAME',
+        help='JSON result file (run default: result-<date>.json)')
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
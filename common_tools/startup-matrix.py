@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+'''
+Cold-start latency of every application sample, natively, under Graphene and
+under Graphene-SGX.
+
+Every application runs a minimal invocation which writes a marker as the
+first thing it does (e.g. ``busybox echo``, ``python3 -c 'print(...)'``, or a
+``--version``) and exits. For every run, the time until the marker arrives
+(startup until the first user instruction) and until the process exits is
+measured; the difference is the teardown. Comparing the modes separates the
+phases further: Graphene minus native is the cost of loading the LibOS,
+SGX minus Graphene the cost of building and initialising the enclave
+(including the hashing of the trusted files)::
+
+    sudo ./startup-matrix.py --runs 5 --warm-runs 5
+    ./startup-matrix.py busybox python-simple -m graphene -m sgx
+
+Before every cold run, the page cache is dropped (which needs root; without
+it, all runs are warm and marked so). Applications which are not built for a
+mode are skipped.
+'''
+
+import argparse
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchlib  # pylint: disable=wrong-import-position
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = 'graphene-startup-marker'
+
+# application: directory, manifest, native argv, regular expression of the
+# marker line
+APPS = [
+    ('apache', 'apache', 'httpd.manifest',
+        ['install/bin/httpd', '-v'], r'^Server version'),
+    ('bash', 'bash', 'bash.manifest',
+        ['/bin/bash', '-c', 'echo ' + MARKER], MARKER),
+    ('blender', 'blender', 'blender.manifest',
+        ['blender_dir/blender', '--version'], r'^Blender'),
+    ('busybox', 'busybox', 'busybox.manifest',
+        ['./busybox', 'echo', MARKER], MARKER),
+    ('curl', 'curl', 'curl.manifest',
+        ['/usr/bin/curl', '--version'], r'^curl '),
+    ('gcc', 'gcc', 'gcc.manifest', ['/usr/bin/gcc', '--version'], r'^gcc'),
+    ('lighttpd', 'lighttpd', 'lighttpd.manifest',
+        ['install/sbin/lighttpd', '-v'], r'^lighttpd'),
+    ('memcached', 'memcached', 'memcached',
+        ['./memcached', '-V'], r'^memcached'),
+    ('nginx', 'nginx', 'nginx.manifest',
+        ['install/sbin/nginx', '-v'], r'^nginx version'),
+    ('nodejs', 'nodejs', 'nodejs.manifest',
+        ['/usr/bin/nodejs', '-e', 'console.log("{}")'.format(MARKER)], MARKER),
+    ('python-scipy-insecure', 'python-scipy-insecure', 'python.manifest',
+        ['python3', '-c', 'import numpy; print("{}")'.format(MARKER)], MARKER),
+    ('python-simple', 'python-simple', 'python.manifest',
+        ['python3', '-c', 'print("{}")'.format(MARKER)], MARKER),
+    ('pytorch', 'pytorch', 'pytorch.manifest',
+        ['python3', '-c', 'import torch; print("{}")'.format(MARKER)],
+        MARKER),
+    ('r', 'r', 'R.manifest', ['R', '--slave', '--vanilla', '-e',
+        'cat("{}\\n")'.format(MARKER)], MARKER),
+    ('redis', 'redis', 'redis-server.manifest',
+        ['./redis-server', '--version'], r'^Redis server'),
+]
+
+
+def drop_page_cache():
+    '''Drop the page cache; return whether it was possible.'''
+    os.sync()
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as file:
+            file.write('3\n')
+    except OSError:
+        return False
+    return True
+
+
+def is_built(mode, directory, manifest, native_argv):
+    if mode == 'native':
+        executable = native_argv[0]
+        if '/' in executable:
+            return os.access(os.path.join(directory, executable), os.X_OK)
+        return shutil.which(executable) is not None
+    path = os.path.join(directory, manifest)
+    if mode == 'sgx':
+        path += '.sgx'
+    return os.path.exists(path)
+
+
+def manifest_info(directory, manifest):
+    '''Return the number of trusted files and the enclave size of a
+    generated manifest.'''
+    info = {'trusted_files': None, 'enclave_size': None}
+    try:
+        with open(os.path.join(directory, manifest)) as file:
+            text = file.read()
+    except OSError:
+        return info
+    info['trusted_files'] = len(re.findall(r'^sgx\.trusted_files\.', text,
+        re.M))
+    match = re.search(r'^sgx\.enclave_size\s*=\s*(\S+)', text, re.M)
+    if match:
+        info['enclave_size'] = benchlib.parse_size(match.group(1))
+    return info
+
+
+def run_once(argv, env, cwd, marker, timeout):
+    '''Run the command once; return the time until the marker line and until
+    the exit, in seconds, and the returncode.'''
+    marker_re = re.compile(marker)
+    result = {'marker_s': None}
+    start = time.perf_counter()
+    # pylint: disable=subprocess-popen-preexec-fn
+    proc = subprocess.Popen(argv, env=env, cwd=cwd, stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        preexec_fn=os.setsid)
+
+    def read():
+        for line in proc.stdout:
+            if result['marker_s'] is None and marker_re.search(
+                    line.decode(errors='replace')):
+                result['marker_s'] = time.perf_counter() - start
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        result['returncode'] = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        result['returncode'] = None
+    result['exit_s'] = time.perf_counter() - start
+    # Graphene helper processes may outlive the application
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+    reader.join(timeout=5)
+    proc.stdout.close()
+    return result
+
+
+def run_app(args, app, mode, warned):
+    name, directory, manifest, native_argv, marker = app
+    directory = os.path.join(ROOT, directory)
+    record = {'app': name, 'mode': mode, 'runs': []}
+    if mode != 'native':
+        record.update(manifest_info(directory, manifest))
+    if not is_built(mode, directory, manifest, native_argv):
+        record['status'] = 'not built'
+        return record
+
+    argv, env = benchlib.command_for(mode, native_argv, manifest,
+        loader=args.loader)
+    if args.warm_runs:
+        # one untimed run to fill the page cache
+        run_once(argv, env, directory, marker, args.timeout)
+    plan = ['cold'] * args.runs + ['warm'] * args.warm_runs
+    for kind in plan:
+        if kind == 'cold' and not drop_page_cache():
+            if not warned:
+                print('cannot drop the page cache (not root?); cold runs '
+                    'are warm', file=sys.stderr)
+                warned.append(True)
+            kind = 'warm'
+        run = run_once(argv, env, directory, marker, args.timeout)
+        run['kind'] = kind
+        record['runs'].append(run)
+    failed = [run for run in record['runs'] if run['returncode'] != 0
+        or run['marker_s'] is None]
+    record['status'] = 'failed' if failed else 'ok'
+
+    for kind in ('cold', 'warm'):
+        runs = [run for run in record['runs'] if run['kind'] == kind
+            and run['marker_s'] is not None]
+        if not runs:
+            continue
+        record[kind] = {
+            'marker_s': benchlib.summarize(run['marker_s'] for run in runs),
+            'exit_s': benchlib.summarize(run['exit_s'] for run in runs),
+            'teardown_s': benchlib.summarize(run['exit_s'] - run['marker_s']
+                for run in runs),
+        }
+    return record
+
+
+def print_matrix(records, modes, kind, *, file=None):
+    '''Print one row per application with the median times per mode.'''
+    rows = {}
+    for record in records:
+        row = rows.setdefault(record['app'], {'app': record['app']})
+        if record.get('trusted_files') is not None:
+            row['trusted_files'] = record['trusted_files']
+        if record.get('enclave_size') is not None:
+            row['enclave_size'] = record['enclave_size'] >> 20
+        stats = record.get(kind)
+        if stats is None:
+            row[record['mode']] = record['status'] if record['status'] != \
+                'ok' else None
+            continue
+        row[record['mode']] = stats['marker_s']['p50']
+        row[record['mode'] + '_exit'] = stats['exit_s']['p50']
+    for row in rows.values():
+        for mode, base, key in (('graphene', 'native', 'libos'),
+                ('sgx', 'graphene', 'enclave')):
+            if isinstance(row.get(mode), float) and isinstance(
+                    row.get(base), float):
+                row[key] = row[mode] - row[base]
+
+    columns = [('app', 'app')]
+    for mode in modes:
+        columns += [(mode, '{} [s]'.format(mode), '.3f'),
+            (mode + '_exit', 'exit', '.3f')]
+    if 'graphene' in modes and 'native' in modes:
+        columns.append(('libos', '+LibOS [s]', '.3f'))
+    if 'sgx' in modes and 'graphene' in modes:
+        columns.append(('enclave', '+enclave [s]', '.3f'))
+    if 'sgx' in modes:
+        columns += [('trusted_files', 'trusted'),
+            ('enclave_size', 'enclave [MiB]')]
+    # the status of failed runs (e.g. "not built") is shown instead of times
+    table = []
+    for row in rows.values():
+        table.append({column[0]: format(row[column[0]], column[2])
+            if isinstance(row.get(column[0]), float) else row.get(column[0])
+            for column in columns})
+    benchlib.print_table(table, [column[:2] for column in columns],
+        file=file)
+
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('apps', metavar='APP', nargs='*',
+    help='applications (default: all of {})'.format(
+        ', '.join(app[0] for app in APPS)))
+benchlib.add_mode_arguments(argparser, default=('native', 'graphene', 'sgx'))
+argparser.add_argument('--runs', '-n', metavar='N', type=int, default=5,
+    help='cold runs per application and mode (default: %(default)s)')
+argparser.add_argument('--warm-runs', metavar='N', type=int, default=0,
+    help='warm runs per application and mode (default: %(default)s)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=300, help='timeout of a run (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    names = [app[0] for app in APPS]
+    for name in args.apps:
+        if name not in names:
+            argparser.error('unknown application: {}'.format(name))
+    apps = [app for app in APPS if not args.apps or app[0] in args.apps]
+    modes = benchlib.get_modes(args)
+
+    records = []
+    warned = []
+    for app in apps:
+        for mode in modes:
+            record = run_app(args, app, mode, warned)
+            cold = record.get('cold', record.get('warm'))
+            print('{} ({}): {}{}'.format(app[0], mode, record['status'],
+                ', {:.3f} s to the marker'.format(cold['marker_s']['p50'])
+                    if cold else ''), file=sys.stderr)
+            records.append(record)
+
+    for kind in ('cold', 'warm'):
+        if not any(kind in record for record in records):
+            continue
+        print('{} start, median time to the marker and to the exit:'.format(
+            kind))
+        print_matrix(records, modes, kind)
+        print()
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'startup-matrix',
+        'host': benchlib.host_info(),
+        'results': records,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,426 @@
+'''
+Application plugins of the benchmark suite (see benchsuite.py).
+
+A plugin describes how one application directory is exercised, in the
+lifecycle that benchsuite.py drives for every selected mode::
+
+    plugin.build(ctx, mode)
+    handle = plugin.start(ctx, mode)
+    try:
+        plugin.ready(ctx, handle)
+        raw = plugin.load(ctx, mode, handle)
+        rows = plugin.measure(ctx, mode, raw)
+    finally:
+        plugin.teardown(ctx, handle)
+
+:py:meth:`Plugin.measure` returns rows of ``{'section', 'params', 'metrics'}``:
+*params* identify the row across runs (e.g. the concurrency), *metrics* are
+the numbers measured for it. Most applications have a ``run-benchmark.py``
+driver which starts, loads and stops the workload itself; their plugin only
+runs the driver and flattens its JSON result file.
+'''
+
+import json
+import os
+import re
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+import benchlib
+import webbench
+
+
+class Context:
+    '''State shared by the plugin calls of one application and mode.
+
+    Args:
+        directory (str): the application directory
+        log (file): where the output of builds and runs is appended
+        extra_args (list): additional arguments for the driver or command
+        repeat (int): how often plugins without a driver repeat the workload
+        timeout (float): timeout for a build or a run, in seconds
+    '''
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, directory, *, log, extra_args=(), repeat=5,
+            timeout=7200):
+        self.directory = directory
+        self.log = log
+        self.extra_args = list(extra_args)
+        self.repeat = repeat
+        self.timeout = timeout
+
+    def run(self, argv, *, env=None, cwd=None, role='server'):
+        '''Run a command in the application directory, logging its output;
+        return ``(returncode, stdout, stderr, elapsed)``.
+
+        The command is pinned to the CPUs of *role*; load generators and
+        drivers, which pin the servers they start themselves, pass
+        ``role='client'``.'''
+        cwd = os.path.join(self.directory, cwd or '')
+        self.log.write('$ {}\n'.format(' '.join(argv)))
+        self.log.flush()
+        returncode, stdout, stderr, elapsed = benchlib.run_capture(argv,
+            env=env, cwd=cwd, timeout=self.timeout, role=role)
+        self.log.write(stdout)
+        self.log.write(stderr)
+        self.log.flush()
+        return returncode, stdout, stderr, elapsed
+
+
+def split_record(record, params=()):
+    '''Split a result record into ``(params, metrics)``.
+
+    Only the keys listed in *params* identify the record; all other numbers
+    and booleans are metrics. Dictionaries of numbers (e.g. ``latency_ms``)
+    become metrics with dotted names. Other strings (e.g. a status or a
+    cache hit) and lists are skipped, so that they do not split the rows of
+    one configuration between runs.
+    '''
+    row_params = {}
+    metrics = {}
+    for key, value in record.items():
+        if key == 'mode' or value is None:
+            continue
+        if key in params:
+            row_params[key] = value
+        elif isinstance(value, (int, float)):
+            metrics[key] = float(value)
+        elif isinstance(value, dict):
+            for name, item in value.items():
+                if isinstance(item, (int, float)) and not isinstance(item,
+                        bool):
+                    metrics['{}.{}'.format(key, name)] = float(item)
+    return row_params, metrics
+
+
+def flatten(data, path, params=(), parent=None):
+    '''Yield ``(params, metrics)`` for the records at a dotted *path* of a
+    result file, e.g. ``runs.results``; nested records inherit the
+    parameters of their parents.'''
+    head, _, rest = path.partition('.')
+    for record in data.get(head) or []:
+        row_params, metrics = split_record(record, params)
+        row_params = dict(parent or {}, **row_params)
+        if rest:
+            yield from flatten(record, rest, params, row_params)
+        else:
+            yield row_params, metrics
+
+
+class Plugin:
+    '''Base class of the plugins.
+
+    The default lifecycle builds with ``make`` (``make SGX=1`` for SGX) and
+    has no server; subclasses implement :py:meth:`load` and
+    :py:meth:`measure`.
+    '''
+    modes = benchlib.MODES
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.directory = directory or name
+
+    def build(self, ctx, mode):
+        argv = ['make']
+        if mode == 'sgx':
+            argv.append('SGX=1')
+        returncode, _, _, _ = ctx.run(argv)
+        if returncode != 0:
+            raise RuntimeError('make exited with returncode {}'.format(
+                returncode))
+
+    def start(self, ctx, mode):
+        # pylint: disable=no-self-use,unused-argument
+        return None
+
+    def ready(self, ctx, handle):
+        pass
+
+    def load(self, ctx, mode, handle):
+        raise NotImplementedError
+
+    def measure(self, ctx, mode, raw):
+        raise NotImplementedError
+
+    def teardown(self, ctx, handle):
+        # pylint: disable=no-self-use,unused-argument
+        if handle is not None:
+            handle.stop()
+
+
+class DriverPlugin(Plugin):
+    '''An application with a ``run-benchmark.py`` driver.
+
+    Args:
+        name (str): plugin and directory name
+        params (tuple): keys of the result records which identify a record
+            (e.g. ``concurrency`` or ``storage``)
+        sections (tuple): dotted paths of the record lists in the result file
+        args (tuple): default arguments of the driver
+    '''
+
+    def __init__(self, name, *, params=(), sections=('results',), args=()):
+        super().__init__(name)
+        self.params = params
+        self.sections = sections
+        self.args = list(args)
+
+    def load(self, ctx, mode, handle):
+        fd, output = tempfile.mkstemp(prefix='result-', suffix='.json',
+            dir=ctx.directory)
+        os.close(fd)
+        try:
+            returncode, _, _, _ = ctx.run([sys.executable, 'run-benchmark.py',
+                '--mode', mode, '--output', os.path.basename(output),
+                *self.args, *ctx.extra_args], role='client')
+            if os.path.getsize(output) == 0:
+                raise RuntimeError('run-benchmark.py exited with returncode '
+                    '{} without results'.format(returncode))
+            with open(output) as file:
+                data = json.load(file)
+        finally:
+            os.unlink(output)
+        data['returncode'] = returncode
+        return data
+
+    def measure(self, ctx, mode, raw):
+        rows = [{'section': '', 'params': {},
+            'metrics': {'returncode': float(raw['returncode'])}}]
+        for section in self.sections:
+            for params, metrics in flatten(raw, section, self.params):
+                rows.append({'section': section, 'params': params,
+                    'metrics': metrics})
+        return rows
+
+
+class CommandPlugin(Plugin):
+    '''A short-running command, run ``ctx.repeat`` times; measures the wall
+    time and checks the output.
+
+    Args:
+        name (str): plugin name
+        directory (str): application directory
+        commands (list): ``(label, native_argv, manifest)`` tuples; under
+            Graphene, the arguments of *native_argv* are passed to
+            ``pal_loader <manifest>``
+        expect (str): regular expression the output must match
+        cwd (str): working directory, relative to the application directory
+    '''
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, name, commands, *, directory=None, expect=None,
+            cwd=None):
+        super().__init__(name, directory)
+        self.commands = commands
+        self.expect = expect
+        self.cwd = cwd
+
+    def load(self, ctx, mode, handle):
+        raw = []
+        for label, native_argv, manifest in self.commands:
+            argv, env = benchlib.command_for(mode,
+                native_argv + ctx.extra_args, manifest)
+            for _ in range(ctx.repeat):
+                returncode, stdout, stderr, elapsed = ctx.run(argv, env=env,
+                    cwd=self.cwd)
+                raw.append((label, returncode, stdout + stderr, elapsed))
+        return raw
+
+    def check(self, returncode, stdout):
+        return returncode == 0 and (self.expect is None
+            or re.search(self.expect, stdout, re.MULTILINE) is not None)
+
+    def measure(self, ctx, mode, raw):
+        rows = []
+        for label, _, _ in self.commands:
+            runs = [run for run in raw if run[0] == label]
+            failed = sum(1 for _, returncode, stdout, _ in runs
+                if not self.check(returncode, stdout))
+            metrics = {'wall_time.' + key: value for key, value in
+                benchlib.summarize(run[3] for run in runs).items()}
+            metrics['failed'] = float(failed)
+            rows.append({'section': 'commands', 'params': {'command': label},
+                'metrics': metrics})
+        return rows
+
+
+class LmbenchPlugin(CommandPlugin):
+    '''lmbench micro-benchmarks; the values they print to stderr (e.g.
+    ``Simple syscall: 0.1234 microseconds``) are the metrics.'''
+
+    LINE_RE = re.compile(r'^(.+?):\s+([\d.]+) (microseconds|MB/sec)',
+        re.MULTILINE)
+
+    def measure(self, ctx, mode, raw):
+        rows = super().measure(ctx, mode, raw)
+        values = {}
+        for label, _, stdout, _ in raw:
+            for name, value, unit in self.LINE_RE.findall(stdout):
+                values.setdefault((label, name.strip(), unit), []).append(
+                    float(value))
+        for (label, name, unit), samples in sorted(values.items()):
+            rows.append({'section': 'values',
+                'params': {'command': label, 'name': name, 'unit': unit},
+                'metrics': benchlib.summarize(samples)})
+        return rows
+
+
+class ServerPlugin(Plugin):
+    '''A web server started by the suite and loaded with ``ab -k``.
+
+    Args:
+        name (str): plugin and directory name
+        native_argv (list): the server command when running natively
+        manifest (str): manifest of the server
+        port (int): port to wait for and to load
+        path (str): URL path to request
+        concurrency (tuple): numbers of concurrent connections
+        duration (int): seconds per concurrency level
+    '''
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, name, native_argv, manifest, *, port, path,
+            concurrency=(1, 16, 64), duration=10):
+        super().__init__(name)
+        self.native_argv = native_argv
+        self.manifest = manifest
+        self.port = port
+        self.path = path
+        self.concurrency = concurrency
+        self.duration = duration
+
+    def start(self, ctx, mode):
+        argv, env = benchlib.command_for(mode, self.native_argv,
+            self.manifest)
+        ctx.log.write('$ {}\n'.format(' '.join(argv)))
+        ctx.log.flush()
+        server = benchlib.Server(argv, env=env, cwd=ctx.directory, port=None)
+        server.start()
+        return server
+
+    def ready(self, ctx, handle):
+        handle.ready_time = benchlib.wait_for_port(handle.host, self.port,
+            timeout=ctx.timeout, proc=handle.proc)
+
+    def load(self, ctx, mode, handle):
+        url = 'http://{}:{}{}'.format(handle.host, self.port, self.path)
+        raw = {'ready_time': handle.ready_time, 'results': []}
+        for concurrency in self.concurrency:
+            returncode, stdout, _, _ = ctx.run(['ab', '-k', '-c',
+                str(concurrency), '-t', str(self.duration), '-n', '100000000',
+                url], role='client')
+            if returncode != 0:
+                raise RuntimeError('ab exited with returncode {}'.format(
+                    returncode))
+            result = webbench.parse_ab(stdout)
+            result['concurrency'] = concurrency
+            raw['results'].append(result)
+        return raw
+
+    def measure(self, ctx, mode, raw):
+        rows = [{'section': 'startup', 'params': {},
+            'metrics': {'ready_time': raw['ready_time']}}]
+        for params, metrics in flatten(raw, 'results', ('concurrency',)):
+            rows.append({'section': 'results', 'params': params,
+                'metrics': metrics})
+        return rows
+
+
+class LtpPlugin(Plugin):
+    '''The LTP system call tests, run with runltp_xml.py; the counts and the
+    total time of its JUnit report are the metrics.'''
+    modes = ('graphene', 'sgx')
+
+    def load(self, ctx, mode, handle):
+        argv = ['./runltp_xml.py', '-c', 'ltp-bug-1248.cfg']
+        if mode == 'sgx':
+            argv += ['-c', 'ltp-sgx.cfg', '-c', 'ltp-bug-1075.cfg']
+        else:
+            argv += ['-c', 'ltp.cfg']
+        argv += ctx.extra_args + ['opt/ltp/runtest/syscalls']
+        _, stdout, _, elapsed = ctx.run(argv)
+        return stdout, elapsed
+
+    def measure(self, ctx, mode, raw):
+        stdout, elapsed = raw
+        suite = ET.fromstring(stdout[stdout.index('<'):])
+        metrics = {name: float(suite.get(name, 0)) for name in ('tests',
+            'failures', 'errors', 'skipped', 'time')}
+        metrics['wall_time'] = elapsed
+        executed = metrics['tests'] - metrics['skipped']
+        if executed:
+            metrics['pass_rate'] = (executed - metrics['failures']
+                - metrics['errors']) / executed
+        rows = [{'section': 'summary', 'params': {}, 'metrics': metrics}]
+        for case in suite.iter('testcase'):
+            if case.get('time') is not None:
+                rows.append({'section': 'testcases',
+                    'params': {'test': case.get('name')},
+                    'metrics': {'time': float(case.get('time'))}})
+        return rows
+
+
+WEB_PARAMS = ('server', 'profile', 'variant', 'mpm', 'sendfile', 'file_size',
+    'handshake', 'concurrency', 'workers', 'threads', 'clients')
+INFERENCE_PARAMS = ('framework', 'model', 'batch_size', 'threads',
+    'inter_op_threads')
+
+PLUGINS = [
+    DriverPlugin('apache', params=WEB_PARAMS),
+    DriverPlugin('bash', params=('file_size', 'instances')),
+    DriverPlugin('blender', params=('scene', 'threads', 'start', 'end')),
+    CommandPlugin('busybox', [('true', ['./busybox', 'true'],
+        'busybox.manifest')]),
+    DriverPlugin('capnproto', params=('transport', 'items', 'payload_size',
+        'messages')),
+    DriverPlugin('curl', params=('storage', 'file_size', 'parallel',
+        'file_bytes')),
+    DriverPlugin('gcc', params=('pipeline', 'stage', 'jobs', 'commands')),
+    ServerPlugin('lighttpd', ['install/sbin/lighttpd', '-D', '-m',
+        'install/lib', '-f', 'lighttpd.conf'], 'lighttpd.manifest',
+        port=8003, path='/random/10K.1.html'),
+    LmbenchPlugin('lmbench', [
+        ('lat_syscall null', ['./lat_syscall', 'null'], 'lat_syscall'),
+        ('lat_syscall read', ['./lat_syscall', 'read'], 'lat_syscall'),
+        ('lat_syscall write', ['./lat_syscall', 'write'], 'lat_syscall'),
+        ('lat_sig install', ['./lat_sig', 'install'], 'lat_sig'),
+        ('lat_sig catch', ['./lat_sig', 'catch'], 'lat_sig'),
+        ('bw_unix', ['./bw_unix'], 'bw_unix'),
+    ], cwd='lmbench-2.5/bin/linux'),
+    LtpPlugin('ltp'),
+    DriverPlugin('memcached', params=('threads', 'connections', 'value_size',
+        'get_ratio'), sections=('startup', 'results')),
+    DriverPlugin('nginx', params=WEB_PARAMS),
+    CommandPlugin('nodejs', [('helloworld', ['nodejs', 'helloworld.js'],
+        'nodejs.manifest')], expect='Hello World'),
+    DriverPlugin('nodejs-express-server', params=('flavour', 'workers',
+        'concurrency'),
+        sections=('node_startup', 'startup', 'results')),
+    DriverPlugin('openvino', params=INFERENCE_PARAMS,
+        sections=('runs', 'runs.results')),
+    DriverPlugin('python-scipy-insecure', params=('threads', 'kernel', 'size'),
+        sections=('summary',)),
+    CommandPlugin('python-simple', [
+        ('helloworld', ['python3', 'scripts/helloworld.py'],
+            'python.manifest'),
+        ('fibonacci', ['python3', 'scripts/fibonacci.py'], 'python.manifest'),
+    ]),
+    DriverPlugin('pytorch', params=INFERENCE_PARAMS,
+        sections=('runs', 'runs.results')),
+    DriverPlugin('r', params=('threads', 'section', 'test'),
+        sections=('summary',)),
+    DriverPlugin('redis', params=('persistence', 'clients', 'pipeline',
+        'data_size', 'test'),
+        sections=('startup', 'results')),
+    DriverPlugin('tensorflow', params=INFERENCE_PARAMS,
+        sections=('runs', 'runs.results')),
+]
+
+
+def get_plugin(name):
+    for plugin in PLUGINS:
+        if plugin.name == name:
+            return plugin
+    raise KeyError('no plugin for {!r}'.format(name))
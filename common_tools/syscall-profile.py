@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+'''
+System call profiler for applications running under Graphene.
+
+With ``loader.debug_type = inline`` (``make DEBUG=1``), the LibOS prints every
+system call of the application::
+
+    [P12345] ---- shim_openat(AT_FDCWD,"/etc/hosts",O_RDONLY,0000) = 3
+    [P12345] ---- shim_wait4(-1,0x7ffc...,0,0) ...
+    [P12345] ---- return from shim_wait4(...) = 12346
+
+This tool collects such traces and reports per system call the number of
+calls and errors, latency percentiles and the total time spent in the call
+(``--sort`` ranks the calls by it), the most frequent sequences of calls
+and folded stacks for flamegraph.pl (https://github.com/brendangregg/
+FlameGraph)::
+
+    ./syscall-profile.py run --cwd ../redis --inline -- redis-server.manifest
+    ./syscall-profile.py parse OUTPUT
+    ./syscall-profile.py ltp -- -c ltp.cfg -o sgx=no opt/ltp/runtest/syscalls
+    ./syscall-profile.py ltp --xml ../ltp/ltp.xml
+
+The trace carries no timestamps, so ``run`` timestamps every line when it
+arrives. Calls that may block are printed on entry and on return, which gives
+their *latency*; all other calls are printed once they have returned, so for
+them only the *interval* since the previous call of the same process is known,
+an upper bound of the latency that includes the time spent in the
+application. Traces read with ``parse`` or from an LTP report (captured
+without timestamps) have counts and sequences only.
+'''
+
+import argparse
+import collections
+import os
+import re
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchlib  # pylint: disable=wrong-import-position
+
+TRACE_RE = re.compile(r'^(?:\[(?P<prefix>[^\]]*)\]\s*)?(?:trace:\s*)?'
+    r'---- (?P<ret>return from )?shim_(?P<name>\w+)\((?P<args>.*?)\)'
+    r'(?:\s*=\s*(?P<value>\S+)|\s*(?P<pending>\.\.\.))?\s*$')
+PROCESS_RE = re.compile(r'P(\d+)')
+THREAD_RE = re.compile(r'T(\d+)')
+# lines of a trace saved by "run --save-trace": "<seconds>\t<line>"
+TIMESTAMPED_RE = re.compile(r'^(\d+\.\d+)\t(.*)$')
+DEBUG_TYPE_RE = re.compile(r'^loader\.debug_type\s*=.*$', re.MULTILINE)
+
+
+class Profile:
+    '''System call statistics of one or more traces.
+
+    Args:
+        sequence_length (int): length of the call sequences to count
+    '''
+
+    def __init__(self, sequence_length=3):
+        self.sequence_length = sequence_length
+        self.counts = collections.Counter()
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(list)
+        self.intervals = collections.defaultdict(list)
+        self.sequences = collections.Counter()
+        self.folded = collections.Counter()
+        self._history = {}
+        self._last = {}
+        self._pending = {}
+
+    def add_line(self, line, timestamp=None, label='trace'):
+        '''Account one line of output; other lines than system calls are
+        ignored.'''
+        match = TRACE_RE.match(line)
+        if match is None:
+            return
+        name = match.group('name')
+        prefix = match.group('prefix') or ''
+        process = PROCESS_RE.search(prefix)
+        thread = THREAD_RE.search(prefix)
+        key = (label, process.group(1) if process else '0',
+            thread.group(1) if thread else None)
+
+        if match.group('pending'):
+            # entry of a call which may block; accounted on return
+            if timestamp is not None:
+                self._pending[key + (name,)] = timestamp
+            return
+
+        self.counts[name] += 1
+        value = match.group('value')
+        if value is not None and value.startswith('-'):
+            self.errors[name] += 1
+        if timestamp is not None:
+            if match.group('ret'):
+                entry = self._pending.pop(key + (name,), None)
+                if entry is not None:
+                    self.latencies[name].append(timestamp - entry)
+            elif key in self._last:
+                self.intervals[name].append(timestamp - self._last[key])
+            self._last[key] = timestamp
+
+        history = self._history.setdefault(key, collections.deque(
+            maxlen=self.sequence_length))
+        history.append(name)
+        if len(history) == self.sequence_length:
+            self.sequences[tuple(history)] += 1
+        self.folded[(label, 'P' + key[1], name)] += 1
+
+    def add_text(self, text, label='trace'):
+        '''Account a trace, with or without "run --save-trace" timestamps.'''
+        for line in text.splitlines():
+            match = TIMESTAMPED_RE.match(line)
+            if match:
+                self.add_line(match.group(2), float(match.group(1)), label)
+            else:
+                self.add_line(line, None, label)
+
+    def summary(self, sort='count'):
+        '''Return one row per system call, most frequent first, or with the
+        largest total latency or interval first if *sort* is ``latency`` or
+        ``interval``.'''
+        rows = []
+        for name, count in self.counts.most_common():
+            row = {'syscall': name, 'count': count,
+                'errors': self.errors[name]}
+            for kind, samples in (('latency', self.latencies[name]),
+                    ('interval', self.intervals[name])):
+                if samples:
+                    stats = benchlib.summarize([i * 1e6 for i in samples])
+                    for key in ('p50', 'p90', 'p99', 'max'):
+                        row['{}_{}_us'.format(kind, key)] = stats[key]
+                    row['{}_total_us'.format(kind)] = sum(samples) * 1e6
+            rows.append(row)
+        if sort != 'count':
+            rows.sort(key=lambda row: row.get('{}_total_us'.format(sort), 0),
+                reverse=True)
+        return rows
+
+    def top_sequences(self, count):
+        return [{'sequence': ' > '.join(sequence), 'count': number}
+            for sequence, number in self.sequences.most_common(count)]
+
+    def label_counts(self):
+        '''Return the number of calls per label (e.g. LTP test) and system
+        call.'''
+        counts = collections.defaultdict(collections.Counter)
+        for (label, _, name), count in self.folded.items():
+            counts[label][name] += count
+        return {label: dict(names) for label, names in counts.items()}
+
+    def write_folded(self, path, weight):
+        '''Write folded stacks (``label;process;syscall count``), weighted by
+        the number of calls or by the time in microseconds.'''
+        with open(path, 'w') as file:
+            for stack, count in sorted(self.folded.items()):
+                if weight == 'time':
+                    samples = (self.latencies[stack[2]]
+                        or self.intervals[stack[2]])
+                    if not samples:
+                        continue
+                    # the mean time of the call, for every call of the stack
+                    count = round(count * sum(samples) / len(samples) * 1e6)
+                file.write('{} {}\n'.format(';'.join(stack), count))
+
+
+def inline_manifest(manifest):
+    '''Write a copy of *manifest* with ``loader.debug_type = inline`` next
+    to it and return its path.'''
+    with open(manifest) as file:
+        text = file.read()
+    if DEBUG_TYPE_RE.search(text):
+        text = DEBUG_TYPE_RE.sub('loader.debug_type = inline', text)
+    else:
+        text += '\nloader.debug_type = inline\n'
+    base = manifest[:-len('.manifest')] if manifest.endswith('.manifest') \
+        else manifest
+    path = base + '-trace.manifest'
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def run_traced(args, profile):
+    '''Run the application under pal_loader and timestamp its output.'''
+    manifest = args.command[0]
+    cwd = args.cwd or '.'
+    trace_manifest = None
+    if args.inline:
+        trace_manifest = inline_manifest(os.path.join(cwd, manifest))
+        manifest = os.path.relpath(trace_manifest, cwd)
+    argv, env = benchlib.command_for('sgx' if args.sgx else 'graphene',
+        [manifest] + args.command[1:], manifest, loader=args.loader)
+
+    save = open(args.save_trace, 'w') if args.save_trace else None
+    print('running: {}'.format(' '.join(argv)), file=sys.stderr)
+    start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(argv, env=env, cwd=cwd,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        for raw in proc.stdout:
+            timestamp = time.perf_counter() - start
+            line = raw.decode(errors='backslashreplace').rstrip('\n')
+            profile.add_line(line, timestamp, args.label)
+            if save is not None:
+                save.write('{:.6f}\t{}\n'.format(timestamp, line))
+        returncode = proc.wait()
+    finally:
+        if save is not None:
+            save.close()
+        if trace_manifest is not None:
+            os.unlink(trace_manifest)
+    print('returncode {} after {:.2f} s'.format(returncode,
+        time.perf_counter() - start), file=sys.stderr)
+    return returncode
+
+
+def profile_ltp(args, profile):
+    '''Run LTP (or read its report) and account the output of every test
+    under the name of the test.'''
+    if args.xml:
+        with open(args.xml, 'rb') as file:
+            report = file.read()
+    else:
+        argv = ['./runltp_xml.py'] + args.runltp_args
+        print('running: {}'.format(' '.join(argv)), file=sys.stderr)
+        report = subprocess.run(argv, cwd=args.ltp_dir,
+            stdout=subprocess.PIPE, check=False).stdout
+    tests = 0
+    for case in ET.fromstring(report).iter('testcase'):
+        tests += 1
+        for stream in ('system-out', 'system-err'):
+            element = case.find(stream)
+            if element is not None and element.text:
+                profile.add_text(element.text, case.get('name'))
+    print('{} tests in the report'.format(tests), file=sys.stderr)
+    return 0
+
+
+def profile_files(args, profile):
+    for path in args.traces:
+        with open(path, errors='backslashreplace') as file:
+            profile.add_text(file.read(), args.label or os.path.basename(path))
+    return 0
+
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('--sequence-length', '-n', metavar='N', type=int,
+    default=3, help='length of the counted call sequences (default: '
+        '%(default)s)')
+argparser.add_argument('--sort', choices=('count', 'latency', 'interval'),
+    default='count',
+    help='order of the system calls: number of calls, or total latency or '
+        'interval (default: %(default)s)')
+argparser.add_argument('--top', metavar='N', type=int, default=20,
+    help='number of sequences to show (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--folded', metavar='FILENAME',
+    help='write folded stacks for flamegraph.pl to this file')
+argparser.add_argument('--folded-weight', choices=('count', 'time'),
+    default='count',
+    help='weight of the folded stacks: number of calls or time in '
+        'microseconds (default: %(default)s)')
+subparsers = argparser.add_subparsers(dest='source', metavar='SOURCE')
+subparsers.required = True
+
+run_parser = subparsers.add_parser('run',
+    help='run an application under pal_loader and profile it')
+run_parser.add_argument('--cwd', metavar='DIR',
+    help='directory to run in (default: the current directory)')
+run_parser.add_argument('--loader', metavar='PATH',
+    default=benchlib.DEFAULT_LOADER,
+    help='path to pal_loader, relative to --cwd (default: %(default)s)')
+run_parser.add_argument('--sgx', action='store_true',
+    help='run under Graphene-SGX')
+run_parser.add_argument('--inline', action='store_true',
+    help='run with a copy of the manifest with loader.debug_type = inline '
+        '(not possible under SGX)')
+run_parser.add_argument('--label', metavar='NAME', default='trace',
+    help='root of the folded stacks (default: %(default)s)')
+run_parser.add_argument('--save-trace', metavar='FILENAME',
+    help='also save the timestamped output, for "parse"')
+run_parser.add_argument('command', metavar='MANIFEST [ARG ...]',
+    nargs=argparse.REMAINDER,
+    help='manifest and arguments for pal_loader (after --)')
+
+parse_parser = subparsers.add_parser('parse',
+    help='profile the output of earlier runs')
+parse_parser.add_argument('traces', metavar='FILENAME', nargs='+',
+    help='output of an application with inline debug output, or a trace '
+        'saved with "run --save-trace"')
+parse_parser.add_argument('--label', metavar='NAME',
+    help='root of the folded stacks (default: the file name)')
+
+ltp_parser = subparsers.add_parser('ltp',
+    help='profile the LTP tests run by runltp_xml.py')
+ltp_parser.add_argument('--ltp-dir', metavar='DIR',
+    default=os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'ltp'),
+    help='LTP directory (default: %(default)s)')
+ltp_parser.add_argument('--xml', metavar='FILENAME',
+    help='read this runltp_xml.py report instead of running the tests')
+ltp_parser.add_argument('runltp_args', metavar='ARG', nargs=argparse.REMAINDER,
+    help='arguments of runltp_xml.py (after --)')
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    for name in ('command', 'runltp_args'):
+        value = getattr(args, name, None)
+        if value and value[0] == '--':
+            setattr(args, name, value[1:])
+    if args.source == 'run' and not args.command:
+        argparser.error('run: the manifest is missing')
+    if args.source == 'run' and args.inline and args.sgx:
+        argparser.error('run: the debug type of a signed manifest cannot be '
+            'changed; build with "make SGX=1 DEBUG=1" instead')
+
+    profile = Profile(args.sequence_length)
+    if args.source == 'run':
+        returncode = run_traced(args, profile)
+    elif args.source == 'ltp':
+        returncode = profile_ltp(args, profile)
+    else:
+        returncode = profile_files(args, profile)
+
+    summary = profile.summary(args.sort)
+    if not summary:
+        print('no system calls found; is loader.debug_type = inline?',
+            file=sys.stderr)
+    benchlib.print_table(summary, [
+        ('syscall', 'syscall'),
+        ('count', 'calls'),
+        ('errors', 'errors'),
+        ('latency_p50_us', 'lat p50 [us]', '.1f'),
+        ('latency_p99_us', 'lat p99 [us]', '.1f'),
+        ('latency_total_us', 'lat total [us]', '.0f'),
+        ('interval_p50_us', 'ival p50 [us]', '.1f'),
+        ('interval_p90_us', 'ival p90 [us]', '.1f'),
+        ('interval_p99_us', 'ival p99 [us]', '.1f'),
+        ('interval_total_us', 'ival total [us]', '.0f'),
+    ])
+    print()
+    sequences = profile.top_sequences(args.top)
+    benchlib.print_table(sequences, [
+        ('count', 'count'),
+        ('sequence', 'sequence'),
+    ])
+
+    if args.folded:
+        profile.write_folded(args.folded, args.folded_weight)
+        print('Folded stacks: {}'.format(args.folded), file=sys.stderr)
+    output = args.output or benchlib.default_result_path()
+    result = {
+        'benchmark': 'syscall-profile',
+        'host': benchlib.host_info(),
+        'source': args.source,
+        'returncode': returncode,
+        'syscalls': summary,
+        'sequences': sequences,
+    }
+    if args.source == 'ltp':
+        result['tests'] = profile.label_counts()
+    benchlib.write_json(output, result)
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+'''
+Print one comparative report from the result files of the web server
+benchmarks (nginx/run-benchmark.py, apache/run-benchmark.py), e.g.::
+
+    ./web-report.py ../nginx/result-*.json ../apache/result-*.json
+'''
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import webbench  # pylint: disable=wrong-import-position
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('results', metavar='FILENAME', nargs='+',
+    help='JSON result file of a web server benchmark')
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    results = []
+    for path in args.results:
+        with open(path) as file:
+            results.extend(json.load(file)['results'])
+    webbench.print_report(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,419 @@
+'''
+Profiles shared by the web server benchmarks (nginx, apache).
+
+A server driver describes how to start its server and this module runs the
+load and collects the results of three profiles into one report, so that the
+overheads of file I/O, of the TLS handshake and of process scaling can be
+told apart:
+
+``files``
+    Requests per second and MB/s for static files of increasing size (1K to
+    10M by default), served with and without sendfile(), over keep-alive
+    connections (``ab -k``).
+
+``tls``
+    New TLS connections per second with a full handshake for every connection
+    (``openssl s_time -new``) and with session resumption (``openssl s_time
+    -reuse``), fetching a small file on every connection.
+
+``workers``
+    Requests per second for a small file with every worker configuration of
+    the server (worker processes for nginx, MPM and processes for Apache).
+
+The ``files`` and ``tls`` profiles use the first worker configuration.
+
+A driver uses it like this::
+
+    argparser = argparse.ArgumentParser()
+    benchlib.add_mode_arguments(argparser)
+    webbench.add_arguments(argparser, port=8002)
+    ...
+    return webbench.run(args, server)
+
+where *server* provides the attributes ``name``, ``docroot`` (the directory
+served as ``/``), ``tls_port`` and ``variants`` (a list of dictionaries with
+at least a ``variant`` label, one per worker configuration), and the method
+``command(mode, variant, sendfile)``, which writes the server configuration
+and returns ``(argv, env, cwd)``.
+'''
+
+import argparse
+import concurrent.futures
+import math
+import os
+import re
+import shutil
+import sys
+
+import benchlib
+
+PROFILES = ('files', 'tls', 'workers')
+BENCH_DIR = 'bench'
+
+AB_PATTERNS = {
+    'requests': r'^Complete requests:\s+(\d+)',
+    'failed': r'^Failed requests:\s+(\d+)',
+    'non_2xx': r'^Non-2xx responses:\s+(\d+)',
+    'time_taken': r'^Time taken for tests:\s+([\d.]+) seconds',
+    'requests_per_sec': r'^Requests per second:\s+([\d.]+)',
+    'latency_mean': r'^Time per request:\s+([\d.]+) \[ms\] \(mean\)$',
+    'transfer_kb_per_sec': r'^Transfer rate:\s+([\d.]+) \[Kbytes/sec\]',
+}
+AB_PERCENTILE_RE = re.compile(r'^\s*(\d+)%\s+(\d+)', re.MULTILINE)
+S_TIME_RE = re.compile(r'^(\d+) connections in ([\d.]+) real seconds',
+    re.MULTILINE)
+S_TIME_PROGRESS_RE = re.compile(r'^[*rt3]+$', re.MULTILINE)
+
+
+def _sendfile_list(value):
+    settings = value.split(',')
+    for setting in settings:
+        if setting not in ('on', 'off'):
+            raise argparse.ArgumentTypeError(
+                'invalid sendfile setting: {}'.format(setting))
+    return settings
+
+
+def add_arguments(argparser, *, port):
+    '''Add the options of the profiles to an argument parser.'''
+    argparser.add_argument('--profile', '-P', metavar='NAME', action='append',
+        choices=PROFILES,
+        help='run this profile, one of {}; may be given multiple times '
+            '(default: all)'.format(', '.join(PROFILES)))
+    argparser.add_argument('--host', metavar='HOST', default='127.0.0.1',
+        help='address the server listens on (default: %(default)s)')
+    argparser.add_argument('--port', '-p', metavar='PORT', type=int,
+        default=port, help='HTTP port (default: %(default)s)')
+    argparser.add_argument('--file-sizes', '-s', metavar='SIZE,...',
+        default='1K,10K,100K,1M,10M',
+        help='comma-separated file sizes of the files profile (K/M suffixes '
+            'allowed, default: %(default)s)')
+    argparser.add_argument('--sendfile', metavar='on|off,...',
+        type=_sendfile_list, default='on,off',
+        help='comma-separated sendfile settings of the files profile; the '
+            'other profiles use the first one (default: %(default)s)')
+    argparser.add_argument('--small-file-size', metavar='SIZE', default='10K',
+        help='file fetched by the tls and workers profiles '
+            '(default: %(default)s)')
+    argparser.add_argument('--concurrency', '-c', metavar='N,...', default='32',
+        help='comma-separated numbers of concurrent ab connections '
+            '(default: %(default)s)')
+    argparser.add_argument('--duration', '-d', metavar='SECONDS', type=int,
+        default=10, help='measured duration of every run (default: '
+            '%(default)s)')
+    argparser.add_argument('--warmup', metavar='SECONDS', type=int, default=2,
+        help='unmeasured ab run before every server configuration '
+            '(default: %(default)s)')
+    argparser.add_argument('--tls-clients', metavar='N', type=int, default=4,
+        help='concurrent openssl s_time processes (default: %(default)s)')
+    argparser.add_argument('--tls-version', choices=('1.2', '1.3'),
+        help='restrict the tls profile to this TLS version')
+    argparser.add_argument('--ab', metavar='PATH', default='ab',
+        help='ab executable (default: %(default)s)')
+    argparser.add_argument('--openssl', metavar='PATH', default='openssl',
+        help='openssl executable (default: %(default)s)')
+    argparser.add_argument('--output', '-O', metavar='FILENAME',
+        help='JSON result file (default: result-<date>.json)')
+    argparser.add_argument('--server-log', metavar='FILENAME',
+        help='append server output to this file')
+    argparser.add_argument('--keep', action='store_true',
+        help='do not remove the generated files from the docroot')
+    argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+        default=300, help='timeout for the server startup (default: '
+            '%(default)s)')
+
+
+def generate_files(docroot, sizes):
+    '''Create one file per size in *docroot*/bench (unless it exists) and
+    return ``{size: url_path}``.'''
+    directory = os.path.join(docroot, BENCH_DIR)
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for size in sizes:
+        nbytes = benchlib.parse_size(size)
+        path = os.path.join(directory, '{}.html'.format(size))
+        if not (os.path.exists(path) and os.path.getsize(path) == nbytes):
+            block = os.urandom(min(nbytes, 1 << 20))
+            with open(path, 'wb') as file:
+                remaining = nbytes
+                while remaining:
+                    remaining -= file.write(block[:remaining])
+        paths[size] = '/{}/{}.html'.format(BENCH_DIR, size)
+    return paths
+
+
+def parse_ab(output):
+    '''Parse the report of ``ab`` into a dictionary.'''
+    result = {}
+    for key, pattern in AB_PATTERNS.items():
+        match = re.search(pattern, output, re.MULTILINE)
+        result[key] = float(match.group(1)) if match else None
+    if result['requests_per_sec'] is None:
+        raise ValueError('no result in the ab output')
+    for key in ('requests', 'failed', 'non_2xx'):
+        result[key] = int(result[key] or 0)
+    kb_per_sec = result.pop('transfer_kb_per_sec')
+    result['mb_per_sec'] = kb_per_sec * 1024 / 1e6 if kb_per_sec else None
+    latency = {'mean': result.pop('latency_mean')}
+    for pct, value in AB_PERCENTILE_RE.findall(output):
+        latency['p' + pct] = float(value)
+    latency['max'] = latency.pop('p100', None)
+    result['latency_ms'] = latency
+    return result
+
+
+def run_ab(args, url, concurrency, duration):
+    '''Run ``ab -k`` against *url* for *duration* seconds.'''
+    # -t implies -n 50000; raise it so that only the time limit applies
+    argv = [args.ab, '-k', '-c', str(concurrency), '-t', str(duration),
+        '-n', '100000000', url]
+    returncode, stdout, stderr, _ = benchlib.run_capture(argv,
+        timeout=duration * 2 + 60, role='client')
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('ab exited with returncode {}'.format(returncode))
+    return parse_ab(stdout)
+
+
+def parse_s_time(output):
+    '''Return ``(connections, resumed)`` from the output of ``openssl
+    s_time``.
+
+    s_time prints a line with one character per connection, ``r`` when the
+    session was resumed, before its summary.
+    '''
+    match = S_TIME_RE.search(output)
+    if match is None:
+        raise ValueError('no result in the s_time output')
+    resumed = sum(line.count('r') for line in
+        S_TIME_PROGRESS_RE.findall(output[:match.start()]))
+    return int(match.group(1)), resumed
+
+
+def run_s_time(args, host, port, path, reuse):
+    argv = [args.openssl, 's_time', '-connect', '{}:{}'.format(host, port),
+        '-www', path, '-time', str(args.duration),
+        '-reuse' if reuse else '-new']
+    if args.tls_version:
+        argv.append('-tls' + args.tls_version.replace('.', '_'))
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv,
+        timeout=args.duration * 2 + 60, role='client')
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('openssl s_time exited with returncode {}'.format(
+            returncode))
+    connections, resumed = parse_s_time(stdout)
+    return connections, resumed, elapsed
+
+
+def measure_tls(args, host, port, path, handshake):
+    '''Run ``--tls-clients`` s_time processes in parallel.'''
+    reuse = handshake == 'resumed'
+    with concurrent.futures.ThreadPoolExecutor(args.tls_clients) as pool:
+        futures = [pool.submit(run_s_time, args, host, port, path, reuse)
+            for _ in range(args.tls_clients)]
+        runs = [future.result() for future in futures]
+    connections = sum(run[0] for run in runs)
+    resumed = sum(run[1] for run in runs)
+    rate = sum(run[0] / run[2] for run in runs if run[2])
+    return {
+        'handshake': handshake,
+        'clients': args.tls_clients,
+        'connections': connections,
+        'connections_per_sec': rate,
+        # s_time runs one connection after the other
+        'latency_ms': {'mean': args.tls_clients / rate * 1e3 if rate
+            else None},
+        'resumed_ratio': resumed / connections if connections else None,
+    }
+
+
+class _Running:
+    '''A started server configuration; collects the results measured on
+    it.'''
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, args, server, mode, variant, sendfile):
+        # pylint: disable=too-many-arguments
+        self.args = args
+        self.base = dict(server=server.name, mode=mode, sendfile=sendfile,
+            **variant)
+        argv, env, cwd = server.command(mode, variant, sendfile)
+        print('starting {} {} sendfile={}: {}'.format(mode,
+            variant['variant'], sendfile, ' '.join(argv)), file=sys.stderr)
+        self.server = benchlib.Server(argv, env=env, cwd=cwd, host=args.host,
+            port=args.port, timeout=args.timeout, log=args.server_log)
+
+    def __enter__(self):
+        self.server.__enter__()
+        self.base['startup_time'] = self.server.ready_time
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.__exit__(*exc_info)
+
+    def url(self, path):
+        return 'http://{}:{}{}'.format(self.args.host, self.args.port, path)
+
+    def load(self, profile, path, **extra):
+        results = []
+        for concurrency in benchlib.parse_list(self.args.concurrency):
+            result = run_ab(self.args, self.url(path), concurrency,
+                self.args.duration)
+            result.update(self.base, profile=profile, concurrency=concurrency,
+                **extra)
+            print('  {} concurrency={}: {:.0f} requests/s, {} failed'.format(
+                path, concurrency, result['requests_per_sec'],
+                result['failed']), file=sys.stderr)
+            results.append(result)
+        return results
+
+
+def run_profiles(args, server, profiles):
+    '''Run the selected profiles for every mode and return the results.'''
+    sizes = args.file_sizes.split(',')
+    small = args.small_file_size
+    paths = generate_files(server.docroot, sorted(set(sizes + [small]),
+        key=benchlib.parse_size))
+    sendfiles = args.sendfile
+    default = server.variants[0]
+
+    results = []
+    for mode in benchlib.get_modes(args):
+        if 'files' in profiles:
+            for sendfile in sendfiles:
+                with _Running(args, server, mode, default, sendfile) as run:
+                    run_ab(args, run.url(paths[small]), 1, args.warmup)
+                    for size in sizes:
+                        results += run.load('files', paths[size],
+                            file_size=size,
+                            file_bytes=benchlib.parse_size(size))
+
+        if 'tls' in profiles:
+            with _Running(args, server, mode, default, sendfiles[0]) as run:
+                benchlib.wait_for_port(args.host, server.tls_port,
+                    timeout=args.timeout)
+                for handshake in ('full', 'resumed'):
+                    result = measure_tls(args, args.host, server.tls_port,
+                        paths[small], handshake)
+                    result.update(run.base, profile='tls', file_size=small)
+                    print('  {} handshake: {:.0f} connections/s'.format(
+                        handshake, result['connections_per_sec']),
+                        file=sys.stderr)
+                    results.append(result)
+
+        if 'workers' in profiles:
+            for variant in server.variants:
+                with _Running(args, server, mode, variant,
+                        sendfiles[0]) as run:
+                    run_ab(args, run.url(paths[small]), 1, args.warmup)
+                    results += run.load('workers', paths[small],
+                        file_size=small)
+    return results
+
+
+def _geomean(values):
+    values = [value for value in values if value]
+    if not values:
+        return None
+    return math.exp(sum(math.log(value) for value in values) / len(values))
+
+
+def print_report(results, *, file=None):
+    '''Print the results of all profiles, each compared to native, and the
+    mean slowdown per profile and mode.'''
+    def key(result):
+        return tuple(result.get(name) for name in ('server', 'profile',
+            'variant', 'sendfile', 'file_size', 'concurrency', 'handshake'))
+    native = {key(result): result for result in results
+        if result['mode'] == 'native'}
+
+    rows = {profile: [] for profile in PROFILES}
+    for result in results:
+        metric = ('connections_per_sec' if result['profile'] == 'tls'
+            else 'requests_per_sec')
+        ref = native.get(key(result))
+        row = dict(result, **result['latency_ms'])
+        if ref and result[metric]:
+            row['slowdown'] = ref[metric] / result[metric]
+        rows[result['profile']].append(row)
+
+    common = [('server', 'server'), ('mode', 'mode')]
+    tables = {
+        'files': common + [
+            ('sendfile', 'sendfile'),
+            ('file_size', 'size'),
+            ('concurrency', 'conns'),
+            ('requests_per_sec', 'req/s', '.0f'),
+            ('mb_per_sec', 'MB/s', '.1f'),
+            ('p50', 'p50 [ms]', '.0f'),
+            ('p99', 'p99 [ms]', '.0f'),
+            ('failed', 'failed'),
+            ('slowdown', 'x native', '.2f'),
+        ],
+        'tls': common + [
+            ('variant', 'workers'),
+            ('handshake', 'handshake'),
+            ('clients', 'clients'),
+            ('connections_per_sec', 'conn/s', '.0f'),
+            ('mean', 'mean [ms]', '.2f'),
+            ('resumed_ratio', 'resumed', '.2f'),
+            ('slowdown', 'x native', '.2f'),
+        ],
+        'workers': common + [
+            ('variant', 'workers'),
+            ('concurrency', 'conns'),
+            ('requests_per_sec', 'req/s', '.0f'),
+            ('p50', 'p50 [ms]', '.0f'),
+            ('p99', 'p99 [ms]', '.0f'),
+            ('failed', 'failed'),
+            ('slowdown', 'x native', '.2f'),
+        ],
+    }
+    file = sys.stdout if file is None else file
+    summary = []
+    for profile in PROFILES:
+        if not rows[profile]:
+            continue
+        print('{} profile'.format(profile), file=file)
+        benchlib.print_table(rows[profile], tables[profile], file=file)
+        print(file=file)
+        groups = {}
+        for row in rows[profile]:
+            groups.setdefault((row['server'], row['mode']), []).append(
+                row.get('slowdown'))
+        for (name, mode), slowdowns in groups.items():
+            if mode != 'native':
+                summary.append({'server': name, 'profile': profile,
+                    'mode': mode, 'slowdown': _geomean(slowdowns)})
+
+    if summary:
+        print('mean slowdown per profile (geometric mean of x native)',
+            file=file)
+        benchlib.print_table(summary, [
+            ('server', 'server'),
+            ('profile', 'profile'),
+            ('mode', 'mode'),
+            ('slowdown', 'x native', '.2f'),
+        ], file=file)
+
+
+def run(args, server):
+    '''Run the profiles, print the report and write the result file;
+    return the exit code of the driver.'''
+    profiles = args.profile or PROFILES
+    results = run_profiles(args, server, profiles)
+    print_report(results)
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': server.name,
+        'host': benchlib.host_info(),
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+
+    if not args.keep:
+        shutil.rmtree(os.path.join(server.docroot, BENCH_DIR))
+    return min(sum(result.get('failed', 0) + result.get('non_2xx', 0)
+        for result in results), 255)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+'''
+Download benchmark for curl, natively, under Graphene and under Graphene-SGX.
+
+The driver generates files of the given sizes and counts in
+test-docroot/bench, serves test-docroot with a local multi-threaded HTTP
+server (pinned to the client CPUs) and downloads
+every size class with curl:
+
+- sequentially, with one curl process fetching all files of the class one
+  after the other;
+- in parallel, with ``--parallel`` curl processes fetching a share of the
+  files each.
+
+Downloads are written to the file system of the LibOS: to downloads/ with
+curl.manifest, or, with ``--storage protected``, to downloads-protected/ with
+curl-protected.manifest, where Graphene-SGX encrypts them as protected files.
+Protected files exist only under SGX (natively and under non-SGX Graphene they
+would be plain files), so this storage is skipped in the other modes.
+
+Reported are throughput (MB/s, 10^6 bytes per second of wall time, including
+curl startup) and the per-transfer latency reported by curl (``time_total``).
+'''
+
+import argparse
+import concurrent.futures
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+DOCROOT = 'test-docroot'
+BENCH_DIR = 'bench'
+STORAGE = {
+    # storage: (manifest, output directory)
+    'plain': ('curl.manifest', 'downloads'),
+    'protected': ('curl-protected.manifest', 'downloads-protected'),
+}
+WRITE_OUT = '%{http_code} %{size_download} %{time_total}\\n'
+# ``python -m http.server`` serves one request at a time before Python 3.7,
+# which would serialize the parallel downloads
+HTTP_SERVER = '''\
+import http.server, socketserver, sys
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+Server(('127.0.0.1', int(sys.argv[1])),
+    http.server.SimpleHTTPRequestHandler).serve_forever()
+'''
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--curl', metavar='PATH', default='curl',
+    help='curl executable for native runs (default: %(default)s)')
+argparser.add_argument('--files', '-f', metavar='SIZE:COUNT,...',
+    default='1K:1000,1M:100,100M:2',
+    help='comma-separated file sizes (K/M/G suffixes allowed) and counts, '
+        'e.g. 1G:1 (default: %(default)s)')
+argparser.add_argument('--parallel', '-j', metavar='N,...', default='1,4',
+    help='comma-separated numbers of concurrent curl processes; 1 means '
+        'sequential (default: %(default)s)')
+argparser.add_argument('--storage', '-s', metavar='NAME,...', default='plain',
+    help='comma-separated storage variants: plain, protected (SGX only) '
+        '(default: %(default)s)')
+argparser.add_argument('--urls-per-process', metavar='N', type=int,
+    default=200,
+    help='maximum number of URLs per curl command line (default: '
+        '%(default)s)')
+argparser.add_argument('--port', '-p', metavar='PORT', type=int, default=19111,
+    help='port of the local HTTP server (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--keep', action='store_true',
+    help='do not remove the generated files from the docroot')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single curl process (default: 3600)')
+
+
+def parse_files(value):
+    '''Parse ``SIZE:COUNT,...`` into ``[(name, nbytes, count)]``.'''
+    classes = []
+    for item in value.split(','):
+        size, _, count = item.partition(':')
+        classes.append((size.strip(), benchlib.parse_size(size),
+            int(count or 1)))
+    return classes
+
+
+def generate_files(name, nbytes, count):
+    '''Create *count* files of *nbytes* bytes in the docroot (unless they
+    exist) and return their paths relative to the docroot.'''
+    directory = os.path.join(DOCROOT, BENCH_DIR, name)
+    os.makedirs(directory, exist_ok=True)
+    block = os.urandom(min(nbytes, 1 << 20))
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, 'file-{}'.format(i))
+        if not (os.path.exists(path) and os.path.getsize(path) == nbytes):
+            with open(path, 'wb') as file:
+                remaining = nbytes
+                while remaining:
+                    remaining -= file.write(block[:remaining])
+        paths.append(os.path.relpath(path, DOCROOT))
+    return paths
+
+
+def parse_write_out(output):
+    '''Return ``[(http_code, size, time_total)]`` from the ``-w`` output.'''
+    transfers = []
+    for line in output.splitlines():
+        tokens = line.split()
+        if len(tokens) == 3 and tokens[0].isdigit():
+            transfers.append((int(tokens[0]), int(float(tokens[1])),
+                float(tokens[2])))
+    return transfers
+
+
+def run_curl(args, mode, manifest, out_dir, paths):
+    '''Download *paths* with one curl process after the other, at most
+    ``--urls-per-process`` URLs each; return the transfers.'''
+    transfers = []
+    for start in range(0, len(paths), args.urls_per_process):
+        curl_args = ['-s', '-S', '-w', WRITE_OUT]
+        for path in paths[start:start + args.urls_per_process]:
+            curl_args += ['-o', os.path.join(out_dir, path.replace('/', '_')),
+                'http://127.0.0.1:{}/{}'.format(args.port, path)]
+        argv, env = benchlib.command_for(mode, [args.curl, *curl_args],
+            manifest, loader=args.loader)
+        returncode, stdout, stderr, _ = benchlib.run_capture(argv, env=env,
+            timeout=args.timeout)
+        if returncode != 0:
+            sys.stderr.write(stderr)
+            raise RuntimeError('curl exited with returncode {}'.format(
+                returncode))
+        transfers.extend(parse_write_out(stdout))
+    return transfers
+
+
+def run_downloads(args, mode, storage, paths, nbytes, parallel):
+    # pylint: disable=too-many-arguments
+    manifest, out_dir = STORAGE[storage]
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    shares = [paths[i::parallel] for i in range(parallel)]
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(parallel) as pool:
+        futures = [pool.submit(run_curl, args, mode, manifest, out_dir, share)
+            for share in shares if share]
+        transfers = [transfer for future in futures
+            for transfer in future.result()]
+    wall_time = time.perf_counter() - start
+
+    failed = sum(1 for code, size, _ in transfers
+        if code != 200 or size != nbytes)
+    failed += len(paths) - len(transfers)
+    if storage == 'plain':
+        # protected files are larger on the host (encryption metadata)
+        failed += sum(1 for name in os.listdir(out_dir)
+            if os.path.getsize(os.path.join(out_dir, name)) != nbytes)
+    total = sum(size for _, size, _ in transfers)
+    shutil.rmtree(out_dir)
+    return {
+        'mode': mode,
+        'storage': storage,
+        'parallel': parallel,
+        'transfers': len(transfers),
+        'failed': failed,
+        'bytes': total,
+        'wall_time': wall_time,
+        'mb_per_sec': total / wall_time / 1e6,
+        'transfers_per_sec': len(transfers) / wall_time,
+        'latency_ms': benchlib.summarize([t * 1e3 for _, _, t in transfers]),
+    }
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    storages = args.storage.split(',')
+    for storage in storages:
+        if storage not in STORAGE:
+            argparser.error('unknown storage: {}'.format(storage))
+
+    classes = []
+    for name, nbytes, count in parse_files(args.files):
+        print('generating {} files of {}'.format(count, name), file=sys.stderr)
+        classes.append((name, nbytes, generate_files(name, nbytes, count)))
+
+    results = []
+    server_argv = [sys.executable, '-c', HTTP_SERVER, str(args.port)]
+    with benchlib.Server(server_argv, port=args.port, cwd=DOCROOT,
+            cpus=benchlib.get_cpus('client')):
+        for name, nbytes, paths in classes:
+            for storage in storages:
+                for mode in benchlib.get_modes(args):
+                    if storage == 'protected' and mode != 'sgx':
+                        print('skipping {} {}: protected files need '
+                            'SGX'.format(mode, storage), file=sys.stderr)
+                        continue
+                    for parallel in benchlib.parse_list(args.parallel):
+                        print('{} {} files={}x{} parallel={}'.format(mode,
+                            storage, len(paths), name, parallel),
+                            file=sys.stderr)
+                        result = run_downloads(args, mode, storage, paths,
+                            nbytes, parallel)
+                        result.update(file_size=name, file_bytes=nbytes)
+                        results.append(result)
+
+    def key(result):
+        return (result['file_size'], result['storage'], result['parallel'])
+    native = {key(result): result for result in results
+        if result['mode'] == 'native'}
+    rows = []
+    for result in results:
+        ref = native.get(key(result))
+        row = dict(result, p50=result['latency_ms'].get('p50'),
+            p99=result['latency_ms'].get('p99'))
+        if ref and result['mb_per_sec']:
+            row['slowdown'] = ref['mb_per_sec'] / result['mb_per_sec']
+        rows.append(row)
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('storage', 'storage'),
+        ('file_size', 'size'),
+        ('transfers', 'files'),
+        ('parallel', 'parallel'),
+        ('mb_per_sec', 'MB/s', '.1f'),
+        ('transfers_per_sec', 'files/s', '.1f'),
+        ('p50', 'p50 [ms]', '.2f'),
+        ('p99', 'p99 [ms]', '.2f'),
+        ('failed', 'failed'),
+        ('slowdown', 'x native', '.2f'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'curl',
+        'host': benchlib.host_info(),
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+
+    if not args.keep:
+        shutil.rmtree(os.path.join(DOCROOT, BENCH_DIR))
+    return min(sum(result['failed'] for result in results), 255)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
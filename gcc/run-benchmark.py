@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+'''
+Parallel build benchmark for gcc and its tools, natively, under Graphene and
+under Graphene-SGX.
+
+The driver generates a C project with a configurable number of translation
+units in test_files/project and builds it in two ways:
+
+- ``driver``: ``gcc -c`` per translation unit and a final ``gcc`` link, all
+  through gcc.manifest, like ``make -j`` would do;
+- ``stages``: every stage separately through its own manifest -- cc1 (C to
+  assembly), as (assembly to object) and collect2/ld (link) -- so that the
+  time spent in each tool is visible.
+
+The command lines of the individual tools are taken from ``gcc -###``, so the
+stages do exactly what the gcc driver would do. Compilation runs with ``-j``
+parallel jobs; reported are wall time and throughput (translation units per
+second) per stage. The linked program is run natively and its output checked.
+'''
+
+import argparse
+import concurrent.futures
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+# test_files is listed in sgx.allowed_files of all the manifests
+PROJECT_DIR = 'test_files/project'
+PROBE = '__probe__'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--units', '-n', metavar='N', type=int, default=200,
+    help='number of generated translation units (default: %(default)s)')
+argparser.add_argument('--functions', metavar='N', type=int, default=20,
+    help='functions per translation unit (default: %(default)s)')
+argparser.add_argument('--jobs', '-j', metavar='N,...',
+    default=str(len(os.sched_getaffinity(0))),
+    help='comma-separated numbers of parallel jobs (default: %(default)s)')
+argparser.add_argument('--cflags', metavar='FLAGS', default='-O2',
+    help='compiler flags (default: %(default)s)')
+argparser.add_argument('--pipeline', metavar='NAME', action='append',
+    choices=('driver', 'stages'),
+    help='build pipeline, driver or stages; may be given multiple times '
+        '(default: both)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--keep', action='store_true',
+    help='do not remove the generated project')
+
+UNIT_TEMPLATE = '''\
+#include <stdio.h>
+#include <string.h>
+#include "common.h"
+
+static int table[256];
+'''
+
+FUNCTION_TEMPLATE = '''
+static int func_{unit}_{func}(int x)
+{{
+    int acc = {func};
+    for (int i = 0; i < 64; i++) {{
+        table[(x + i) & 0xff] ^= acc;
+        acc = acc * 31 + table[(x * i) & 0xff] + COMMON_MIX(i);
+    }}
+    return acc & 0xffff;
+}}
+'''
+
+
+def generate_project(units, functions):
+    '''Generate the C project and return the list of source files.'''
+    if os.path.isdir(PROJECT_DIR):
+        shutil.rmtree(PROJECT_DIR)
+    os.makedirs(PROJECT_DIR)
+
+    with open(os.path.join(PROJECT_DIR, 'common.h'), 'w') as file:
+        file.write('#define COMMON_MIX(i) ((i) * 2654435761u >> 7)\n')
+        for unit in range(units):
+            file.write('int unit_{}(void);\n'.format(unit))
+
+    sources = []
+    for unit in range(units):
+        path = os.path.join(PROJECT_DIR, 'unit_{}.c'.format(unit))
+        with open(path, 'w') as file:
+            file.write(UNIT_TEMPLATE)
+            for func in range(functions):
+                file.write(FUNCTION_TEMPLATE.format(unit=unit, func=func))
+            file.write('\nint unit_{}(void)\n{{\n    int sum = 0;\n'.format(
+                unit))
+            for func in range(functions):
+                file.write('    sum += func_{}_{}(sum);\n'.format(unit, func))
+            file.write('    return sum;\n}\n')
+        sources.append(path)
+
+    path = os.path.join(PROJECT_DIR, 'main.c')
+    with open(path, 'w') as file:
+        file.write('#include <stdio.h>\n#include "common.h"\n\n'
+            'int main(void)\n{\n    unsigned long sum = 0;\n')
+        for unit in range(units):
+            file.write('    sum += unit_{}();\n'.format(unit))
+        file.write('    printf("%lu\\n", sum);\n    return 0;\n}\n')
+    sources.append(path)
+    return sources
+
+
+def probe_commands(cflags):
+    '''Return the cc1, as and collect2 command lines from ``gcc -###``.'''
+    probe = os.path.join(PROJECT_DIR, PROBE)
+    with open(probe + '.c', 'w') as file:
+        file.write('int main(void) { return 0; }\n')
+
+    def commands(argv):
+        output = subprocess.run(argv, stderr=subprocess.PIPE,
+            check=True).stderr.decode()
+        return [shlex.split(line) for line in output.splitlines()
+            if line.startswith(' ')]
+
+    cc1, as_ = commands(['gcc', '-###', *shlex.split(cflags), '-c',
+        probe + '.c', '-o', probe + '.o'])
+    collect2, = commands(['gcc', '-###', '-fno-use-linker-plugin',
+        probe + '.o', '-o', probe])
+    os.unlink(probe + '.c')
+    return cc1, as_, collect2
+
+
+def substitute(argv, old, new):
+    return [arg.replace(old, new) for arg in argv]
+
+
+def stage_commands(cc1, as_, collect2, sources, program):
+    '''Build the per-source cc1 and as commands and the link command.'''
+    probe = os.path.join(PROJECT_DIR, PROBE)
+    compile_cmds = []
+    assemble_cmds = []
+    objects = []
+    for source in sources:
+        stem = source[:-len('.c')]
+        cmd = substitute(cc1, probe, stem)
+        # cc1 writes to a temporary file, replace it with a stable name
+        cmd[cmd.index('-o') + 1] = stem + '.s'
+        compile_cmds.append(cmd)
+        cmd = substitute(as_, probe, stem)
+        cmd[-1] = stem + '.s'
+        assemble_cmds.append(cmd)
+        objects.append(stem + '.o')
+
+    link = []
+    for arg in collect2:
+        if arg == probe + '.o':
+            link.extend(objects)
+        elif arg == probe:
+            link.append(program)
+        else:
+            link.append(arg)
+    return compile_cmds, assemble_cmds, link
+
+
+def manifest_for(argv):
+    '''Return the manifest of the tool invoked by *argv*.'''
+    return os.path.basename(argv[0]) + '.manifest'
+
+
+def run_parallel(args, mode, commands, jobs):
+    '''Run *commands* with *jobs* parallel jobs; return wall time.'''
+    def run(native_argv):
+        argv, env = benchlib.command_for(mode, native_argv,
+            manifest_for(native_argv), loader=args.loader)
+        returncode, _, stderr, _ = benchlib.run_capture(argv, env=env)
+        if returncode != 0:
+            raise RuntimeError('{} failed with returncode {}:\n{}'.format(
+                ' '.join(argv), returncode, stderr))
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        for future in [pool.submit(run, cmd) for cmd in commands]:
+            future.result()
+    return time.perf_counter() - start
+
+
+def clean_outputs(sources, program):
+    for source in sources:
+        for suffix in ('.s', '.o'):
+            path = source[:-len('.c')] + suffix
+            if os.path.exists(path):
+                os.unlink(path)
+    if os.path.exists(program):
+        os.unlink(program)
+
+
+def check_program(program, expected):
+    output = subprocess.run([program], stdout=subprocess.PIPE,
+        check=True).stdout.decode().strip()
+    if expected is not None and output != expected:
+        raise RuntimeError('{} printed {!r}, expected {!r}'.format(program,
+            output, expected))
+    return output
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    pipelines = args.pipeline or ['driver', 'stages']
+    cflags = shlex.split(args.cflags)
+
+    sources = generate_project(args.units, args.functions)
+    cc1, as_, collect2 = probe_commands(args.cflags)
+    program = os.path.join(PROJECT_DIR, 'program')
+    compile_cmds, assemble_cmds, link_cmd = stage_commands(cc1, as_,
+        collect2, sources, program)
+    units = len(sources)
+
+    expected = None
+    results = []
+    for jobs in benchlib.parse_list(args.jobs):
+        for mode in benchlib.get_modes(args):
+            for pipeline in pipelines:
+                clean_outputs(sources, program)
+                print('{} {} -j{}'.format(mode, pipeline, jobs),
+                    file=sys.stderr)
+                if pipeline == 'driver':
+                    stages = [
+                        ('compile', [['gcc', *cflags, '-c', source, '-o',
+                            source[:-len('.c')] + '.o']
+                            for source in sources]),
+                        ('link', [['gcc', *[source[:-len('.c')] + '.o'
+                            for source in sources], '-o', program]]),
+                    ]
+                else:
+                    stages = [
+                        ('cc1', compile_cmds),
+                        ('as', assemble_cmds),
+                        ('link', [link_cmd]),
+                    ]
+                for stage, commands in stages:
+                    wall_time = run_parallel(args, mode, commands, jobs)
+                    results.append({
+                        'mode': mode,
+                        'pipeline': pipeline,
+                        'jobs': jobs,
+                        'stage': stage,
+                        'commands': len(commands),
+                        'wall_time': wall_time,
+                        'units_per_sec': (units / wall_time
+                            if stage != 'link' else None),
+                    })
+                expected = check_program(program, expected)
+
+    totals = {}
+    for result in results:
+        key = (result['mode'], result['pipeline'], result['jobs'])
+        totals[key] = totals.get(key, 0) + result['wall_time']
+    for (mode, pipeline, jobs), wall_time in sorted(totals.items()):
+        results.append({
+            'mode': mode,
+            'pipeline': pipeline,
+            'jobs': jobs,
+            'stage': 'total',
+            'wall_time': wall_time,
+            'units_per_sec': units / wall_time,
+        })
+
+    native = {(result['pipeline'], result['jobs'], result['stage']): result
+        for result in results if result['mode'] == 'native'}
+    for result in results:
+        ref = native.get((result['pipeline'], result['jobs'],
+            result['stage']))
+        if ref:
+            result['slowdown'] = result['wall_time'] / ref['wall_time']
+
+    benchlib.print_table(results, [
+        ('mode', 'mode'),
+        ('pipeline', 'pipeline'),
+        ('jobs', 'jobs'),
+        ('stage', 'stage'),
+        ('wall_time', 'wall [s]', '.2f'),
+        ('units_per_sec', 'TUs/s', '.1f'),
+        ('slowdown', 'x native', '.2f'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'gcc',
+        'host': benchlib.host_info(),
+        'units': units,
+        'functions': args.functions,
+        'cflags': args.cflags,
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+
+    if not args.keep:
+        shutil.rmtree(PROJECT_DIR)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,14 +24,23 @@ import configparser
 import logging
 import os
 import pathlib
+import re
 import shlex
+import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 import time
 
 from lxml import etree
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+# pylint: disable=wrong-import-position
+import benchlib
+import noisecontrol
+
 try:
     fspath = os.fspath
 except AttributeError:
@@ -41,6 +50,11 @@ except AttributeError:
 DEFAULT_CONFIG = 'ltp.cfg'
 ERRORHANDLER = 'backslashreplace'
 
+# mount points which get a private directory for each test with "isolate"
+SCRATCH_MOUNTS = ('/tmp', '/dev/shm')
+MOUNT_PATH_RE = re.compile(r'^fs\.mount\.(\w+)\.path\s*=\s*(\S+)\s*$', re.M)
+RELATIVE_URI_RE = re.compile(r'(=\s*file:)(?!/)(\S+)')
+
 argparser = argparse.ArgumentParser()
 argparser.add_argument('--config', '-c', metavar='FILENAME',
     action='append',
@@ -146,6 +160,7 @@ class TestRunner:
         self.stderr = None
         self.time = None
         self.props = {}
+        self.scratch = None
 
         self._added_result = False
 
@@ -245,14 +260,35 @@ class TestRunner:
         else:
             return self.cmd[0]
 
-    async def _run_cmd(self):
+    def _make_scratch(self):
+        '''Create a private scratch directory for the test and a manifest,
+        which mounts its subdirectories on :py:data:`SCRATCH_MOUNTS`.
+
+        Returns:
+            list: the command (full *argv*) to run the test with
+        '''
+        self.scratch = pathlib.Path(tempfile.mkdtemp(
+            prefix='{}-'.format(self.tag), dir=fspath(self.suite.scratch)))
+        manifest = self.suite.make_manifest(self.scratch, self.cmd[0])
+        return [*self.suite.loader, fspath(manifest), *self.cmd[1:]]
+
+    async def _run_cmd(self, *, native=False):
         '''Actually run the test and possibly set various attributes that result
         from the test run.
 
+        Args:
+            native (bool): run the test binary without Graphene (timing mode)
+
         Raises:
             AbnormalTestResult: for assorted failures
         '''
-        cmd = [*self.suite.loader, *self.cmd]
+        if native:
+            cmd = [fspath(self.suite.bindir.resolve() / self.cmd[0]),
+                *self.cmd[1:]]
+        elif self.suite.scratch is not None:
+            cmd = self._make_scratch()
+        else:
+            cmd = [*self.suite.loader, *self.cmd]
         timeout = self.cfgsection.getfloat('timeout')
         self.log.info('starting %r with timeout %d', cmd, timeout)
         start_time = time.time()
@@ -262,7 +298,7 @@ class TestRunner:
             *cmd,
             cwd=fspath(self.suite.bindir),
             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            preexec_fn=os.setsid,
+            preexec_fn=self.suite.setup_child,
             close_fds=True)
 
         try:
@@ -310,21 +346,80 @@ class TestRunner:
 
         return proc.returncode
 
+    async def _run(self, *, native=False):
+        '''Run the test once in a job slot and return the returncode.'''
+        exclusive = self.cfgsection.getboolean('exclusive', fallback=False)
+        await self.suite.acquire(exclusive=exclusive)
+        try:
+            return await self._run_cmd(native=native)
+        finally:
+            self.suite.release(exclusive=exclusive)
+            if self.scratch is not None:
+                self.suite.remove_scratch(self.scratch)
+                self.scratch = None
+
+    async def _measure(self):
+        '''Rerun a passed test until the mean of its wall time is precise
+        enough (timing mode), interleaved with native runs if
+        ``timing-native`` is set, and add the statistics to the properties.
+
+        The results of the first run are kept.
+        '''
+        suite = self.suite
+        mode = 'sgx' if suite.sgx else 'graphene'
+        variants = [mode, 'native'] if suite.timing_native else [mode]
+        interleaver = noisecontrol.Interleaver(variants,
+            rel_error=suite.timing_error, confidence=suite.timing_confidence,
+            min_runs=suite.timing, max_runs=suite.timing_max_runs)
+        first = self.time, self.stdout, self.stderr, self.props
+        self.props = dict(self.props)
+        returncode = self.props['returncode']
+        try:
+            for variant in interleaver:
+                if variant == mode and interleaver.rounds == 0:
+                    interleaver.add(variant, self.time)
+                    continue
+                if await self._run(native=(variant == 'native')) != returncode:
+                    raise Error('{} run returned {}'.format(variant,
+                        self.props['returncode']))
+                interleaver.add(variant, self.time)
+        except AbnormalTestResult as result:
+            self.log.warning('timing aborted: %s', result.message)
+            first[3]['time-aborted'] = result.message
+        finally:
+            self.time, self.stdout, self.stderr, self.props = first
+
+        summary = interleaver.samples[mode].summary()
+        self.props['time-runs'] = summary['runs']
+        self.props['time-mean'] = '{:.4f}'.format(summary['mean'])
+        if summary['ci'] is not None:
+            self.props['time-ci'] = '{:.4f}'.format(summary['ci'])
+        self.props['time-converged'] = interleaver.converged
+        if suite.timing_native:
+            native = interleaver.samples['native']
+            ratio = interleaver.ratios['native']
+            if len(native):
+                self.props['time-native-mean'] = '{:.4f}'.format(native.mean)
+            if len(ratio):
+                # native time relative to the time under Graphene
+                self.props['time-native-ratio'] = '{:.4f}'.format(ratio.mean)
+
     async def execute(self):
         '''Execute the test, parse the results and add report in the suite.'''
         try:
             self._prepare()
 
-            async with self.suite.semaphore:
-                returncode = await self._run_cmd()
+            returncode = await self._run()
 
             must_pass = self.cfgsection.getintset('must-pass')
             if must_pass is None:
                 if returncode != 0:
                     raise Fail('returncode={}'.format(returncode))
-                return
+            else:
+                self._parse_test_output(must_pass)
 
-            self._parse_test_output(must_pass)
+            if self.suite.timing:
+                await self._measure()
 
         except AbnormalTestResult as result:
             result.apply_to(self)
@@ -466,10 +561,72 @@ class TestSuite:
             _log.warning('WARNING: SGX is enabled and jobs = %d (!= 1);'
                 ' expect stability issues', processes)
 
+        # In timing mode, every passed test is rerun until the mean of its
+        # wall time is precise enough. Tests running in parallel would
+        # disturb each other, so they are run one at a time.
+        self.timing = config.getint(config.default_section, 'timing')
+        self.timing_max_runs = config.getint(config.default_section,
+            'timing-max-runs')
+        self.timing_error = config.getfloat(config.default_section,
+            'timing-error')
+        self.timing_confidence = config.getfloat(config.default_section,
+            'timing-confidence')
+        self.timing_native = config.getboolean(config.default_section,
+            'timing-native')
+        if self.timing and processes != 1:
+            _log.warning('timing is enabled; running tests one at a time')
+            processes = 1
+        self.cpus = benchlib.parse_cpus(
+            config.get(config.default_section, 'cpus')) or None
+
+        self.processes = processes
         self.semaphore = asyncio.BoundedSemaphore(processes)
+        self.exclusive_lock = asyncio.Lock()
         self.queue = []
+
+        # With isolate, every test gets private /tmp and /dev/shm, so tests
+        # using fixed file names do not collide when run in parallel. This
+        # needs a manifest per test, which is not possible under SGX.
+        self.isolate = config.getboolean(config.default_section, 'isolate')
+        if self.isolate and self.sgx:
+            _log.warning('WARNING: isolate is not supported under SGX'
+                ' (the manifests are signed); ignoring')
+            self.isolate = False
+        self.manifest = config.get(config.default_section, 'manifest') or None
+        self.scratch_root = (
+            config.get(config.default_section, 'scratch-root') or None)
+        self.scratch = None
+        self.cleanups = []
         self.xml = etree.Element('testsuite')
         self.time = 0
+        if self.timing or self.cpus:
+            self._add_host_state()
+
+    def _add_host_state(self):
+        '''Check the frequency governors, turbo boost and SMT of the host and
+        record them as properties of the report.'''
+        state = noisecontrol.system_state()
+        warnings = noisecontrol.check_state(state, self.cpus)
+        for warning in warnings:
+            _log.warning('WARNING: %s', warning)
+        properties = etree.SubElement(self.xml, 'properties')
+        items = [('governor-' + governor, cpulist)
+            for governor, cpulist in sorted(state['governors'].items())]
+        items += [(key, state[key]) for key in
+            ('scaling_driver', 'turbo', 'smt', 'isolated', 'loadavg')]
+        if self.cpus:
+            items.append(('cpus', benchlib.format_cpus(self.cpus)))
+        items += [('warning', warning) for warning in warnings]
+        for name, value in items:
+            etree.SubElement(properties, 'property', name=name,
+                value='' if value is None else str(value))
+
+    def setup_child(self):
+        '''Set up a test process before it executes (*preexec_fn*): put it in
+        its own session and pin it to the ``cpus``.'''
+        os.setsid()
+        if self.cpus:
+            os.sched_setaffinity(0, self.cpus)
 
     def add_test(self, tag, cmd):
         '''Instantiate appropriate :py:class:`TestRunner` and add it to the
@@ -481,6 +638,74 @@ class TestSuite:
         '''
         self.queue.append(TestRunner(self, tag, cmd))
 
+    def make_manifest(self, scratch, executable):
+        '''Write a manifest for a single test, which runs *executable* with
+        :py:data:`SCRATCH_MOUNTS` mounted from subdirectories of *scratch*.
+
+        Args:
+            scratch (pathlib.Path): the scratch directory of the test
+            executable (str): the executable, relative to the bindir
+
+        Returns:
+            pathlib.Path: path to the manifest
+        '''
+        bindir = self.bindir.resolve()
+        path = (pathlib.Path(self.manifest) if self.manifest
+            else bindir / 'manifest')
+        with path.open() as file:
+            manifest = file.read()
+
+        # the manifest is used from another directory
+        manifest = RELATIVE_URI_RE.sub(
+            lambda match: match.group(1) + fspath(bindir / match.group(2)),
+            manifest)
+
+        for name, mount in MOUNT_PATH_RE.findall(manifest):
+            if mount not in SCRATCH_MOUNTS:
+                continue
+            directory = scratch / mount.strip('/').replace('/', '-')
+            directory.mkdir()
+            manifest = re.sub(
+                r'^(fs\.mount\.{}\.uri\s*=\s*).*$'.format(re.escape(name)),
+                lambda match: match.group(1) + 'file:' + fspath(directory),
+                manifest, flags=re.M)
+
+        manifest = re.sub(r'^loader\.exec(name)?\s*=.*\n?', '', manifest,
+            flags=re.M)
+        manifest += '\nloader.exec = file:{}\nloader.execname = {}\n'.format(
+            fspath(bindir / executable), executable)
+
+        path = scratch / '{}.manifest'.format(os.path.basename(executable))
+        with path.open('w') as file:
+            file.write(manifest)
+        return path
+
+    async def acquire(self, *, exclusive=False):
+        '''Wait for a free job slot, or for all of them if *exclusive*.'''
+        if not exclusive:
+            await self.semaphore.acquire()
+            return
+        # only one test at a time may collect the slots, or two exclusive
+        # tests could deadlock, each holding a part of them
+        async with self.exclusive_lock:
+            for _ in range(self.processes):
+                await self.semaphore.acquire()
+
+    def release(self, *, exclusive=False):
+        '''Release the slot(s) taken by :py:meth:`acquire`.'''
+        for _ in range(self.processes if exclusive else 1):
+            self.semaphore.release()
+
+    def remove_scratch(self, path):
+        '''Remove a scratch directory in the background.
+
+        Args:
+            path (pathlib.Path): the directory
+        '''
+        loop = asyncio.get_event_loop()
+        self.cleanups.append(
+            loop.run_in_executor(None, shutil.rmtree, fspath(path), True))
+
     def add_result(self, element):
         '''Add a result.
 
@@ -540,7 +765,16 @@ class TestSuite:
 
     async def execute(self):
         '''Execute the suite'''
-        await asyncio.gather(*(runner.execute() for runner in self.queue))
+        if self.isolate:
+            self.scratch = pathlib.Path(tempfile.mkdtemp(prefix='ltp-',
+                dir=self.scratch_root))
+            _log.info('scratch directories in %s', self.scratch)
+        try:
+            await asyncio.gather(*(runner.execute() for runner in self.queue))
+            await asyncio.gather(*self.cleanups)
+        finally:
+            if self.scratch is not None:
+                shutil.rmtree(fspath(self.scratch), ignore_errors=True)
 
 
 def _getintset(value):
@@ -562,6 +796,15 @@ def load_config(files):
             'sgx': 'false',
             'loader': './pal_loader',
             'ltproot': './opt/ltp',
+            'isolate': 'false',
+            'manifest': '',
+            'scratch-root': '/dev/shm' if os.path.isdir('/dev/shm') else '',
+            'cpus': '',
+            'timing': '0',
+            'timing-max-runs': '30',
+            'timing-error': '0.02',
+            'timing-confidence': '0.95',
+            'timing-native': 'false',
             'junit-classname': 'apps.LTP',
         })
 
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+'''
+Load-test Memcached natively, under Graphene and under Graphene-SGX.
+
+For every mode and every number of Memcached worker threads (``-t``), the
+driver starts the server, waits until it accepts connections, fills the
+keyspace and then runs a closed-loop load for every combination of connection
+count, get/set ratio and value size. The load is generated by the asyncio
+client of loadclients.py speaking the Memcached text protocol; connections
+are spread over several client processes so that the Python client does not
+become the bottleneck.
+
+Reported are operations per second, failed requests and latency percentiles;
+all results are written to one JSON file.
+'''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+import loadclients  # pylint: disable=wrong-import-position
+
+MANIFEST = 'memcached'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--server', metavar='PATH', default='./memcached',
+    help='memcached executable (default: %(default)s)')
+argparser.add_argument('--port', '-p', metavar='PORT', type=int, default=11211,
+    help='port; must be allowed by net.allow_bind in the manifest '
+        '(default: %(default)s)')
+argparser.add_argument('--memory', metavar='MB', type=int, default=256,
+    help='memcached item memory in megabytes (-m, default: %(default)s)')
+argparser.add_argument('--threads', '-t', metavar='N,...', default='1,2,4',
+    help='comma-separated memcached worker thread counts; at most '
+        '(sgx.thread_num - 3) under SGX (default: %(default)s)')
+argparser.add_argument('--connections', '-c', metavar='N,...', default='8,64',
+    help='comma-separated client connection counts (default: %(default)s)')
+argparser.add_argument('--get-ratio', metavar='R,...', default='0.9',
+    help='comma-separated fractions of get requests (default: %(default)s)')
+argparser.add_argument('--value-size', '-d', metavar='N,...', default='32,4096',
+    help='comma-separated value sizes in bytes (default: %(default)s)')
+argparser.add_argument('--keyspace', metavar='N', type=int, default=10000,
+    help='number of distinct keys (default: %(default)s)')
+argparser.add_argument('--duration', metavar='SECONDS', type=float, default=10,
+    help='measured duration of every run (default: %(default)s)')
+argparser.add_argument('--warmup', metavar='SECONDS', type=float, default=2,
+    help='unmeasured warmup before every run (default: %(default)s)')
+argparser.add_argument('--client-processes', metavar='N', type=int,
+    default=max(1, min(4, len(os.sched_getaffinity(0)) // 2)),
+    help='client processes generating the load (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--server-log', metavar='FILENAME',
+    help='append server output to this file')
+
+
+def run_load(args, pool, connections, get_ratio, value_size):
+    options = {'key': 'key', 'keyspace': args.keyspace,
+        'get_ratio': get_ratio, 'value_size': value_size}
+    loadclients.run_loop(loadclients.setup('127.0.0.1', args.port,
+        loadclients.make_adapter('memcached', **options)))
+
+    shares = loadclients.split_shares(connections,
+        min(args.client_processes, connections))
+    load = loadclients.run_closed_loop(pool,
+        [('127.0.0.1', args.port, share) for share in shares], 'memcached',
+        options, warmup=args.warmup, duration=args.duration)
+    ops = load['requests']
+
+    stats = benchlib.summarize([i * 1e3 for i in load['latencies']],
+        percentiles=(50, 90, 99, 99.9))
+    return {
+        'connections': connections,
+        'get_ratio': get_ratio,
+        'value_size': value_size,
+        'ops': ops,
+        'errors': load['errors'],
+        'ops_per_sec': ops / args.duration,
+        'latency_ms': stats,
+    }
+
+
+def run_mode(args, pool, mode, threads):
+    server_args = ['-u', 'nobody', '-p', str(args.port), '-t', str(threads),
+        '-m', str(args.memory)]
+    argv, env = benchlib.command_for(mode, [args.server, *server_args],
+        MANIFEST, loader=args.loader)
+    print('starting {} threads={}: {}'.format(mode, threads, ' '.join(argv)),
+        file=sys.stderr)
+
+    results = []
+    with benchlib.Server(argv, env=env, port=args.port,
+            log=args.server_log) as server:
+        for connections in benchlib.parse_list(args.connections):
+            for get_ratio in benchlib.parse_list(args.get_ratio, float):
+                for value_size in benchlib.parse_list(args.value_size):
+                    result = run_load(args, pool, connections, get_ratio,
+                        value_size)
+                    result.update(mode=mode, threads=threads)
+                    print('  connections={} get_ratio={} value_size={}: '
+                        '{:.0f} ops/s, {} errors'.format(connections,
+                            get_ratio, value_size, result['ops_per_sec'],
+                            result['errors']), file=sys.stderr)
+                    results.append(result)
+    return server.ready_time, results
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+
+    startup = []
+    results = []
+    with loadclients.client_pool(args.client_processes) as pool:
+        for threads in benchlib.parse_list(args.threads):
+            for mode in benchlib.get_modes(args):
+                ready_time, mode_results = run_mode(args, pool, mode, threads)
+                startup.append({'mode': mode, 'threads': threads,
+                    'ready_time': ready_time})
+                results.extend(mode_results)
+
+    def key(result):
+        return (result['threads'], result['connections'],
+            result['get_ratio'], result['value_size'])
+    native = {key(result): result for result in results
+        if result['mode'] == 'native'}
+    rows = []
+    for result in results:
+        ref = native.get(key(result))
+        # the percentile columns of the table
+        row = dict(result, **result['latency_ms'])
+        if ref and result['ops_per_sec']:
+            row['slowdown'] = ref['ops_per_sec'] / result['ops_per_sec']
+        rows.append(row)
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('threads', 'threads'),
+        ('connections', 'conns'),
+        ('get_ratio', 'get ratio'),
+        ('value_size', 'size'),
+        ('ops_per_sec', 'ops/s', '.0f'),
+        ('p50', 'p50 [ms]', '.3f'),
+        ('p99', 'p99 [ms]', '.3f'),
+        ('p99.9', 'p99.9 [ms]', '.3f'),
+        ('errors', 'errors'),
+        ('slowdown', 'x native', '.2f'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'memcached',
+        'host': benchlib.host_info(),
+        'startup': startup,
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+'''
+Benchmark profiles for Nginx, natively, under Graphene and under Graphene-SGX.
+
+The driver generates an Nginx configuration for every server configuration in
+install/conf/bench (``worker_processes``, ``sendfile``, an HTTP and an HTTPS
+server) and runs the profiles of webbench.py against it:
+
+- ``files``: static files from 1K to 10M with sendfile on and off;
+- ``tls``: full TLS handshakes against resumed sessions;
+- ``workers``: a sweep over the number of worker processes (``--workers``).
+
+The HTTPS server uses the certificate created by ``make`` from
+../apache/ssl/ca_config.conf. Sessions are resumed with session tickets: a
+shared session cache needs memory shared between the worker processes, which
+Graphene does not provide.
+'''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+import webbench  # pylint: disable=wrong-import-position
+
+MANIFEST = 'nginx.manifest'
+INSTALL_DIR = 'install'
+# relative to INSTALL_DIR, the prefix of Nginx
+CONF_DIR = 'conf/bench'
+
+CONFIG = '''\
+# Generated by run-benchmark.py
+worker_processes {workers};
+daemon off;
+pid logs/nginx-bench.pid;
+
+events {{
+    worker_connections 1024;
+}}
+
+http {{
+    # relative to the directory of this file
+    include ../mime.types;
+    default_type application/octet-stream;
+    access_log off;
+    sendfile {sendfile};
+    keepalive_timeout 65;
+    keepalive_requests 1000000;
+
+    server {{
+        listen {host}:{port};
+        server_name {host};
+        location / {{
+            root html;
+        }}
+    }}
+
+    server {{
+        listen {host}:{tls_port} ssl;
+        server_name {host};
+        ssl_certificate ../server.crt;
+        ssl_certificate_key ../server.key;
+        ssl_session_tickets on;
+        location / {{
+            root html;
+        }}
+    }}
+}}
+'''
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+webbench.add_arguments(argparser, port=8002)
+argparser.add_argument('--tls-port', metavar='PORT', type=int, default=8444,
+    help='HTTPS port (default: %(default)s)')
+argparser.add_argument('--workers', '-w', metavar='N,...', default='1,2,4',
+    help='comma-separated numbers of worker processes; the first one is used '
+        'by the files and tls profiles (default: %(default)s)')
+argparser.add_argument('--nginx', metavar='PATH',
+    default=os.path.join(INSTALL_DIR, 'sbin', 'nginx'),
+    help='Nginx executable for native runs (default: %(default)s)')
+
+
+class NginxServer:
+    '''Nginx for webbench.run().'''
+    name = 'nginx'
+    docroot = os.path.join(INSTALL_DIR, 'html')
+
+    def __init__(self, args):
+        self.args = args
+        self.tls_port = args.tls_port
+        self.variants = [{'variant': 'w{}'.format(workers), 'workers': workers}
+            for workers in benchlib.parse_list(args.workers)]
+
+    def command(self, mode, variant, sendfile):
+        conf = os.path.join(CONF_DIR, 'nginx-{}-sendfile-{}.conf'.format(
+            variant['variant'], sendfile))
+        os.makedirs(os.path.join(INSTALL_DIR, CONF_DIR), exist_ok=True)
+        with open(os.path.join(INSTALL_DIR, conf), 'w') as file:
+            file.write(CONFIG.format(workers=variant['workers'],
+                sendfile=sendfile, host=self.args.host, port=self.args.port,
+                tls_port=self.tls_port))
+        argv, env = benchlib.command_for(mode, [self.args.nginx, '-c', conf],
+            MANIFEST, loader=self.args.loader)
+        return argv, env, None
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    return webbench.run(args, NginxServer(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+// HTTP server for run-benchmark.py.
+//
+// Usage: node cluster-server.js <port> [<workers> [http|express]]
+//
+// With <workers> > 0, the cluster module forks that many worker processes,
+// which share the listening port; with 0 (the default), the server runs in a
+// single process. The server answers every request with "Hello World!",
+// either with the plain http module or with express.
+//
+// When all workers listen, the master prints a JSON line with the time since
+// its start (process.uptime()), so that the startup time of the whole cluster
+// can be told apart from the startup time of a single Node.js process.
+
+'use strict';
+
+const cluster = require('cluster');
+const http = require('http');
+
+const port = parseInt(process.argv[2], 10);
+const workers = parseInt(process.argv[3] || '0', 10);
+const flavour = process.argv[4] || 'http';
+
+if (isNaN(port) || isNaN(workers) || ['http', 'express'].indexOf(flavour) < 0) {
+  console.log('Usage: node cluster-server.js <port> [<workers> [http|express]]');
+  process.exit(1);
+}
+
+function serve(onListening) {
+  let handler;
+  if (flavour === 'express') {
+    const express = require('express');
+    const app = express();
+    app.get('/', (req, res) => res.send('Hello World!'));
+    handler = app;
+  } else {
+    handler = (req, res) => {
+      res.writeHead(200, {'Content-Type': 'text/plain', 'Content-Length': 12});
+      res.end('Hello World!');
+    };
+  }
+  const server = http.createServer(handler);
+  // the load generator keeps its connections open between runs
+  server.keepAliveTimeout = 60000;
+  server.listen(port, onListening);
+}
+
+function ready() {
+  console.log(JSON.stringify({
+    ready: process.uptime(),
+    workers: workers,
+    flavour: flavour,
+  }));
+}
+
+if (workers > 0 && cluster.isMaster) {
+  let listening = 0;
+  cluster.on('listening', () => {
+    listening += 1;
+    if (listening === workers) {
+      ready();
+    }
+  });
+  cluster.on('exit', (worker, code, signal) => {
+    console.error(`worker ${worker.process.pid} exited (${signal || code})`);
+  });
+  for (let i = 0; i < workers; i++) {
+    cluster.fork();
+  }
+} else if (workers > 0) {
+  serve();
+} else {
+  serve(ready);
+}
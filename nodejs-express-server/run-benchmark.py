@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+'''
+HTTP benchmark for Node.js, natively, under Graphene and under Graphene-SGX.
+
+The driver measures:
+
+- the startup time of Node.js itself, i.e. ``node -e 0`` (V8 initialisation
+  is slow under the LibOS);
+- the startup time of cluster-server.js with a given number of cluster workers
+  (``--workers``; 0 runs the server in a single process), until all workers
+  listen;
+- requests per second and latency percentiles for every concurrency level,
+  with the plain http module and with express (``--flavour``).
+
+The load is generated by the asyncio HTTP/1.1 client of loadclients.py,
+which keeps every connection alive (closed loop: the next request is sent
+when the reply arrives); connections are spread over several client
+processes so that the Python client does not become the bottleneck. All
+results are written to one JSON file.
+
+Note that cluster workers are separate processes which receive the
+connections from the master, so under Graphene-SGX every worker runs in its
+own enclave.
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+import loadclients  # pylint: disable=wrong-import-position
+
+MANIFEST = 'nodejs.manifest'
+SERVER_SCRIPT = 'cluster-server.js'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--node', metavar='PATH',
+    default=shutil.which('nodejs') or 'node',
+    help='Node.js executable for native runs (default: %(default)s)')
+argparser.add_argument('--port', '-p', metavar='PORT', type=int, default=3000,
+    help='server port (default: %(default)s)')
+argparser.add_argument('--workers', '-w', metavar='N,...', default='0,1,2,4',
+    help='comma-separated numbers of cluster workers, 0 for no cluster '
+        '(default: %(default)s)')
+argparser.add_argument('--flavour', metavar='NAME,...', default='http,express',
+    help='comma-separated server flavours, http and/or express; express '
+        'requires "npm install" (default: %(default)s)')
+argparser.add_argument('--concurrency', '-c', metavar='N,...',
+    default='1,16,64',
+    help='comma-separated numbers of keep-alive connections '
+        '(default: %(default)s)')
+argparser.add_argument('--duration', metavar='SECONDS', type=float, default=10,
+    help='measured duration of every run (default: %(default)s)')
+argparser.add_argument('--warmup', metavar='SECONDS', type=float, default=2,
+    help='unmeasured warmup before every run (default: %(default)s)')
+argparser.add_argument('--startup-runs', metavar='N', type=int, default=5,
+    help='runs of "node -e 0" per mode (default: %(default)s)')
+argparser.add_argument('--client-processes', metavar='N', type=int,
+    default=max(1, min(4, len(os.sched_getaffinity(0)) // 2)),
+    help='client processes generating the load (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--server-log', metavar='FILENAME',
+    help='append server output to this file')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=300, help='timeout for the server startup (default: %(default)s)')
+
+
+def run_load(args, pool, connections):
+    shares = loadclients.split_shares(connections,
+        min(args.client_processes, connections))
+    load = loadclients.run_closed_loop(pool,
+        [('127.0.0.1', args.port, share) for share in shares], 'http',
+        {'expect_status': 200}, warmup=args.warmup, duration=args.duration)
+
+    return {
+        'concurrency': connections,
+        'requests': load['requests'],
+        'errors': load['errors'],
+        'requests_per_sec': load['requests'] / args.duration,
+        'latency_ms': benchlib.summarize(
+            [i * 1e3 for i in load['latencies']],
+            percentiles=(50, 90, 99, 99.9)),
+    }
+
+
+def node_startup(args, mode):
+    '''Return the wall times of ``node -e 0``.'''
+    argv, env = benchlib.command_for(mode, [args.node, '-e', '0'], MANIFEST,
+        loader=args.loader)
+    times = []
+    for _ in range(args.startup_runs):
+        returncode, _, stderr, elapsed = benchlib.run_capture(argv, env=env,
+            timeout=args.timeout)
+        if returncode != 0:
+            sys.stderr.write(stderr)
+            raise RuntimeError('{} exited with returncode {}'.format(
+                ' '.join(argv), returncode))
+        times.append(elapsed)
+    return times
+
+
+def wait_for_ready(log, start, timeout):
+    '''Wait for the JSON line that cluster-server.js prints when all workers
+    listen; return it together with the time since *start*.'''
+    while True:
+        with open(log, errors='replace') as file:
+            try:
+                return benchlib.find_json_line(file.read()), (
+                    time.perf_counter() - start)
+            except ValueError:
+                pass
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError('timed out waiting for the server')
+        time.sleep(0.05)
+
+
+def run_server(args, pool, mode, workers, flavour):
+    argv, env = benchlib.command_for(mode, [args.node, SERVER_SCRIPT,
+        str(args.port), str(workers), flavour], MANIFEST, loader=args.loader)
+    print('starting {} workers={} {}: {}'.format(mode, workers, flavour,
+        ' '.join(argv)), file=sys.stderr)
+
+    fd, log = tempfile.mkstemp(prefix='server-', suffix='.log', dir='.')
+    os.close(fd)
+    results = []
+    try:
+        start = time.perf_counter()
+        with benchlib.Server(argv, env=env, port=args.port, log=log,
+                timeout=args.timeout) as server:
+            ready, startup_time = wait_for_ready(log, start, args.timeout)
+            startup = {
+                'mode': mode,
+                'workers': workers,
+                'flavour': flavour,
+                'port_ready_time': server.ready_time,
+                'startup_time': startup_time,
+                'server_uptime': ready['ready'],
+            }
+            for connections in benchlib.parse_list(args.concurrency):
+                result = run_load(args, pool, connections)
+                result.update(mode=mode, workers=workers, flavour=flavour)
+                print('  concurrency={}: {:.0f} requests/s, {} errors'.format(
+                    connections, result['requests_per_sec'],
+                    result['errors']), file=sys.stderr)
+                results.append(result)
+    finally:
+        if args.server_log:
+            with open(log) as src, open(args.server_log, 'a') as dst:
+                dst.write(src.read())
+        os.unlink(log)
+    return startup, results
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    modes = benchlib.get_modes(args)
+
+    node = []
+    for mode in modes:
+        times = node_startup(args, mode)
+        node.append(dict(benchlib.summarize(times), mode=mode))
+    benchlib.print_table(node, [
+        ('mode', 'mode'),
+        ('count', 'runs'),
+        ('min', 'node -e 0 min [s]', '.3f'),
+        ('mean', 'mean [s]', '.3f'),
+        ('max', 'max [s]', '.3f'),
+    ])
+    print()
+
+    startup = []
+    results = []
+    with loadclients.client_pool(args.client_processes) as pool:
+        for flavour in args.flavour.split(','):
+            for workers in benchlib.parse_list(args.workers):
+                for mode in modes:
+                    mode_startup, mode_results = run_server(args, pool, mode,
+                        workers, flavour)
+                    startup.append(mode_startup)
+                    results.extend(mode_results)
+
+    benchlib.print_table(startup, [
+        ('mode', 'mode'),
+        ('flavour', 'flavour'),
+        ('workers', 'workers'),
+        ('port_ready_time', 'port ready [s]', '.3f'),
+        ('startup_time', 'all workers ready [s]', '.3f'),
+    ])
+    print()
+
+    def key(result):
+        return (result['flavour'], result['workers'], result['concurrency'])
+    native = {key(result): result for result in results
+        if result['mode'] == 'native'}
+    rows = []
+    for result in results:
+        ref = native.get(key(result))
+        row = dict(result, **{k: v for k, v in result['latency_ms'].items()
+            if k.startswith('p')})
+        if ref and result['requests_per_sec']:
+            row['slowdown'] = (ref['requests_per_sec']
+                / result['requests_per_sec'])
+        rows.append(row)
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('flavour', 'flavour'),
+        ('workers', 'workers'),
+        ('concurrency', 'conns'),
+        ('requests_per_sec', 'req/s', '.0f'),
+        ('p50', 'p50 [ms]', '.2f'),
+        ('p99', 'p99 [ms]', '.2f'),
+        ('p99.9', 'p99.9 [ms]', '.2f'),
+        ('errors', 'errors'),
+        ('slowdown', 'x native', '.2f'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'nodejs',
+        'host': benchlib.host_info(),
+        'node_startup': node,
+        'startup': startup,
+        'results': results,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+'''
+Inference benchmark for OpenVINO, natively, under Graphene and under
+Graphene-SGX.
+
+The driver runs OpenVINO's benchmark_app (built together with
+object_detection_sample_ssd) through benchmark_app.manifest for every
+combination of batch size (``-b``), CPU threads (``-nthreads``, the intra-op
+threads) and CPU streams (``-nstreams``, the inter-op parallelism) over the
+images in a directory.
+
+For every mode, a probe run with a single synchronous inference measures the
+model load time and the latency of the first inference. benchmark_app prints
+the time of LoadNetwork() (reading the IR and compiling it for the CPU
+plugin) on newer releases; otherwise the load time is the wall time of the
+probe minus its inference time, so it includes process and enclave startup.
+Steady-state throughput and median latency are taken from benchmark_app's
+report. benchmark_app does not print the latency of single inferences, so
+only percentiles over the per-run medians are reported (``run_latency_*``;
+``latency_*`` are None).
+
+The native benchmark_app is looked up in the build directory of the
+Makefile; set ``OPENVINO_BUILD=Debug`` for a ``make DEBUG=1`` build, or give
+its path with ``--benchmark-app``.
+
+Models in another format than IR (``--model model.caffemodel``, ``.onnx``,
+``.pb``) are converted with the Model Optimizer once and kept in
+model_cache/, keyed by the contents of the model and the converter options,
+so that repeated runs skip the conversion. The results use the same schema as
+the pytorch and tensorflow drivers (see ``benchlib.print_inference_results``).
+'''
+
+import argparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+MANIFEST = 'benchmark_app.manifest'
+CACHE_DIR = 'model_cache'
+BENCHMARK_APP = os.path.join('openvino', 'inference-engine', 'bin', 'intel64',
+    os.environ.get('OPENVINO_BUILD', 'Release'), 'benchmark_app')
+MODEL_OPTIMIZER = 'openvino/model-optimizer/mo.py'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--model', '-M', metavar='FILENAME',
+    default='model/VGG_VOC0712Plus_SSD_300x300_ft_iter_160000.xml',
+    help='IR model (.xml), or a model converted with the Model Optimizer '
+        '(default: %(default)s)')
+argparser.add_argument('--images', '-i', metavar='PATH', default='images',
+    help='image or directory of images; must be in sgx.allowed_files '
+        '(default: %(default)s)')
+argparser.add_argument('--benchmark-app', metavar='PATH',
+    default=BENCHMARK_APP, help='benchmark_app executable for native runs '
+        '(default: %(default)s, from $OPENVINO_BUILD)')
+argparser.add_argument('--batch-sizes', '-b', metavar='N,...', default='1',
+    help='comma-separated batch sizes (default: %(default)s)')
+argparser.add_argument('--threads', '-t', metavar='N,...', default='4',
+    help='comma-separated CPU thread counts; at most (sgx.thread_num - 2) '
+        'under SGX (default: %(default)s)')
+argparser.add_argument('--streams', '-s', metavar='N,...', default='1',
+    help='comma-separated CPU stream counts (default: %(default)s)')
+argparser.add_argument('--api', choices=('sync', 'async'), default='async',
+    help='benchmark_app inference API (default: %(default)s)')
+argparser.add_argument('--iterations', '-n', metavar='N', type=int,
+    default=100,
+    help='inferences per run (default: %(default)s)')
+argparser.add_argument('--repeats', '-r', metavar='N', type=int, default=3,
+    help='runs per configuration (default: %(default)s)')
+argparser.add_argument('--mo-args', metavar='ARGS', default='',
+    help='extra Model Optimizer arguments, given as '
+        '--mo-args="--input_proto deploy.prototxt"')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single run (default: 3600)')
+
+# benchmark_app reports, among others:
+#   [ INFO ] Load network took 1234.56 ms
+#   [ INFO ] First inference took 45.67 ms
+#   Count:      400 iterations
+#   Duration:   10042.18 ms
+#   Latency:    98.92 ms
+#   Throughput: 39.83 FPS
+PATTERNS = {
+    'load_network': re.compile(r'Load network took\s+([\d.]+) ms'),
+    'first_inference': re.compile(r'First inference took\s+([\d.]+) ms'),
+    'count': re.compile(r'Count:\s+(\d+) iterations'),
+    'duration': re.compile(r'Duration:\s+([\d.]+) ms'),
+    'latency': re.compile(r'Latency:\s+([\d.]+) ms'),
+    'throughput': re.compile(r'Throughput:\s+([\d.]+) FPS'),
+}
+
+
+def parse_report(output):
+    '''Return the values of :py:data:`PATTERNS` found in *output*; times are
+    converted to seconds.'''
+    report = {}
+    for name, pattern in PATTERNS.items():
+        match = pattern.search(output)
+        if match:
+            value = float(match.group(1))
+            report[name] = value if name in ('count', 'throughput') else (
+                value / 1e3)
+    return report
+
+
+def prepare_model(args):
+    '''Return ``(path, cache_status, conversion_time)`` of the IR model.
+
+    *cache_status* is None for a model that needs no conversion.
+    '''
+    if args.model.endswith('.xml'):
+        return args.model, None, None
+    mo_args = shlex.split(args.mo_args)
+
+    def convert(directory):
+        subprocess.run([sys.executable, MODEL_OPTIMIZER,
+            '--input_model', args.model, '--output_dir', directory,
+            '--model_name', 'model', *mo_args], check=True)
+
+    directory, hit, build_time = benchlib.cached_build(CACHE_DIR,
+        [args.model], mo_args, convert)
+    return (os.path.join(directory, 'model.xml'), 'hit' if hit else 'miss',
+        build_time)
+
+
+def benchmark_app(args, mode, model, options):
+    '''Run benchmark_app and return ``(report, wall_time)``.'''
+    native_argv = [args.benchmark_app, '-m', model, '-i', args.images,
+        '-d', 'CPU', *options]
+    argv, env = benchlib.command_for(mode, native_argv, MANIFEST,
+        loader=args.loader)
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        timeout=args.timeout)
+    report = parse_report(stdout + stderr)
+    if returncode != 0 or 'latency' not in report:
+        sys.stderr.write(stdout + stderr)
+        raise RuntimeError('{} failed with returncode {}'.format(
+            ' '.join(argv), returncode))
+    return report, elapsed
+
+
+def run_mode(args, mode, model):
+    threads_list = benchlib.parse_list(args.threads)
+    report, wall = benchmark_app(args, mode, model, ['-api', 'sync',
+        '-niter', '1', '-b', '1', '-nthreads', str(threads_list[0])])
+    first = report.get('first_inference', report['latency'])
+    load_time = report.get('load_network')
+    if load_time is None:
+        load_time = wall - report.get('duration', first)
+    run = {
+        'mode': mode,
+        'framework': 'openvino',
+        'model': args.model,
+        'model_load_time': load_time,
+        'first_inference_latency': first,
+        'top_class': None,
+        'wall_time': wall,
+        'results': [],
+    }
+
+    for threads in threads_list:
+        for streams in benchlib.parse_list(args.streams):
+            for batch_size in benchlib.parse_list(args.batch_sizes):
+                latencies = []
+                throughputs = []
+                for _ in range(args.repeats):
+                    report, wall = benchmark_app(args, mode, model, [
+                        '-api', args.api, '-niter', str(args.iterations),
+                        '-b', str(batch_size), '-nthreads', str(threads),
+                        '-nstreams', str(streams)])
+                    latencies.append(report['latency'])
+                    throughputs.append(report['throughput'])
+                    run['wall_time'] += wall
+                stats = benchlib.summarize(latencies)
+                images_per_sec = sum(throughputs) / len(throughputs)
+                run['results'].append({
+                    'batch_size': batch_size,
+                    'threads': threads,
+                    'inter_op_threads': streams,
+                    'images': args.repeats * args.iterations * batch_size,
+                    'images_per_sec': images_per_sec,
+                    'run_latency_p50': stats['p50'],
+                    'run_latency_p90': stats['p90'],
+                    'run_latency_p99': stats['p99'],
+                    'run_latency_max': stats['max'],
+                })
+                print('{} threads={} streams={} batch_size={}: {:.2f} '
+                    'images/s'.format(mode, threads, streams, batch_size,
+                        images_per_sec), file=sys.stderr)
+    return benchlib.complete_inference_run(run)
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    model, cache, conversion_time = prepare_model(args)
+    runs = []
+    for mode in benchlib.get_modes(args):
+        run = run_mode(args, mode, model)
+        run.update(model_cache=cache, model_conversion_time=conversion_time)
+        runs.append(run)
+
+    benchlib.print_inference_results(runs)
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'openvino',
+        'host': benchlib.host_info(),
+        'api': args.api,
+        'iterations': args.iterations,
+        'runs': runs,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+'''
+Run scripts/benchmark-numpy.py natively, under Graphene and under Graphene-SGX
+for several BLAS thread counts, and collect the results in one JSON file.
+
+The summary table shows GFLOP/s (compute-bound kernels) or GB/s (memory-bound
+kernels) for every mode, the slowdown relative to native, and marks the sizes
+at which throughput drops sharply compared to the previous size, which is
+where enclave paging (EPC exhaustion) usually kicks in.
+'''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+SCRIPT = 'scripts/benchmark-numpy.py'
+MANIFEST = 'python.manifest'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--python', metavar='PATH', default=sys.executable,
+    help='Python interpreter for native runs (default: %(default)s)')
+argparser.add_argument('--threads', '-t', metavar='N,...', default='1',
+    help='comma-separated BLAS thread counts to sweep (default: 1)')
+argparser.add_argument('--collapse', metavar='RATIO', type=float, default=0.5,
+    help='mark a size when throughput falls below RATIO of the previous '
+        'size (default: 0.5)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single run (default: 3600)')
+argparser.add_argument('bench_args', metavar='ARG', nargs='*',
+    help='arguments passed to {} (after --)'.format(SCRIPT))
+
+
+def run_once(args, mode, threads):
+    script_args = [SCRIPT, '--threads', str(threads), *args.bench_args]
+    argv, env = benchlib.command_for(mode, [args.python, *script_args],
+        MANIFEST, loader=args.loader)
+    print('running {} threads={}: {}'.format(mode, threads, ' '.join(argv)),
+        file=sys.stderr)
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        timeout=args.timeout)
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('{} exited with returncode {}'.format(
+            ' '.join(argv), returncode))
+    result = benchlib.find_json_line(stdout)
+    result.update(mode=mode, wall_time=elapsed)
+    return result
+
+
+def summarize(runs, collapse):
+    native = {}
+    for run in runs:
+        if run['mode'] != 'native':
+            continue
+        for item in run['results']:
+            native[run['threads'], item['kernel'], item['size']] = item
+
+    rows = []
+    previous = {}
+    for run in runs:
+        for item in run['results']:
+            metric = 'gbps' if 'gbps' in item else 'gflops'
+            value = item[metric]
+            key = (run['mode'], run['threads'], item['kernel'])
+            ref = native.get((run['threads'], item['kernel'], item['size']))
+            row = {
+                'mode': run['mode'],
+                'threads': run['threads'],
+                'kernel': item['kernel'],
+                'size': item['size'],
+                'median': item['median'],
+                'unit': 'GFLOP/s' if metric == 'gflops' else 'GB/s',
+                'value': value,
+                'slowdown': item['median'] / ref['median'] if ref else None,
+                'collapse': '',
+            }
+            if key in previous and value < previous[key] * collapse:
+                row['collapse'] = '<-'
+            previous[key] = value
+            rows.append(row)
+    return rows
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    threads_list = benchlib.parse_list(args.threads)
+
+    runs = []
+    for threads in threads_list:
+        for mode in benchlib.get_modes(args):
+            runs.append(run_once(args, mode, threads))
+
+    rows = summarize(runs, args.collapse)
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('threads', 'threads'),
+        ('kernel', 'kernel'),
+        ('size', 'size'),
+        ('median', 'median [s]', '.6f'),
+        ('value', 'throughput', '.3f'),
+        ('unit', 'unit'),
+        ('slowdown', 'x native', '.2f'),
+        ('collapse', 'drop'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'numpy',
+        'host': benchlib.host_info(),
+        'runs': runs,
+        'summary': rows,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+'''
+Numerical kernel benchmark for NumPy/SciPy.
+
+Runs compute-bound kernels (matrix multiplication, Cholesky, SVD) over a range
+of matrix sizes and memory-bound kernels (array copy, elementwise ufuncs, FFT)
+over a range of array sizes. Every kernel is run once to warm up and then
+timed REPEATS times. The result is printed as a single JSON line, so that it
+can be collected by ../run-benchmark.py.
+
+The BLAS thread count must be set before NumPy is imported, so it is an
+argument of this script rather than a sweep inside it.
+'''
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import types
+
+DEFAULT_MATRIX_SIZES = '256,512,1024,2048'
+DEFAULT_ARRAY_SIZES = '1M,16M,64M,256M'
+MATRIX_KERNELS = ('dot', 'cholesky', 'svd')
+ARRAY_KERNELS = ('copy', 'ufunc', 'fft')
+
+BLAS_THREAD_VARIABLES = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS',
+)
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('--threads', '-t', metavar='N', type=int,
+    help='number of BLAS/OpenMP threads (default: library default)')
+argparser.add_argument('--matrix-sizes', metavar='N,...',
+    default=DEFAULT_MATRIX_SIZES,
+    help='matrix dimensions (default: {})'.format(DEFAULT_MATRIX_SIZES))
+argparser.add_argument('--array-sizes', metavar='SIZE,...',
+    default=DEFAULT_ARRAY_SIZES,
+    help='array sizes in bytes, K/M/G suffixes allowed (default: {})'.format(
+        DEFAULT_ARRAY_SIZES))
+argparser.add_argument('--kernel', '-k', metavar='NAME',
+    action='append', choices=MATRIX_KERNELS + ARRAY_KERNELS,
+    help='run only this kernel; may be given multiple times')
+argparser.add_argument('--repeats', '-r', metavar='N', type=int, default=5,
+    help='timed repetitions of every kernel (default: 5)')
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def measure(func, repeats):
+    '''Run *func* once to warm up, then *repeats* times, and return the list
+    of elapsed times in seconds.'''
+    func()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def matrix_kernels(numpy, linalg, size):
+    '''Return ``{name: (func, flops)}`` for a given matrix dimension.'''
+    x = numpy.random.random((size, size))
+    spd = numpy.dot(x, x.T) + size * numpy.eye(size)
+    out = numpy.empty_like(x)
+
+    return {
+        'dot': (lambda: numpy.dot(x, x.T, out=out), 2 * size ** 3),
+        'cholesky': (lambda: linalg.cholesky(spd), size ** 3 / 3),
+        # Golub-Reinsch SVD of a square matrix, singular values and vectors
+        'svd': (lambda: linalg.svd(spd), 22 * size ** 3),
+    }
+
+
+def array_kernels(numpy, nbytes):
+    '''Return ``{name: (func, flops, bytes moved)}`` for a given array size.'''
+    count = max(1, nbytes // 8)
+    a = numpy.random.random(count)
+    b = numpy.random.random(count)
+    c = numpy.empty_like(a)
+
+    def copy():
+        numpy.copyto(c, a)
+
+    def ufunc():
+        # c = a * b + a, without temporaries
+        numpy.multiply(a, b, out=c)
+        numpy.add(c, a, out=c)
+
+    def fft():
+        numpy.fft.rfft(a)
+
+    return {
+        'copy': (copy, 0, 2 * 8 * count),
+        'ufunc': (ufunc, 2 * count, 5 * 8 * count),
+        # rfft is half the work of a complex FFT of the same length
+        'fft': (fft, 2.5 * count * math.log2(max(count, 2)), 3 * 8 * count),
+    }
+
+
+def make_result(kernel, size, nbytes, times, flops, moved):
+    best = median(times)
+    result = {
+        'kernel': kernel,
+        'size': size,
+        'bytes': nbytes,
+        'times': times,
+        'median': best,
+        'min': min(times),
+        'max': max(times),
+    }
+    if flops:
+        result['gflops'] = flops / best / 1e9
+    if moved:
+        result['gbps'] = moved / best / 1e9
+    return result
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+
+    if args.threads is not None:
+        for name in BLAS_THREAD_VARIABLES:
+            os.environ[name] = str(args.threads)
+
+    # pylint: disable=import-outside-toplevel
+    import numpy
+    try:
+        import scipy
+        import scipy.linalg
+        # same lower-triangular result as numpy.linalg.cholesky
+        linalg = types.SimpleNamespace(
+            cholesky=lambda a: scipy.linalg.cholesky(a, lower=True),
+            svd=scipy.linalg.svd)
+        scipy_version = scipy.__version__
+    except ImportError:
+        linalg = numpy.linalg
+        scipy_version = None
+
+    kernels = args.kernel or (MATRIX_KERNELS + ARRAY_KERNELS)
+    results = []
+
+    for size in (int(i) for i in args.matrix_sizes.split(',') if i):
+        if not any(k in MATRIX_KERNELS for k in kernels):
+            break
+        funcs = matrix_kernels(numpy, linalg, size)
+        for kernel in MATRIX_KERNELS:
+            if kernel not in kernels:
+                continue
+            func, flops = funcs[kernel]
+            times = measure(func, args.repeats)
+            results.append(make_result(kernel, size, size * size * 8, times,
+                flops, None))
+            print('{} n={}: {:.6f} s'.format(kernel, size, median(times)),
+                file=sys.stderr)
+        del funcs
+
+    for nbytes in (parse_size(i) for i in args.array_sizes.split(',') if i):
+        if not any(k in ARRAY_KERNELS for k in kernels):
+            break
+        funcs = array_kernels(numpy, nbytes)
+        for kernel in ARRAY_KERNELS:
+            if kernel not in kernels:
+                continue
+            func, flops, moved = funcs[kernel]
+            times = measure(func, args.repeats)
+            results.append(make_result(kernel, nbytes, nbytes, times,
+                flops, moved))
+            print('{} bytes={}: {:.6f} s'.format(kernel, nbytes,
+                median(times)), file=sys.stderr)
+        del funcs
+
+    print(json.dumps({
+        'benchmark': 'numpy',
+        'numpy_version': numpy.__version__,
+        'scipy_version': scipy_version,
+        'threads': args.threads,
+        'repeats': args.repeats,
+        'results': results,
+    }, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+'''
+Run scripts/benchmark-fileio.py natively, under Graphene and under
+Graphene-SGX, on plain and on protected files, and collect the results in one
+JSON file.
+
+The files are created in ``fileio/plain`` or ``fileio/protected``, which are
+emptied before every run. Under SGX, the first are allowed files (passed
+through to the host unchanged) and the second protected files (encrypted and
+integrity-checked by Graphene); without SGX, both are plain chroot mounts, so
+the protected storage is only run under SGX. The summary table shows MB/s,
+IOPS and latency percentiles of every test, and the slowdown relative to
+native runs on plain files::
+
+    ./run-benchmark.py -m native -m graphene -m sgx -- --file-size 16M
+'''
+
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+SCRIPT = 'scripts/benchmark-fileio.py'
+MANIFEST = 'python.manifest'
+STORAGES = ('plain', 'protected')
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--python', metavar='PATH', default=sys.executable,
+    help='Python interpreter for native runs (default: %(default)s)')
+argparser.add_argument('--storage', metavar='NAME,...',
+    default=','.join(STORAGES),
+    help='comma-separated storages (default: %(default)s); protected files '
+        'are only run under SGX')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single run (default: 3600)')
+argparser.add_argument('bench_args', metavar='ARG', nargs='*',
+    help='arguments passed to {} (after --)'.format(SCRIPT))
+
+
+def run_once(args, mode, storage):
+    directory = os.path.join('fileio', storage)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    script_args = [SCRIPT, '--dir', directory, *args.bench_args]
+    argv, env = benchlib.command_for(mode, [args.python, *script_args],
+        MANIFEST, loader=args.loader)
+    print('running {} {}: {}'.format(mode, storage, ' '.join(argv)),
+        file=sys.stderr)
+    try:
+        returncode, stdout, stderr, elapsed = benchlib.run_capture(argv,
+            env=env, timeout=args.timeout)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('{} exited with returncode {}'.format(
+            ' '.join(argv), returncode))
+    result = benchlib.find_json_line(stdout)
+    result.update(mode=mode, storage=storage, wall_time=elapsed)
+    return result
+
+
+def summarize(runs):
+    native = {}
+    for run in runs:
+        if run['mode'] != 'native' or run['storage'] != 'plain':
+            continue
+        for item in run['results']:
+            native[item['test'], item['block_size']] = item
+
+    rows = []
+    for run in runs:
+        for item in run['results']:
+            ref = native.get((item['test'], item['block_size']))
+            row = dict(item, mode=run['mode'], storage=run['storage'])
+            if 'error' in item:
+                row['status'] = item['error']
+            elif ref is not None and 'error' not in ref and item['iops']:
+                row['slowdown'] = ref['iops'] / item['iops']
+            rows.append(row)
+    return rows
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    storages = args.storage.split(',')
+    for storage in storages:
+        if storage not in STORAGES:
+            argparser.error('unknown storage: {}'.format(storage))
+
+    runs = []
+    for mode in benchlib.get_modes(args):
+        for storage in storages:
+            if storage == 'protected' and mode != 'sgx':
+                print('skipping {} {}: protected files need SGX'.format(mode,
+                    storage), file=sys.stderr)
+                continue
+            runs.append(run_once(args, mode, storage))
+
+    rows = summarize(runs)
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('storage', 'storage'),
+        ('test', 'test'),
+        ('block_size', 'block'),
+        ('mb_per_sec', 'MB/s', '.1f'),
+        ('iops', 'IOPS', '.0f'),
+        ('lat_p50_us', 'p50 [us]', '.1f'),
+        ('lat_p99_us', 'p99 [us]', '.1f'),
+        ('lat_p99_9_us', 'p99.9 [us]', '.1f'),
+        ('slowdown', 'x native', '.2f'),
+        ('status', 'error'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'fileio',
+        'host': benchlib.host_info(),
+        'runs': runs,
+        'summary': rows,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
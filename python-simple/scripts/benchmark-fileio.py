@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+'''
+File I/O benchmark, run natively or under Graphene with python.manifest.
+
+All files are created below ``--dir``: under Graphene-SGX, ``fileio/plain``
+is an allowed (pass-through) directory and ``fileio/protected`` holds
+protected files, which are encrypted and integrity-checked by Graphene. The
+tests are
+
+* ``seq-write``, ``seq-read``: a file of ``--file-size`` written and read
+  sequentially, in blocks of every ``--block-sizes``; the write includes the
+  final ``fsync()``,
+* ``rand-read``, ``rand-write``: ``--ops`` reads and writes of single blocks
+  at random aligned offsets of that file,
+* ``fsync``: ``--ops`` appends of a block, each followed by ``fsync()``,
+* ``mmap-read``: the file mapped and read block by block,
+* ``create``, ``stat``, ``unlink``: ``--files`` small files of
+  ``--small-size`` written, stat'ed and removed one by one,
+* ``listdir``: a directory with ``--dir-entries`` files listed ``--repeats``
+  times.
+
+Reads are served from the page cache (the file has just been written), so
+they measure the file system path rather than the disk. Every operation is
+timed; the result, with MB/s, IOPS and latency percentiles, is printed as a
+single JSON line, so that it can be collected by ../run-benchmark.py.
+
+Only modules which are trusted files of python.manifest are imported.
+'''
+
+import argparse
+import json
+import mmap
+import os
+import random
+import shutil
+import sys
+import time
+
+DEFAULT_BLOCK_SIZES = '4K,64K,1M'
+BLOCK_TESTS = ('seq-write', 'seq-read', 'rand-read', 'rand-write', 'fsync',
+    'mmap-read')
+FILE_TESTS = ('create', 'stat', 'unlink', 'listdir')
+TESTS = BLOCK_TESTS + FILE_TESTS
+PERCENTILES = (50, 90, 99, 99.9)
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('--dir', '-d', metavar='DIRECTORY', required=True,
+    help='directory for the test files (must exist)')
+argparser.add_argument('--test', '-t', metavar='NAME', action='append',
+    choices=TESTS,
+    help='run only this test; may be given multiple times')
+argparser.add_argument('--block-sizes', '-b', metavar='SIZE,...',
+    default=DEFAULT_BLOCK_SIZES,
+    help='block sizes, K/M suffixes allowed (default: {})'.format(
+        DEFAULT_BLOCK_SIZES))
+argparser.add_argument('--file-size', '-s', metavar='SIZE', default='64M',
+    help='size of the file of the block tests (default: %(default)s)')
+argparser.add_argument('--ops', '-n', metavar='N', type=int, default=2000,
+    help='operations of the random and fsync tests (default: %(default)s)')
+argparser.add_argument('--files', metavar='N', type=int, default=1000,
+    help='files of the create, stat and unlink tests (default: '
+        '%(default)s)')
+argparser.add_argument('--small-size', metavar='SIZE', default='4K',
+    help='size of these files (default: %(default)s)')
+argparser.add_argument('--dir-entries', metavar='N', type=int, default=10000,
+    help='files in the directory of the listdir test (default: '
+        '%(default)s)')
+argparser.add_argument('--repeats', '-r', metavar='N', type=int, default=20,
+    help='listings of the listdir test (default: %(default)s)')
+argparser.add_argument('--seed', metavar='N', type=int, default=0,
+    help='seed of the random offsets (default: %(default)s)')
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def percentile(values, pct):
+    '''Nearest-rank percentile of sorted *values*.'''
+    index = max(0, min(len(values) - 1,
+        int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def make_result(test, block_size, nbytes, latencies, elapsed):
+    '''Return the result of a test with *nbytes* transferred in
+    ``len(latencies)`` operations, which took *elapsed* seconds in total.'''
+    latencies = sorted(latencies)
+    result = {
+        'test': test,
+        'block_size': block_size,
+        'bytes': nbytes,
+        'ops': len(latencies),
+        'seconds': elapsed,
+        'mb_per_sec': nbytes / elapsed / 1e6 if nbytes and elapsed else None,
+        'iops': len(latencies) / elapsed if elapsed else None,
+    }
+    for pct in PERCENTILES:
+        result['lat_p{}_us'.format(pct).replace('.', '_')] = (
+            percentile(latencies, pct) * 1e6 if latencies else None)
+    result['lat_max_us'] = latencies[-1] * 1e6 if latencies else None
+    return result
+
+
+def write_file(path, size, block):
+    '''Write *size* bytes sequentially in blocks; return the latencies and
+    the elapsed time, including the final fsync().'''
+    latencies = []
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        start = time.perf_counter()
+        for _ in range(size // len(block)):
+            before = time.perf_counter()
+            os.write(fd, block)
+            latencies.append(time.perf_counter() - before)
+        os.fsync(fd)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return latencies, elapsed
+
+
+def read_file(path, block_size):
+    latencies = []
+    nbytes = 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        start = time.perf_counter()
+        while True:
+            before = time.perf_counter()
+            data = os.read(fd, block_size)
+            latencies.append(time.perf_counter() - before)
+            if not data:
+                break
+            nbytes += len(data)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return nbytes, latencies[:-1], elapsed
+
+
+def random_io(path, size, block, ops, rng, write):
+    '''Read or write single blocks at *ops* random aligned offsets.'''
+    latencies = []
+    offsets = [rng.randrange(size // len(block)) * len(block)
+        for _ in range(ops)]
+    fd = os.open(path, os.O_RDWR if write else os.O_RDONLY)
+    try:
+        start = time.perf_counter()
+        for offset in offsets:
+            before = time.perf_counter()
+            if write:
+                os.pwrite(fd, block, offset)
+            else:
+                os.pread(fd, len(block), offset)
+            latencies.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return latencies, elapsed
+
+
+def fsync_appends(path, block, ops):
+    latencies = []
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        start = time.perf_counter()
+        for _ in range(ops):
+            before = time.perf_counter()
+            os.write(fd, block)
+            os.fsync(fd)
+            latencies.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return latencies, elapsed
+
+
+def mmap_read(path, block_size):
+    latencies = []
+    with open(path, 'rb') as file:
+        start = time.perf_counter()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            for offset in range(0, len(mapping), block_size):
+                before = time.perf_counter()
+                # slicing copies the block, which touches every page of it
+                _ = mapping[offset:offset + block_size]
+                latencies.append(time.perf_counter() - before)
+            nbytes = len(mapping)
+        elapsed = time.perf_counter() - start
+    return nbytes, latencies, elapsed
+
+
+def block_tests(args, tests, block_size, rng):
+    results = []
+    size = max(block_size, args.file_size // block_size * block_size)
+    block = os.urandom(block_size)
+    path = os.path.join(args.dir, 'fileio-{}.dat'.format(block_size))
+
+    def run(test, func):
+        try:
+            result = func()
+        except OSError as e:
+            result = {'test': test, 'block_size': block_size,
+                'error': str(e)}
+        if test in tests:
+            results.append(result)
+            print('{} bs={}: {}'.format(test, block_size,
+                '{:.1f} MB/s, {:.0f} IOPS'.format(result['mb_per_sec'],
+                    result['iops']) if 'error' not in result
+                else result['error']), file=sys.stderr)
+        return 'error' not in result
+
+    # all tests but fsync need the file, so it is always written
+    if run('seq-write', lambda: make_result('seq-write', block_size, size,
+            *write_file(path, size, block))):
+        if 'seq-read' in tests:
+            run('seq-read', lambda: make_result('seq-read', block_size,
+                *read_file(path, block_size)))
+        for test, write in (('rand-read', False), ('rand-write', True)):
+            if test in tests:
+                run(test, lambda write=write, test=test: make_result(test,
+                    block_size, args.ops * block_size,
+                    *random_io(path, size, block, args.ops, rng, write)))
+        if 'mmap-read' in tests:
+            run('mmap-read', lambda: make_result('mmap-read', block_size,
+                *mmap_read(path, block_size)))
+    if 'fsync' in tests:
+        run('fsync', lambda: make_result('fsync', block_size,
+            args.ops * block_size, *fsync_appends(path, block, args.ops)))
+    if os.path.exists(path):
+        os.unlink(path)
+    return results
+
+
+def timed(func, items):
+    '''Call *func* on every item; return the latencies and the elapsed
+    time.'''
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        before = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - before)
+    return latencies, time.perf_counter() - start
+
+
+def create_file(path, data):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def file_tests(args, tests):
+    results = []
+    small_size = parse_size(args.small_size)
+    data = os.urandom(small_size)
+    directory = os.path.join(args.dir, 'fileio-files')
+
+    def run(test, func):
+        try:
+            result = func()
+        except OSError as e:
+            result = {'test': test, 'block_size': None, 'error': str(e)}
+        if test in tests:
+            results.append(result)
+            print('{}: {}'.format(test, '{:.0f} ops/s'.format(result['iops'])
+                if 'error' not in result else result['error']),
+                file=sys.stderr)
+        return 'error' not in result
+
+    if any(test in tests for test in ('create', 'stat', 'unlink')):
+        os.mkdir(directory)
+        paths = [os.path.join(directory, 'f{:06d}'.format(i))
+            for i in range(args.files)]
+        if run('create', lambda: make_result('create', small_size,
+                len(paths) * small_size,
+                *timed(lambda path: create_file(path, data), paths))):
+            run('stat', lambda: make_result('stat', None, 0,
+                *timed(os.stat, paths)))
+            run('unlink', lambda: make_result('unlink', None, 0,
+                *timed(os.unlink, paths)))
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def listdir_test():
+        os.mkdir(directory)
+        for i in range(args.dir_entries):
+            create_file(os.path.join(directory, 'e{:06d}'.format(i)), b'')
+
+        def listdir(_):
+            if len(os.listdir(directory)) != args.dir_entries:
+                raise OSError('listdir returned a wrong number of entries')
+        result = make_result('listdir', None, 0,
+            *timed(listdir, range(args.repeats)))
+        # the latencies are per listing, the IOPS per entry
+        result['entries'] = args.dir_entries
+        result['iops'] = args.dir_entries * args.repeats / result['seconds']
+        return result
+
+    if 'listdir' in tests:
+        try:
+            run('listdir', listdir_test)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    args.file_size = parse_size(args.file_size)
+    tests = args.test or TESTS
+    rng = random.Random(args.seed)
+
+    results = []
+    if any(test in tests for test in BLOCK_TESTS):
+        for block_size in (parse_size(i) for i in args.block_sizes.split(',')
+                if i):
+            results.extend(block_tests(args, tests, block_size, rng))
+    if any(test in tests for test in FILE_TESTS):
+        results.extend(file_tests(args, tests))
+
+    print(json.dumps({
+        'benchmark': 'fileio',
+        'dir': args.dir,
+        'file_size': args.file_size,
+        'results': results,
+    }, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
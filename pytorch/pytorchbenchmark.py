@@ -0,0 +1,190 @@
+# PyTorch inference benchmark.
+#
+# Loads a TorchScript model from a local file (see pytorchexport.py), then
+# classifies a set of images for every combination of batch size and
+# torch.set_num_threads() value. Images are decoded and transformed by a pool
+# of worker threads, so that the next batch is prepared while the current one
+# is being classified.
+#
+# Reported are the model load time, the latency of the first inference, the
+# steady-state throughput (images/s) and per-batch latency percentiles. The
+# result is printed as a single JSON line, so that it can be collected by
+# run-benchmark.py; progress goes to stderr.
+#
+# Run the benchmark with:
+#
+#   ./pal_loader pytorch.manifest pytorchbenchmark.py --batch-sizes 1,8,32
+
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import torch
+from PIL import Image
+from torchvision import transforms
+
+argparser = argparse.ArgumentParser()
+argparser.add_argument('--model', metavar='FILENAME', default='alexnet.pt',
+    help='TorchScript model (default: %(default)s)')
+argparser.add_argument('--images', metavar='PATH', default='input.jpg',
+    help='image file or directory of images (default: %(default)s)')
+argparser.add_argument('--num-images', '-n', metavar='N', type=int,
+    default=256,
+    help='images classified per configuration; the input images are used '
+        'repeatedly if there are fewer (default: %(default)s)')
+argparser.add_argument('--batch-sizes', '-b', metavar='N,...', default='1,8,32',
+    help='comma-separated batch sizes (default: %(default)s)')
+argparser.add_argument('--threads', '-t', metavar='N,...', default='1',
+    help='comma-separated torch.set_num_threads() values '
+        '(default: %(default)s)')
+argparser.add_argument('--decode-workers', metavar='N', type=int, default=2,
+    help='threads decoding and transforming images (default: %(default)s)')
+argparser.add_argument('--warmup', metavar='N', type=int, default=2,
+    help='batches excluded from steady-state measurement '
+        '(default: %(default)s)')
+argparser.add_argument('--classes', metavar='FILENAME', default='classes.txt',
+    help='class names, loaded once to report the top prediction '
+        '(default: %(default)s)')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+transform = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(
+        mean=[0.485, 0.456, 0.406],
+        std=[0.229, 0.224, 0.225]),
+])
+
+
+def list_images(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+        if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_image(path):
+    with Image.open(path) as img:
+        return transform(img.convert('RGB'))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def batches(pool, paths, num_images, batch_size, prefetch=2):
+    '''Yield batches of transformed images.
+
+    Decoding of up to *prefetch* batches ahead is submitted to *pool*, so it
+    overlaps with inference on the current batch.
+    '''
+    def submit(start):
+        count = min(batch_size, num_images - start)
+        return [pool.submit(load_image, paths[(start + i) % len(paths)])
+            for i in range(count)]
+
+    pending = collections.deque()
+    next_start = 0
+    while pending or next_start < num_images:
+        while len(pending) < prefetch and next_start < num_images:
+            pending.append(submit(next_start))
+            next_start += batch_size
+        futures = pending.popleft()
+        yield torch.stack([future.result() for future in futures])
+
+
+def run_config(model, pool, paths, args, batch_size, threads):
+    torch.set_num_threads(threads)
+    latencies = []
+    images_done = 0
+    steady_images = 0
+    steady_time = 0.0
+
+    with torch.no_grad():
+        for i, batch in enumerate(batches(pool, paths, args.num_images,
+                batch_size)):
+            start = time.perf_counter()
+            model(batch)
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            images_done += len(batch)
+            if i >= args.warmup:
+                steady_images += len(batch)
+                steady_time += elapsed
+
+    steady = latencies[args.warmup:] or latencies
+    result = {
+        'batch_size': batch_size,
+        'threads': threads,
+        # not set by this benchmark, but reported to compare with other runs
+        'inter_op_threads': (torch.get_num_interop_threads()
+            if hasattr(torch, 'get_num_interop_threads') else None),
+        'images': images_done,
+        'batches': len(latencies),
+        'latency_p50': percentile(steady, 50),
+        'latency_p90': percentile(steady, 90),
+        'latency_p99': percentile(steady, 99),
+        'latency_max': max(steady),
+        'images_per_sec': (steady_images / steady_time if steady_time
+            else images_done / sum(latencies)),
+    }
+    print('batch_size={} threads={}: {:.2f} images/s, p50={:.4f} s'.format(
+        batch_size, threads, result['images_per_sec'], result['latency_p50']),
+        file=sys.stderr)
+    return result
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    batch_sizes = [int(i) for i in args.batch_sizes.split(',') if i]
+    threads_list = [int(i) for i in args.threads.split(',') if i]
+
+    paths = list_images(args.images)
+    if not paths:
+        print('no images found in ' + args.images, file=sys.stderr)
+        return 1
+
+    with open(args.classes) as file:
+        classes = [line.strip() for line in file]
+
+    start = time.perf_counter()
+    model = torch.jit.load(args.model)
+    model.eval()
+    load_time = time.perf_counter() - start
+
+    with concurrent.futures.ThreadPoolExecutor(args.decode_workers) as pool:
+        first_input = torch.unsqueeze(load_image(paths[0]), 0)
+        start = time.perf_counter()
+        with torch.no_grad():
+            out = model(first_input)
+        first_inference = time.perf_counter() - start
+
+        results = [run_config(model, pool, paths, args, batch_size, threads)
+            for threads in threads_list for batch_size in batch_sizes]
+
+    top = int(torch.argmax(out, dim=1)[0])
+    print(json.dumps({
+        'benchmark': 'pytorch',
+        'model': args.model,
+        'torch_version': torch.__version__,
+        'model_load_time': load_time,
+        'first_inference_latency': first_inference,
+        'top_class': classes[top] if top < len(classes) else str(top),
+        'input_images': len(paths),
+        'results': results,
+    }, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+# Serialize the pre-trained AlexNet model as TorchScript, so that the benchmark
+# (pytorchbenchmark.py) can load it from a local file without torchvision model
+# code and without network access.
+#
+# Run this once natively, after downloading the pre-trained model (see README):
+#
+#   python3 pytorchexport.py [alexnet.pt]
+
+import sys
+
+import torch
+from torchvision import models
+
+output = sys.argv[1] if len(sys.argv) > 1 else 'alexnet.pt'
+
+# Uses the checkpoint cached in $HOME/.cache/torch (downloads it if missing).
+alexnet = models.alexnet(pretrained=True)
+alexnet.eval()
+
+# Tracing records the operations for a fixed input shape, but the batch
+# dimension stays dynamic for AlexNet, which has no data-dependent control flow.
+with torch.no_grad():
+    traced = torch.jit.trace(alexnet, torch.rand(1, 3, 224, 224))
+traced.save(output)
+
+print('Saved TorchScript model to ' + output)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+'''
+Run pytorchbenchmark.py natively, under Graphene and under Graphene-SGX and
+compare model load time, first-inference latency, throughput and per-batch
+latency. All results are written to one JSON file.
+'''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+SCRIPT = 'pytorchbenchmark.py'
+MANIFEST = 'pytorch.manifest'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--python', metavar='PATH', default='python3',
+    help='Python interpreter for native runs (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single run (default: 3600)')
+argparser.add_argument('bench_args', metavar='ARG', nargs='*',
+    help='arguments passed to {} (after --)'.format(SCRIPT))
+
+
+def run_once(args, mode):
+    argv, env = benchlib.command_for(mode,
+        [args.python, SCRIPT, *args.bench_args], MANIFEST, loader=args.loader)
+    print('running {}: {}'.format(mode, ' '.join(argv)), file=sys.stderr)
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        timeout=args.timeout)
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('{} exited with returncode {}'.format(
+            ' '.join(argv), returncode))
+    result = benchlib.find_json_line(stdout)
+    result.setdefault('framework', 'pytorch')
+    result.update(mode=mode, wall_time=elapsed)
+    # the TorchScript model is exported beforehand, not converted by this
+    # driver, so model_cache and model_conversion_time stay None
+    return benchlib.complete_inference_run(result)
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    runs = [run_once(args, mode) for mode in benchlib.get_modes(args)]
+
+    benchlib.print_inference_results(runs)
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'pytorch',
+        'host': benchlib.host_info(),
+        'runs': runs,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
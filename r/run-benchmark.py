@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+'''
+Run scripts/R-benchmark-25.R and scripts/sample.r natively, under Graphene and
+under Graphene-SGX, parse the per-test timings of R-benchmark-25 and write them
+as JSON, together with a per-test overhead ratio table relative to native.
+
+R-benchmark-25 prints one line per test with the mean time of its runs, and a
+trimmed geometric mean per section:
+
+- I. Matrix calculation
+- II. Matrix functions
+- III. Programmation
+
+The number of BLAS threads is set via the usual environment variables, which
+Graphene passes to the application; note that under SGX, ``sgx.thread_num``
+in R.manifest.template limits the number of threads.
+'''
+
+import argparse
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+MANIFEST = 'R.manifest'
+BENCHMARK_SCRIPT = 'scripts/R-benchmark-25.R'
+SAMPLE_SCRIPT = 'scripts/sample.r'
+
+BLAS_THREAD_VARIABLES = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+)
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--r', metavar='PATH', default='R',
+    help='R executable for native runs (default: %(default)s)')
+argparser.add_argument('--threads', '-t', metavar='N,...',
+    help='comma-separated BLAS thread counts to sweep (default: do not set)')
+argparser.add_argument('--repeats', '-r', metavar='N', type=int, default=1,
+    help='runs of R-benchmark-25 per configuration; each run already '
+        'executes every test 3 times (default: %(default)s)')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=7200, help='timeout for a single run (default: %(default)s)')
+
+SECTION_RE = re.compile(r'^\s*(I|II|III)\. (.+?)\s*$')
+TEST_RE = re.compile(r'^\s*(.+?)_*\s*\(sec\):\s+([\d.eE+-]+)')
+TRIMMED_RE = re.compile(r'Trimmed geom\. mean .*:\s+([\d.eE+-]+)')
+
+
+def parse_benchmark_output(output):
+    '''Parse the output of R-benchmark-25.R.
+
+    Returns:
+        dict: ``{'sections': [{'name', 'tests': [{'name', 'time'}],
+        'trimmed_mean'}], 'total': float, 'overall_mean': float}``
+    '''
+    result = {'sections': [], 'total': None, 'overall_mean': None}
+    section = None
+    for line in output.splitlines():
+        match = SECTION_RE.match(line)
+        if match:
+            section = {'name': match.group(2), 'tests': [],
+                'trimmed_mean': None}
+            result['sections'].append(section)
+            continue
+        match = TRIMMED_RE.search(line)
+        if match:
+            if section is not None:
+                section['trimmed_mean'] = float(match.group(1))
+            continue
+        match = TEST_RE.match(line)
+        if not match:
+            continue
+        name, value = match.group(1).strip(), float(match.group(2))
+        if name.startswith('Total time'):
+            result['total'] = value
+        elif name.startswith('Overall mean'):
+            result['overall_mean'] = value
+        elif section is not None:
+            section['tests'].append({'name': name, 'time': value})
+    return result
+
+
+def run_r(args, mode, script, threads):
+    r_args = ['--slave', '--vanilla', '-f', script]
+    argv, env = benchlib.command_for(mode, [args.r, *r_args], MANIFEST,
+        loader=args.loader)
+    if threads is not None:
+        for name in BLAS_THREAD_VARIABLES:
+            env[name] = str(threads)
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        timeout=args.timeout)
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('{} exited with returncode {}'.format(
+            ' '.join(argv), returncode))
+    return stdout, elapsed
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    threads_list = (benchlib.parse_list(args.threads) if args.threads
+        else [None])
+
+    runs = []
+    for threads in threads_list:
+        for mode in benchlib.get_modes(args):
+            _, sample_time = run_r(args, mode, SAMPLE_SCRIPT, threads)
+            for repeat in range(args.repeats):
+                print('{} threads={} run {}'.format(mode, threads, repeat + 1),
+                    file=sys.stderr)
+                stdout, elapsed = run_r(args, mode, BENCHMARK_SCRIPT, threads)
+                run = parse_benchmark_output(stdout)
+                run.update(mode=mode, threads=threads, repeat=repeat,
+                    wall_time=elapsed, sample_time=sample_time)
+                runs.append(run)
+
+    # average repeats, then compare every test with native
+    times = {}
+    for run in runs:
+        key = (run['mode'], run['threads'])
+        for section in run['sections']:
+            for test in section['tests']:
+                times.setdefault(key, {}).setdefault(
+                    (section['name'], test['name']), []).append(test['time'])
+            times.setdefault(key, {}).setdefault(
+                (section['name'], 'trimmed geom. mean'), []).append(
+                section['trimmed_mean'])
+
+    rows = []
+    for (mode, threads), tests in times.items():
+        native = times.get(('native', threads), {})
+        for (section, name), values in tests.items():
+            values = [value for value in values if value is not None]
+            if not values:
+                continue
+            mean = sum(values) / len(values)
+            row = {'mode': mode, 'threads': threads, 'section': section,
+                'test': name, 'time': mean}
+            ref = [value for value in native.get((section, name), [])
+                if value is not None]
+            if ref and sum(ref):
+                row['overhead'] = mean / (sum(ref) / len(ref))
+            rows.append(row)
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('threads', 'threads'),
+        ('section', 'section'),
+        ('test', 'test'),
+        ('time', 'time [s]', '.3f'),
+        ('overhead', 'x native', '.2f'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'R-benchmark-25',
+        'host': benchlib.host_info(),
+        'runs': runs,
+        'summary': rows,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+'''
+Benchmark Redis natively, under Graphene and under Graphene-SGX.
+
+For every mode and persistence configuration, the driver starts redis-server,
+waits until it accepts connections, runs redis-benchmark for every combination
+of client count, pipeline depth and value size, and stops the server. The
+output of redis-benchmark is parsed into throughput and latency percentiles and
+all results are written to one JSON file (and optionally a CSV file).
+
+Persistence configurations:
+
+- ``none``: no RDB snapshots and no AOF (``--save ''``, as in README)
+- ``rdb``: RDB snapshot every second if anything changed (``--save '1 1'``)
+- ``aof``: append-only file, fsync every second
+- ``aof-always``: append-only file, fsync after every write
+'''
+
+import argparse
+import os
+import re
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+MANIFEST = 'redis-server'
+DATADIR = 'data'
+
+PERSISTENCE = {
+    'none': ['--save', '', '--appendonly', 'no'],
+    'rdb': ['--save', '1 1', '--appendonly', 'no'],
+    'aof': ['--save', '', '--appendonly', 'yes', '--appendfsync', 'everysec'],
+    'aof-always': ['--save', '', '--appendonly', 'yes',
+        '--appendfsync', 'always'],
+}
+
+CSV_COLUMNS = ['mode', 'persistence', 'clients', 'pipeline', 'data_size',
+    'test', 'requests', 'rps', 'avg', 'p50', 'p95', 'p99', 'max', 'slowdown']
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--server', metavar='PATH', default='./redis-server',
+    help='redis-server executable (default: %(default)s)')
+argparser.add_argument('--benchmark', metavar='PATH',
+    default='src/src/redis-benchmark',
+    help='redis-benchmark executable (default: %(default)s)')
+argparser.add_argument('--port', '-p', metavar='PORT', type=int, default=6379,
+    help='port; must be allowed by net.allow_bind in the manifest '
+        '(default: %(default)s)')
+argparser.add_argument('--clients', '-c', metavar='N,...', default='1,50',
+    help='comma-separated client counts (default: %(default)s)')
+argparser.add_argument('--pipeline', '-P', metavar='N,...', default='1,16',
+    help='comma-separated pipeline depths (default: %(default)s)')
+argparser.add_argument('--data-size', '-d', metavar='N,...', default='3,1024',
+    help='comma-separated value sizes in bytes (default: %(default)s)')
+argparser.add_argument('--tests', '-t', metavar='NAME,...',
+    default='set,get,incr,lpush,lpop',
+    help='redis-benchmark tests (default: %(default)s)')
+argparser.add_argument('--requests', '-n', metavar='N', type=int,
+    default=100000,
+    help='requests per test (default: %(default)s)')
+argparser.add_argument('--keyspace', '-r', metavar='N', type=int,
+    default=100000,
+    help='use random keys from a keyspace of this size (default: '
+        '%(default)s)')
+argparser.add_argument('--persistence', metavar='NAME', action='append',
+    choices=sorted(PERSISTENCE),
+    help='persistence configuration, one of {}; may be given multiple times '
+        '(default: none)'.format(', '.join(sorted(PERSISTENCE))))
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--csv', metavar='FILENAME',
+    help='also write the results as CSV')
+argparser.add_argument('--server-log', metavar='FILENAME',
+    help='append server output to this file')
+argparser.set_defaults(persistence=None)
+
+HEADER_RE = re.compile(r'^====== (.+) ======$')
+REQUESTS_RE = re.compile(r'^\s*(\d+) requests completed in ([\d.]+) seconds')
+# 5.x: "99.76% <= 1 milliseconds"
+# 6.x: "50.000% <= 0.287 milliseconds (cumulative count 50767)"
+DISTRIBUTION_RE = re.compile(r'^\s*([\d.]+)% <= ([\d.]+) milliseconds')
+RPS_RE = re.compile(r'([\d.]+) requests per second')
+SUMMARY_HEADER_RE = re.compile(r'^\s*avg\s+min\s+p50\s+p95\s+p99\s+max\s*$')
+
+
+def distribution_percentile(distribution, pct):
+    '''Return the latency (ms) below which *pct* % of requests completed.'''
+    for cumulative, latency in distribution:
+        if cumulative >= pct:
+            return latency
+    return distribution[-1][1] if distribution else None
+
+
+def parse_benchmark_output(output):
+    '''Parse the (non-quiet, non-CSV) output of redis-benchmark.
+
+    Returns:
+        list: one dict per test with ``test``, ``requests``, ``seconds``,
+        ``rps`` and latency statistics in milliseconds
+    '''
+    results = []
+    current = None
+    distribution = []
+    summary_header = False
+
+    def finish():
+        if current is None:
+            return
+        for pct in (50, 95, 99):
+            current.setdefault('p{}'.format(pct),
+                distribution_percentile(distribution, pct))
+        current.setdefault('max',
+            distribution[-1][1] if distribution else None)
+        results.append(current)
+
+    for line in output.replace('\r', '\n').splitlines():
+        match = HEADER_RE.match(line.strip())
+        if match:
+            finish()
+            current = {'test': match.group(1).split()[0].lower()}
+            distribution = []
+            summary_header = False
+            continue
+        if current is None:
+            continue
+
+        if summary_header:
+            values = [float(i) for i in line.split()]
+            current.update(zip(('avg', 'min', 'p50', 'p95', 'p99', 'max'),
+                values))
+            summary_header = False
+            continue
+        if SUMMARY_HEADER_RE.match(line):
+            summary_header = True
+            continue
+
+        match = REQUESTS_RE.match(line)
+        if match:
+            current['requests'] = int(match.group(1))
+            current['seconds'] = float(match.group(2))
+            continue
+        match = DISTRIBUTION_RE.match(line)
+        if match:
+            distribution.append((float(match.group(1)),
+                float(match.group(2))))
+            continue
+        match = RPS_RE.search(line)
+        if match:
+            current['rps'] = float(match.group(1))
+
+    finish()
+    return results
+
+
+def run_benchmark(args, clients, pipeline, data_size):
+    argv = [args.benchmark,
+        '-h', '127.0.0.1', '-p', str(args.port),
+        '-c', str(clients), '-P', str(pipeline), '-d', str(data_size),
+        '-n', str(args.requests), '-r', str(args.keyspace),
+        '-t', args.tests]
+    print('  ' + ' '.join(argv), file=sys.stderr)
+    returncode, stdout, stderr, _ = benchlib.run_capture(argv,
+        role='client')
+    if returncode != 0:
+        sys.stderr.write(stderr)
+        raise RuntimeError('redis-benchmark exited with returncode {}'.format(
+            returncode))
+    return parse_benchmark_output(stdout)
+
+
+def run_mode(args, mode, persistence):
+    if os.path.isdir(DATADIR):
+        shutil.rmtree(DATADIR)
+    os.makedirs(DATADIR)
+
+    server_args = ['--port', str(args.port), '--protected-mode', 'no',
+        '--dir', DATADIR, *PERSISTENCE[persistence]]
+    argv, env = benchlib.command_for(mode, [args.server, *server_args],
+        MANIFEST, loader=args.loader)
+    print('starting {} ({}): {}'.format(mode, persistence, ' '.join(argv)),
+        file=sys.stderr)
+
+    rows = []
+    with benchlib.Server(argv, env=env, port=args.port,
+            log=args.server_log) as server:
+        print('  ready after {:.2f} s'.format(server.ready_time),
+            file=sys.stderr)
+        for clients in benchlib.parse_list(args.clients):
+            for pipeline in benchlib.parse_list(args.pipeline):
+                for data_size in benchlib.parse_list(args.data_size):
+                    for result in run_benchmark(args, clients, pipeline,
+                            data_size):
+                        result.update(mode=mode, persistence=persistence,
+                            clients=clients, pipeline=pipeline,
+                            data_size=data_size)
+                        rows.append(result)
+    return server.ready_time, rows
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+
+    startup = []
+    rows = []
+    for persistence in args.persistence or ['none']:
+        for mode in benchlib.get_modes(args):
+            ready_time, mode_rows = run_mode(args, mode, persistence)
+            startup.append({'mode': mode, 'persistence': persistence,
+                'ready_time': ready_time})
+            rows.extend(mode_rows)
+
+    def key(row):
+        return (row['persistence'], row['clients'], row['pipeline'],
+            row['data_size'], row['test'])
+    native = {key(row): row for row in rows if row['mode'] == 'native'}
+    for row in rows:
+        ref = native.get(key(row))
+        if ref and row.get('rps'):
+            row['slowdown'] = ref['rps'] / row['rps']
+
+    benchlib.print_table(rows, [
+        ('mode', 'mode'),
+        ('persistence', 'persistence'),
+        ('clients', 'clients'),
+        ('pipeline', 'pipeline'),
+        ('data_size', 'size'),
+        ('test', 'test'),
+        ('rps', 'requests/s', '.0f'),
+        ('p50', 'p50 [ms]', '.3f'),
+        ('p99', 'p99 [ms]', '.3f'),
+        ('slowdown', 'x native', '.2f'),
+    ])
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'redis',
+        'host': benchlib.host_info(),
+        'startup': startup,
+        'results': rows,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    if args.csv:
+        benchlib.write_csv(args.csv, rows, CSV_COLUMNS)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+'''
+Inference benchmark for TensorFlow Lite's label_image, natively, under
+Graphene and under Graphene-SGX.
+
+For every mode, a probe run with a single invocation measures the model load
+time (wall time of the run minus the inference, so it includes process and
+enclave startup) and the latency of the first inference. Then label_image is
+run with ``-c COUNT`` invocations for every image and thread count
+(``-t``, the TF Lite interpreter threads), and the steady-state latency is
+taken from its "average time" output. label_image does not print the latency
+of single invocations, so only percentiles over these per-run averages are
+reported (``run_latency_*``; ``latency_*`` are None), and the throughput is
+the number of invocations divided by their total time.
+
+label_image classifies one image per invocation, so the batch size is always
+1, and TF Lite has no inter-op thread pool. The results use the same schema as
+the pytorch and openvino drivers (see ``benchlib.print_inference_results``).
+
+A frozen TensorFlow graph (``--model model.pb``) is converted to TF Lite with
+toco (``make toco``) once and kept in model_cache/, keyed by the contents of
+the graph and the converter options, so that repeated runs skip the
+conversion.
+'''
+
+import argparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'common_tools'))
+import benchlib  # pylint: disable=wrong-import-position
+
+MANIFEST = 'label_image.manifest'
+CACHE_DIR = 'model_cache'
+TOCO = 'tensorflow/bazel-bin/tensorflow/contrib/lite/toco/toco'
+
+argparser = argparse.ArgumentParser()
+benchlib.add_mode_arguments(argparser)
+argparser.add_argument('--model', '-M', metavar='FILENAME',
+    default='inception_v3.tflite',
+    help='TF Lite model, or a frozen graph (.pb) converted with toco '
+        '(default: %(default)s)')
+argparser.add_argument('--labels', metavar='FILENAME', default='labels.txt',
+    help='labels file (default: %(default)s)')
+argparser.add_argument('--images', '-i', metavar='PATH', default='image.bmp',
+    help='BMP image or directory of BMP images; must be in sgx.allowed_files '
+        '(default: %(default)s)')
+argparser.add_argument('--threads', '-t', metavar='N,...', default='1',
+    help='comma-separated interpreter thread counts; at most '
+        '(sgx.thread_num - 2) under SGX (default: %(default)s)')
+argparser.add_argument('--count', '-c', metavar='N', type=int, default=20,
+    help='invocations per run (default: %(default)s)')
+argparser.add_argument('--repeats', '-r', metavar='N', type=int, default=3,
+    help='runs per image and thread count (default: %(default)s)')
+argparser.add_argument('--toco', metavar='PATH', default=TOCO,
+    help='toco executable (default: %(default)s)')
+argparser.add_argument('--toco-args', metavar='ARGS', default='',
+    help='extra toco arguments, given as --toco-args="--input_arrays=input '
+        '--output_arrays=output --input_shapes=1,299,299,3"')
+argparser.add_argument('--output', '-O', metavar='FILENAME',
+    help='JSON result file (default: result-<date>.json)')
+argparser.add_argument('--timeout', metavar='SECONDS', type=float,
+    default=3600, help='timeout for a single run (default: 3600)')
+
+# label_image logs, among others:
+#   average time: 183.502 ms
+#   0.860174: 653 military uniform
+AVERAGE_RE = re.compile(r'average time: ([\d.]+) ms')
+LABEL_RE = re.compile(r'^([\d.]+): (\d+) (.*)$')
+
+
+def prepare_model(args):
+    '''Return ``(path, cache_status, conversion_time)`` of the TF Lite model.
+
+    *cache_status* is None for a model that needs no conversion.
+    '''
+    if not args.model.endswith('.pb'):
+        return args.model, None, None
+    if not os.path.exists(args.toco):
+        raise RuntimeError('{} not found, run "make toco" first'.format(
+            args.toco))
+    toco_args = shlex.split(args.toco_args)
+
+    def convert(directory):
+        subprocess.run([args.toco, '--input_file=' + args.model,
+            '--output_file=' + os.path.join(directory, 'model.tflite'),
+            '--input_format=TENSORFLOW_GRAPHDEF', '--output_format=TFLITE',
+            *toco_args], check=True)
+
+    directory, hit, build_time = benchlib.cached_build(CACHE_DIR,
+        [args.model], [args.toco, *toco_args], convert)
+    return (os.path.join(directory, 'model.tflite'), 'hit' if hit else 'miss',
+        build_time)
+
+
+def list_images(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+        if name.lower().endswith('.bmp'))
+
+
+def label_image(args, mode, model, image, threads, count):
+    '''Run label_image and return ``(average_time, top_label, wall_time)``.'''
+    # pylint: disable=too-many-arguments
+    native_argv = ['./label_image', '-m', model, '-l', args.labels,
+        '-i', image, '-t', str(threads), '-c', str(count)]
+    argv, env = benchlib.command_for(mode, native_argv, MANIFEST,
+        loader=args.loader)
+    returncode, stdout, stderr, elapsed = benchlib.run_capture(argv, env=env,
+        timeout=args.timeout)
+    output = stdout + stderr
+    match = AVERAGE_RE.search(output)
+    if returncode != 0 or not match:
+        sys.stderr.write(output)
+        raise RuntimeError('{} failed with returncode {}'.format(
+            ' '.join(argv), returncode))
+    top = None
+    for line in output.splitlines():
+        label = LABEL_RE.match(line.strip())
+        if label:
+            top = label.group(3)
+            break
+    return float(match.group(1)) / 1e3, top, elapsed
+
+
+def run_mode(args, mode, model, images):
+    threads_list = benchlib.parse_list(args.threads)
+    first, top, wall = label_image(args, mode, model, images[0],
+        threads_list[0], 1)
+    run = {
+        'mode': mode,
+        'framework': 'tflite',
+        'model': args.model,
+        'model_load_time': wall - first,
+        'first_inference_latency': first,
+        'top_class': top,
+        'input_images': len(images),
+        'wall_time': wall,
+        'results': [],
+    }
+
+    for threads in threads_list:
+        latencies = []
+        for _ in range(args.repeats):
+            for image in images:
+                latency, _, wall = label_image(args, mode, model, image,
+                    threads, args.count)
+                latencies.append(latency)
+                run['wall_time'] += wall
+        stats = benchlib.summarize(latencies)
+        images_count = len(latencies) * args.count
+        images_per_sec = images_count / (sum(latencies) * args.count)
+        run['results'].append({
+            'batch_size': 1,
+            'threads': threads,
+            'inter_op_threads': None,
+            'images': images_count,
+            'images_per_sec': images_per_sec,
+            'run_latency_p50': stats['p50'],
+            'run_latency_p90': stats['p90'],
+            'run_latency_p99': stats['p99'],
+            'run_latency_max': stats['max'],
+        })
+        print('{} threads={}: {:.2f} images/s'.format(mode, threads,
+            images_per_sec), file=sys.stderr)
+    return benchlib.complete_inference_run(run)
+
+
+def main(args=None):
+    args = argparser.parse_args(args)
+    images = list_images(args.images)
+    if not images:
+        print('no images found in ' + args.images, file=sys.stderr)
+        return 1
+
+    model, cache, conversion_time = prepare_model(args)
+    runs = []
+    for mode in benchlib.get_modes(args):
+        run = run_mode(args, mode, model, images)
+        run.update(model_cache=cache, model_conversion_time=conversion_time)
+        runs.append(run)
+
+    benchlib.print_inference_results(runs)
+
+    output = args.output or benchlib.default_result_path()
+    benchlib.write_json(output, {
+        'benchmark': 'tensorflow',
+        'host': benchlib.host_info(),
+        'count': args.count,
+        'runs': runs,
+    })
+    print('Result file: {}'.format(output), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())